@@ -0,0 +1,87 @@
+"""
+Size and speed of the local message archive (ARCHIVE=true).
+
+Archives a synthetic history page by page, as the fetch stage does, then reads it
+back page by page and reports bytes per message, write and read throughput, the
+time to open the archive, and the history requests a re-run no longer makes.
+
+    python benchmarks/archive_bench.py
+    python benchmarks/archive_bench.py --sizes 1000000 --page 100
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def _run(size: int, page: int, fetch_rate: float, workdir: Path) -> dict:
+    from archive import ChatArchive
+    from fake_telegram import SyntheticHistory
+
+    history = SyntheticHistory(1001, size)
+    path = workdir / 'archive'
+
+    archive = ChatArchive(path)
+    write = 0.0
+    for after_id in range(0, size, page):
+        messages = [history.message(message_id) for message_id in range(after_id + 1, min(size, after_id + page) + 1)]
+        started = time.perf_counter()
+        archive.append(after_id, messages)
+        write += time.perf_counter() - started
+    archive.close()
+    disk = sum(f.stat().st_size for f in path.iterdir())
+
+    started = time.perf_counter()
+    archive = ChatArchive(path)
+    load = time.perf_counter() - started
+
+    started = time.perf_counter()
+    read = 0
+    after_id = 0
+    while archive.covers(after_id):
+        messages, after_id = archive.read(after_id, page, None)
+        read += len(messages)
+    read_time = time.perf_counter() - started
+    archive.close()
+
+    pages = -(-size // page)
+    return {
+        'size': size,
+        'disk_mb': disk / 2**20,
+        'bytes_per_message': disk / size,
+        'write_per_second': size / write,
+        'load_ms': load * 1000,
+        'read_per_second': read / read_time,
+        'read_seconds': read_time,
+        'pages': pages,
+        'fetch_minutes': pages / fetch_rate,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--page', type=int, default=100, help='messages per page (FETCH_PAGE_SIZE)')
+    parser.add_argument('--fetch-rate', type=float, default=60, help='history requests per minute (FETCH_RATE_LIMIT)')
+    args = parser.parse_args()
+
+    here = Path(__file__).resolve().parent
+    sys.path[:0] = [str(here.parent / 'bot'), str(here)]
+
+    print(f"{'messages':>10} {'disk MB':>8} {'B/msg':>6} {'write msg/s':>12} {'open ms':>8} "
+          f"{'read msg/s':>11} {'read s':>7}  history requests saved per re-run")
+    for size in args.sizes:
+        workdir = Path(tempfile.mkdtemp())
+        try:
+            r = _run(size, args.page, args.fetch_rate, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"{r['size']:>10,} {r['disk_mb']:>8.1f} {r['bytes_per_message']:>6.1f} {r['write_per_second']:>12,.0f} "
+              f"{r['load_ms']:>8.1f} {r['read_per_second']:>11,.0f} {r['read_seconds']:>7.1f}  "
+              f"{r['pages']:,} (~{r['fetch_minutes']:,.0f} min at {args.fetch_rate:g}/min)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""
+Local stand-in for the parts of TelegramClient the bot uses.
+
+FakeTelegram is mixed in front of bot.main.Bot and answers iter_messages,
+get_messages, forward_messages, send_message, get_entity and get_dialogs from
+a synthetic history, with configurable latency and FloodWait/SlowMode errors.
+Latency is slept with asyncio.sleep, so it costs nothing when run on a
+clock.VirtualClock.
+"""
+import asyncio
+import random
+from collections import Counter, deque
+from typing import List, Optional
+
+from telethon import utils
+from telethon.errors import FloodWaitError, SlowModeWaitError
+from telethon.tl.types import (
+    Channel, ChatPhotoEmpty, MessageActionChatEditTitle, MessageService, PeerChannel,
+)
+
+# iter_messages requests history in chunks of this many messages
+HISTORY_CHUNK = 100
+BLOCK = 10  # Messages generated together; an album always starts a block
+RECENT_SENT = 1000  # Destination messages kept with their content (older ones are blank)
+
+
+class FakeChat:
+    __slots__ = ('id',)
+
+    def __init__(self, id: int):
+        self.id = id
+
+
+class FakeButton:
+    __slots__ = ('url',)
+
+    def __init__(self, url: Optional[str]):
+        self.url = url
+
+
+class FakePhoto:
+    __slots__ = ('id',)
+
+    def __init__(self, id: int):
+        self.id = id
+
+
+class FakeMessage:
+    __slots__ = ('id', 'grouped_id', 'media', 'text', 'noforwards', 'buttons', 'chat', 'out')
+
+    def __init__(self, id, chat, grouped_id=None, media=None, text='', noforwards=False, buttons=None):
+        self.id = id
+        self.chat = chat
+        self.grouped_id = grouped_id
+        self.media = media
+        self.text = text
+        self.noforwards = noforwards
+        self.buttons = buttons
+        self.out = False
+
+    @property
+    def message(self) -> str:
+        """Raw text, as in Telethon's Message.message"""
+        return self.text
+
+    @property
+    def photo(self) -> Optional[FakePhoto]:
+        return self.media if isinstance(self.media, FakePhoto) else None
+
+    @property
+    def document(self):
+        return None
+
+
+class SyntheticHistory:
+    """
+    Deterministic chat history of `size` messages, generated on demand so that
+    even a million-message history takes no memory of its own.
+    A share `repost_rate` of the single messages repeats the text (and photo) of one
+    of the previous 500 messages.
+    """
+
+    def __init__(self, chat_id: int, size: int, seed: int = 1, album_rate: float = 0.1,
+                 media_rate: float = 0.3, service_rate: float = 0.01, noforwards_rate: float = 0.01,
+                 button_rate: float = 0.05, repost_rate: float = 0.0):
+        self.chat = FakeChat(chat_id)
+        self.size = size
+        self.seed = seed
+        self.album_rate = album_rate
+        self.media_rate = media_rate
+        self.service_rate = service_rate
+        self.noforwards_rate = noforwards_rate
+        self.button_rate = button_rate
+        self.repost_rate = repost_rate
+        self._block_index = -1
+        self._block: List = []
+
+    def message(self, message_id: int):
+        block_index = (message_id - 1) // BLOCK
+        if block_index != self._block_index:
+            self._block = self._generate(block_index)
+            self._block_index = block_index
+        return self._block[(message_id - 1) % BLOCK]
+
+    def _generate(self, block_index: int) -> List:
+        rng = random.Random(self.seed * 1_000_003 + block_index)
+        first_id = block_index * BLOCK + 1
+        album_size = rng.randint(2, 6) if rng.random() < self.album_rate else 0
+        messages = []
+        for offset in range(BLOCK):
+            message_id = first_id + offset
+            if offset < album_size:
+                messages.append(FakeMessage(message_id, self.chat, grouped_id=first_id, media=FakePhoto(message_id),
+                                            text='album caption' if offset == 0 else ''))
+            elif rng.random() < self.service_rate:
+                messages.append(MessageService(id=message_id, peer_id=PeerChannel(self.chat.id), date=None,
+                                               action=MessageActionChatEditTitle('renamed')))
+            else:
+                content_id = message_id
+                if rng.random() < self.repost_rate:
+                    content_id = max(1, message_id - rng.randint(1, 500))
+                media = FakePhoto(content_id) if rng.random() < self.media_rate else None
+                buttons = None
+                if rng.random() < self.button_rate:
+                    buttons = [[FakeButton(f'https://example.com/{message_id}'), FakeButton(None)]]
+                messages.append(FakeMessage(message_id, self.chat, media=media,
+                                            text=f'message {content_id} of the synthetic history',
+                                            noforwards=rng.random() < self.noforwards_rate, buttons=buttons))
+        return messages
+
+
+class FakeTelegram:
+    """
+    Mixin overriding the client API used by the bot.
+    Set `origin` (a SyntheticHistory) and `destiny_id` before running.
+    """
+
+    latency = 0.05          # Seconds per API request
+    flood_rate = 0.0        # Probability that a send request raises FloodWaitError
+    flood_seconds = 30
+    slowmode_rate = 0.0     # Probability that a send request raises SlowModeWaitError
+    slowmode_seconds = 10
+
+    def setup_fake(self, origin: SyntheticHistory, destiny_id: int, seed: int = 1) -> None:
+        self.origin = origin
+        self.destiny_id = destiny_id
+        self.api_calls = Counter()
+        self.rng = random.Random(seed)
+        # Delivery log kept as counters so memory does not grow with the history
+        self.delivered = 0
+        self.last_delivered = Counter()  # Newest origin ID delivered, per destination
+        self.out_of_order = 0
+        self.sent_count = 0
+        self.recent_sent = deque(maxlen=RECENT_SENT)
+
+    async def _request(self, method: str) -> None:
+        self.api_calls[method] += 1
+        await asyncio.sleep(self.latency)
+
+    def _maybe_fail(self) -> None:
+        if self.rng.random() < self.flood_rate:
+            raise FloodWaitError(None, capture=self.flood_seconds)
+        if self.rng.random() < self.slowmode_rate:
+            raise SlowModeWaitError(None, capture=self.slowmode_seconds)
+
+    def _entity(self, chat_id: int) -> Channel:
+        channel_id, _ = utils.resolve_id(int(chat_id))
+        return Channel(id=channel_id, title=f'chat {chat_id}', photo=ChatPhotoEmpty(), date=None,
+                       access_hash=channel_id, noforwards=False)
+
+    async def get_dialogs(self, *args, **kwargs):
+        await self._request('get_dialogs')
+        return []
+
+    async def get_entity(self, chat):
+        await self._request('get_entity')
+        return self._entity(chat)
+
+    async def iter_messages(self, entity, limit=None, offset_id=0, reverse=False, min_id=0, max_id=0,
+                            offset_date=None, **kwargs):
+        if entity.id != self.origin.chat.id:
+            # The destination only holds what we sent
+            async for message in self._iter_destiny(limit, min_id):
+                yield message
+            return
+
+        if reverse:
+            first = max(offset_id, min_id) + 1
+            last = min(max_id - 1, self.origin.size) if max_id else self.origin.size
+            ids = range(first, last + 1)
+        else:
+            newest = min(offset_id - 1, self.origin.size) if offset_id else self.origin.size
+            if max_id:
+                newest = min(newest, max_id - 1)
+            ids = range(newest, min_id, -1)
+        if limit:
+            ids = ids[:limit]
+
+        for index, message_id in enumerate(ids):
+            if index % HISTORY_CHUNK == 0:
+                await self._request('get_history')
+            yield self.origin.message(message_id)
+
+    async def _iter_destiny(self, limit, min_id):
+        await self._request('get_history')
+        last = self.sent_count
+        if limit and min_id == 0:
+            ids = range(last, max(0, last - limit), -1)
+        else:
+            ids = range(min_id + 1, last + 1)[:limit]
+        oldest_recent = self.recent_sent[0].id if self.recent_sent else last + 1
+        for index, message_id in enumerate(ids):
+            if index and index % HISTORY_CHUNK == 0:
+                await self._request('get_history')
+            if message_id >= oldest_recent:
+                yield self.recent_sent[message_id - oldest_recent]
+                continue
+            sent = FakeMessage(message_id, FakeChat(self.destiny_id))
+            sent.out = True
+            yield sent
+
+    async def get_messages(self, entity, limit=None, **kwargs):
+        return [message async for message in self.iter_messages(entity, limit=limit, **kwargs)]
+
+    def _record_sent(self, text: str, media=None) -> FakeMessage:
+        self.sent_count += 1
+        sent = FakeMessage(self.sent_count, FakeChat(self.destiny_id), media=media, text=text)
+        sent.out = True
+        self.recent_sent.append(sent)
+        return sent
+
+    def post_foreign(self, text: str = '', media=None) -> FakeMessage:
+        """A message posted in the destination by another member"""
+        sent = self._record_sent(text, media)
+        sent.out = False
+        return sent
+
+    def _deliver(self, messages, entity=None) -> List[FakeMessage]:
+        destination = getattr(entity, 'id', entity)
+        sent = []
+        for message in messages:
+            if message.id < self.last_delivered[destination]:
+                self.out_of_order += 1
+            self.last_delivered[destination] = max(self.last_delivered[destination], message.id)
+            self.delivered += 1
+            sent.append(self._record_sent(message.text, message.media))
+        return sent
+
+    async def forward_messages(self, entity, messages, from_peer=None, **kwargs):
+        await self._request('forward_messages')
+        self._maybe_fail()
+        if isinstance(messages, list):
+            return self._deliver([self._source(message) for message in messages], entity)
+        return self._deliver([self._source(messages)], entity)[0]
+
+    def _source(self, message):
+        """Origin message forwarded by ID (from_peer is always the origin)"""
+        return self.origin.message(message) if isinstance(message, int) else message
+
+    async def send_message(self, entity, message, reply_to=None, **kwargs):
+        await self._request('send_message')
+        self._maybe_fail()
+        self.delivered += 1
+        return self._record_sent(message)
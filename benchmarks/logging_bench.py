@@ -0,0 +1,141 @@
+"""
+Logging cost per 10k forwarded messages.
+
+Replays the log calls made for each message (fetch, forward, safety counters,
+delay, progress) in three setups:
+
+- legacy: f-string INFO lines written synchronously, as before
+- current: lazy DEBUG lines + periodic summary, queue handler, LOG_LEVEL=INFO
+- current-debug: the same with LOG_LEVEL=DEBUG (every line still written, off-loop)
+
+"loop CPU" is CPU time of the calling (event loop) thread, "total CPU" includes the
+listener thread. "write syscalls" counts write(2) calls on the log file descriptor.
+
+    python benchmarks/logging_bench.py
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'bot'))
+
+from logging_setup import LOG_FORMAT, RunSummary, setup_logging, stop_logging  # noqa: E402
+
+MESSAGES = 10_000
+HOURLY_LIMIT, DAILY_LIMIT, MEDIA_LIMIT = 100, 1000, 500
+
+
+class CountingStream:
+    """Unbuffered stream over a file descriptor that counts write(2) calls"""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.writes = 0
+
+    def write(self, text: str) -> None:
+        os.write(self.fd, text.encode())
+        self.writes += 1
+
+    def flush(self) -> None:
+        pass
+
+
+def _legacy_message(logger, key: str, message_id: int):
+    logger.info(f"Fetched message ID: {message_id}")
+    logger.info(f"Forwarding message_id: {message_id}")
+    logger.info(f"Current counts: hourly={message_id % HOURLY_LIMIT}/{HOURLY_LIMIT}, "
+                f"daily={message_id % DAILY_LIMIT}/{DAILY_LIMIT}, media=0/{MEDIA_LIMIT}")
+    logger.info(f"Applying safety delay of {3.14159:.2f} seconds")
+    logger.info(f"Updated counters: hourly={message_id % HOURLY_LIMIT}/{HOURLY_LIMIT}, "
+                f"daily={message_id % DAILY_LIMIT}/{DAILY_LIMIT}")
+    logger.info(f"Saved activity counters: hourly={message_id % HOURLY_LIMIT}, daily={message_id % DAILY_LIMIT}")
+    logger.info(f"Progress saved: Last processed message for chat {key} is {message_id}")
+
+
+def _current_message(logger, summary: RunSummary, key: str, message_id: int):
+    logger.debug("Fetched message ID: %s", message_id)
+    summary.add('fetched')
+    logger.debug("Forwarding message_id: %s", message_id)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Current counts: hourly=%d/%d, daily=%d/%d, media=%d/%d",
+                     message_id % HOURLY_LIMIT, HOURLY_LIMIT, message_id % DAILY_LIMIT, DAILY_LIMIT,
+                     0, MEDIA_LIMIT)
+    logger.debug("Applying safety delay of %.2f seconds", 3.14159)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Updated counters: hourly=%d/%d, daily=%d/%d, media=%d/%d",
+                     message_id % HOURLY_LIMIT, HOURLY_LIMIT, message_id % DAILY_LIMIT, DAILY_LIMIT,
+                     0, MEDIA_LIMIT)
+    logger.debug("Progress saved: Last processed message for chat %s is %s", key, message_id)
+    summary.add('forwarded')
+
+
+def _run(mode: str, log_file: Path) -> dict:
+    fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    stream = CountingStream(fd)
+    root = logging.getLogger()
+    listener = None
+
+    if mode == 'legacy':
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    else:
+        listener = setup_logging('DEBUG' if mode == 'current-debug' else 'INFO', 'text', use_queue=True)
+        listener.handlers[0].setStream(stream)
+
+    logger = logging.getLogger('CloneGram')
+    # A 10-minute run at the default delays emits ten summaries (LOG_SUMMARY_INTERVAL=60)
+    summary = RunSummary(interval=0)
+    key = '-1001234567890->-1009876543210'
+
+    wall = time.perf_counter()
+    loop_cpu = time.thread_time()
+    total_cpu = time.process_time()
+    for message_id in range(1, MESSAGES + 1):
+        if mode == 'legacy':
+            _legacy_message(logger, key, message_id)
+        else:
+            _current_message(logger, summary, key, message_id)
+    if mode != 'legacy':
+        for _ in range(10):
+            summary.log()
+    loop_cpu = time.thread_time() - loop_cpu
+    if listener is not None:
+        stop_logging()  # Wait until the listener has written everything
+    total_cpu = time.process_time() - total_cpu
+    wall = time.perf_counter() - wall
+
+    os.close(fd)
+    return {
+        'loop_cpu': loop_cpu,
+        'total_cpu': total_cpu,
+        'wall': wall,
+        'writes': stream.writes,
+        'bytes': log_file.stat().st_size,
+    }
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        log_file = Path(tmp) / 'bench.log'
+        results = {mode: _run(mode, log_file) for mode in ('legacy', 'current', 'current-debug')}
+
+    print(f"Logging cost per {MESSAGES:,} messages")
+    print(f"{'setup':<14} {'loop CPU':>10} {'total CPU':>10} {'write syscalls':>15} {'bytes':>11}")
+    for mode, r in results.items():
+        print(f"{mode:<14} {r['loop_cpu'] * 1000:>8.1f}ms {r['total_cpu'] * 1000:>8.1f}ms "
+              f"{r['writes']:>15,} {r['bytes']:>11,}")
+
+    legacy, current = results['legacy'], results['current']
+    print(f"\nSaved at LOG_LEVEL=INFO: {(legacy['loop_cpu'] - current['loop_cpu']) * 1000:.1f}ms of event loop CPU, "
+          f"{legacy['writes'] - current['writes']:,} write syscalls")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+End-to-end benchmark of the clone pipeline without a Telegram account.
+
+Runs Bot.clone_pairs against FakeTelegram (synthetic history with albums, service
+messages, protected content and button URLs) on a virtual clock: every safety
+delay, rate limit wait, FloodWait and injected API latency is simulated, so days
+of cloning run in seconds. Reports messages per wall-second and per simulated
+hour, API calls per message and peak traced memory.
+
+    python benchmarks/pipeline_bench.py
+    python benchmarks/pipeline_bench.py --sizes 10000 100000 1000000 --profile unthrottled
+    python benchmarks/pipeline_bench.py --latency 0.2 --flood-rate 0.01 --batch 20
+    python benchmarks/pipeline_bench.py --repost-rate 0.2 --dedup
+    python benchmarks/pipeline_bench.py --archive --reruns 1
+    python benchmarks/pipeline_bench.py --destinations 3
+
+Profiles: 'default' uses the bot's default limits (the simulated rate is then bound
+by HOURLY_LIMIT/DAILY_LIMIT), 'unthrottled' removes the safety limits and delays
+to measure the pipeline itself.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+ORIGIN_ID = 1001
+DESTINY_ID = 1002
+# Marked IDs (-100...) as they appear in ORIGIN_GROUP/DESTINY_GROUP
+ORIGIN_GROUP = -1000000000000 - ORIGIN_ID
+DESTINY_GROUP = -1000000000000 - DESTINY_ID
+
+PROFILES = {
+    'default': {},
+    'unthrottled': {
+        'MIN_DELAY': '0', 'MAX_DELAY': '0', 'NIGHT_MODE': 'false', 'WEEKEND_MODE': 'false',
+        'HOURLY_LIMIT': '1000000000', 'DAILY_LIMIT': '1000000000', 'DAILY_MEDIA_LIMIT': '1000000000',
+        'MAX_BATCH_SIZE': '1000000000', 'BATCH_COOLDOWN': '0',
+    },
+}
+
+
+def _configure(args) -> None:
+    """Settings are read when bot/main.py is imported, so the environment is set first"""
+    os.environ.update({
+        'ACCOUNT_NAME': 'bench', 'PHONE_NUMBER': '0', 'PASSWORD': '', 'API_ID': '1', 'API_HASH': 'bench',
+        'ORIGIN_GROUP': str(ORIGIN_GROUP), 'DESTINY_GROUP': str(DESTINY_GROUP),
+        'FORWARD_BATCH_SIZE': str(args.batch),
+        'LOG_LEVEL': os.environ.get('BENCH_LOG', 'ERROR'), 'LOG_QUEUE': 'false', 'LOG_SUMMARY_INTERVAL': '0',
+        'PROGRESS_DISPLAY': os.environ.get('BENCH_PROGRESS', 'off'),
+        'CONTINUOUS_MODE': 'false', 'DEDUP': str(args.dedup).lower(), 'ARCHIVE': str(args.archive).lower(),
+    })
+    os.environ.update(PROFILES[args.profile])
+
+
+def _run(args, size: int, workdir: Path) -> dict:
+    import clock
+    from fake_telegram import FakeTelegram, SyntheticHistory
+    from main import Bot
+    from pairs import ClonePair
+
+    class BenchBot(FakeTelegram, Bot):
+        latency = args.latency
+        flood_rate = args.flood_rate
+        slowmode_rate = args.slowmode_rate
+
+    os.chdir(workdir)
+    (workdir / 'sessions').mkdir()
+
+    # Monday morning, so night and weekend multipliers kick in at realistic times
+    virtual = clock.VirtualClock(start=datetime(2025, 1, 6, 9, 0).timestamp())
+
+    async def clone():
+        bot = BenchBot()
+        bot.setup_fake(SyntheticHistory(ORIGIN_ID, size, repost_rate=args.repost_rate), DESTINY_ID)
+        # Fan-out: the extra destinations follow DESTINY_GROUP's ID
+        destinies = [DESTINY_GROUP - n for n in range(args.destinations)]
+        try:
+            await bot.clone_pairs([ClonePair(ORIGIN_GROUP, destinies if len(destinies) > 1 else destinies[0])])
+        finally:
+            if bot.dedup is not None:
+                bot.dedup.close()
+            if bot.archive is not None:
+                bot.archive.close()
+            bot.message_map.close()
+            bot.progress_tracker.close()
+            bot.safety.close()
+        return bot
+
+    for _ in range(args.reruns):
+        # Clone everything again from scratch, keeping only the archive (and the activity log)
+        virtual.run(clone())
+        for state in ('progress.db', 'message_map.db', 'dedup.bin', 'dedup.bin.journal'):
+            (workdir / 'data' / state).unlink(missing_ok=True)
+
+    simulated = virtual.elapsed
+    tracemalloc.start()
+    wall = time.perf_counter()
+    bot = virtual.run(clone())
+    wall = time.perf_counter() - wall
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    simulated_hours = (virtual.elapsed - simulated) / 3600
+    calls = sum(bot.api_calls.values())
+    return {
+        'size': size,
+        'delivered': bot.delivered,
+        'out_of_order': bot.out_of_order,
+        'wall': wall,
+        'per_wall_second': size / wall,
+        'simulated_hours': simulated_hours,
+        'per_simulated_hour': size / simulated_hours if simulated_hours else float('inf'),
+        'calls_per_message': calls / size,
+        'calls': dict(bot.api_calls),
+        'peak_mb': peak / 2**20,
+        'dedup': bot.dedup.summary() if bot.dedup is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='default')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per API request')
+    parser.add_argument('--flood-rate', type=float, default=0.0, help='probability of FloodWait per send')
+    parser.add_argument('--slowmode-rate', type=float, default=0.0, help='probability of SlowModeWait per send')
+    parser.add_argument('--batch', type=int, default=1, help='FORWARD_BATCH_SIZE')
+    parser.add_argument('--repost-rate', type=float, default=0.0, help='share of messages repeating earlier content')
+    parser.add_argument('--dedup', action='store_true', help='enable the dedup stage (DEDUP)')
+    parser.add_argument('--archive', action='store_true', help='enable the local message archive (ARCHIVE)')
+    parser.add_argument('--destinations', type=int, default=1, help='destinations fed by one fetch (fan-out)')
+    parser.add_argument('--reruns', type=int, default=0,
+                        help='clone the history this many times before the measured run, keeping only the archive')
+    args = parser.parse_args()
+
+    _configure(args)
+    here = Path(__file__).resolve().parent
+    sys.path[:0] = [str(here.parent / 'bot'), str(here)]
+
+    print(f"profile={args.profile} latency={args.latency}s flood_rate={args.flood_rate} "
+          f"slowmode_rate={args.slowmode_rate} batch={args.batch} repost_rate={args.repost_rate} dedup={args.dedup} "
+          f"archive={args.archive} destinations={args.destinations} reruns={args.reruns}")
+    print(f"{'messages':>10} {'wall s':>8} {'msg/wall-s':>11} {'sim hours':>10} {'msg/sim-h':>10} "
+          f"{'calls/msg':>10} {'peak MB':>8}  delivered")
+    cwd = os.getcwd()
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                r = _run(args, size, Path(tmp))
+            finally:
+                os.chdir(cwd)
+        order = '' if not r['out_of_order'] else f" ({r['out_of_order']} out of order)"
+        print(f"{r['size']:>10,} {r['wall']:>8.1f} {r['per_wall_second']:>11,.0f} {r['simulated_hours']:>10,.1f} "
+              f"{r['per_simulated_hour']:>10,.0f} {r['calls_per_message']:>10.3f} {r['peak_mb']:>8.1f}  "
+              f"{r['delivered']:,}{order}")
+        print(f"{'':>10} calls: {', '.join(f'{k}={v:,}' for k, v in sorted(r['calls'].items()))}")
+        if r['dedup']:
+            print(f"{'':>10} dedup: {r['dedup']}")
+
+
+if __name__ == '__main__':
+    main()
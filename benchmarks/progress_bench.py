@@ -0,0 +1,68 @@
+"""
+Checkpoints per second for the progress backends.
+
+Compares the legacy behaviour (progress.json rewritten on every save) against the
+SQLite backend, both committing every checkpoint and with batched commits.
+
+    python benchmarks/progress_bench.py
+"""
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'bot'))
+
+from progress_tracker import ProgressTracker, JsonProgressBackend, SqliteProgressBackend  # noqa: E402
+
+logging.getLogger('CloneGram').setLevel(logging.WARNING)
+
+CHAT_COUNTS = (1, 100, 10_000)
+TIME_BUDGET = 2.0  # seconds spent on each measurement
+
+
+def _seed(tracker: ProgressTracker, chats: int):
+    for chat_id in range(chats):
+        tracker._pending[str(chat_id)] = (1, '2025-01-01T00:00:00')
+    tracker.flush()
+
+
+def _measure(tracker: ProgressTracker, chats: int) -> float:
+    _seed(tracker, chats)
+    done = 0
+    message_id = 1
+    start = time.perf_counter()
+    while time.perf_counter() - start < TIME_BUDGET:
+        for _ in range(50):
+            message_id += 1
+            tracker.save_progress(message_id % chats, message_id)
+        done += 50
+    tracker.flush()
+    elapsed = time.perf_counter() - start
+    tracker.close()
+    return done / elapsed
+
+
+def main():
+    print(f"{'chats':>7} | {'json (legacy)':>14} | {'sqlite/commit':>14} | {'sqlite/batched':>14}")
+    for chats in CHAT_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            legacy = _measure(ProgressTracker(JsonProgressBackend(tmp / 'progress.json')), chats)
+            per_commit = _measure(
+                ProgressTracker(SqliteProgressBackend(tmp / 'a.db', legacy_json=None)), chats
+            )
+            batched = _measure(
+                ProgressTracker(
+                    SqliteProgressBackend(tmp / 'b.db', legacy_json=None),
+                    flush_every=20,
+                    flush_interval=5.0,
+                ),
+                chats,
+            )
+        print(f"{chats:>7} | {legacy:>12.0f}/s | {per_commit:>12.0f}/s | {batched:>12.0f}/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Memory held by queued messages: Telethon Message objects against MessageRecord.
+
+Builds messages the way a history fetch does (raw TL objects completed with the chat
+and sender entities), then queues N of them as they are, or as the records the fetch
+stage now keeps, and reports the peak traced memory of each.
+
+    python benchmarks/record_bench.py
+    python benchmarks/record_bench.py --messages 100000
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+CHAT_ID = 1001
+USER_ID = 42
+
+
+def _telethon_messages(count: int):
+    """Fetched-like messages: text with entities, photos, albums, link buttons, service messages"""
+    from telethon import utils
+    from telethon._updates import EntityCache
+    from telethon.extensions import markdown
+    from telethon.tl import types
+
+    chat = types.Channel(id=CHAT_ID, title='origin', photo=types.ChatPhotoEmpty(), date=None,
+                         access_hash=CHAT_ID, megagroup=True)
+    user = types.User(id=USER_ID, access_hash=USER_ID, first_name='sender', username='sender')
+    entities = {utils.get_peer_id(chat): chat, utils.get_peer_id(user): user}
+    client = SimpleNamespace(_self_id=1, _mb_entity_cache=EntityCache(), parse_mode=markdown)
+    input_chat = utils.get_input_peer(chat)
+    peer = types.PeerChannel(CHAT_ID)
+    started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rng = random.Random(1)
+
+    album = 0
+    for message_id in range(1, count + 1):
+        date = started + timedelta(minutes=message_id)
+        if rng.random() < 0.01:
+            message = types.MessageService(id=message_id, peer_id=peer, date=date,
+                                           action=types.MessageActionChatEditTitle('renamed'))
+        else:
+            if album == 0 and rng.random() < 0.02:
+                album = rng.randint(2, 6)
+            media = None
+            if album or rng.random() < 0.3:
+                media = types.MessageMediaPhoto(photo=types.Photo(
+                    id=message_id, access_hash=message_id, file_reference=rng.randbytes(20), date=date, dc_id=2,
+                    sizes=[types.PhotoStrippedSize('i', rng.randbytes(40)),
+                           types.PhotoSize('m', 320, 240, 20_000), types.PhotoSize('x', 800, 600, 80_000)],
+                ))
+            markup = None
+            if rng.random() < 0.05:
+                markup = types.ReplyInlineMarkup([types.KeyboardButtonRow([
+                    types.KeyboardButton('Open', types.InlineButtonTypeUrl(f'https://example.com/{message_id}'))
+                ])])
+            text = f'Message {message_id} of the history, with a link to https://example.com/{message_id}'
+            message = types.Message(
+                id=message_id, peer_id=peer, date=date, message=text, from_id=types.PeerUser(USER_ID),
+                media=media, reply_markup=markup,
+                entities=[types.MessageEntityBold(0, 7), types.MessageEntityUrl(len(text) - 25, 25)],
+                grouped_id=(message_id - message_id % 10) if album else None,
+                views=rng.randint(100, 10_000),
+            )
+            album = max(0, album - 1)
+        message._finish_init(client, entities, input_chat)
+        yield message
+
+
+async def _queue(count: int, records: bool) -> dict:
+    from pipeline import ClonePipeline
+    from records import MessageRecord
+
+    origin = SimpleNamespace(id=CHAT_ID)
+    pipe = ClonePipeline(origin, SimpleNamespace(id=CHAT_ID + 1))
+    list(_telethon_messages(1))  # Imports and caches are not part of the measure
+    messages = _telethon_messages(count)
+    started = time.perf_counter()
+    tracemalloc.start()
+    for message in messages:
+        if records:
+            message = MessageRecord.from_message(message, origin)
+        for item in pipe.media_groups.feed(message):
+            pipe.messages_queue.put_nowait(item)
+    for item in pipe.media_groups.flush():
+        pipe.messages_queue.put_nowait(item)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'queued': pipe.messages_queue.qsize(),
+        'current_mb': current / 2**20,
+        'peak_mb': peak / 2**20,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100_000)
+    args = parser.parse_args()
+
+    here = Path(__file__).resolve().parent
+    sys.path[:0] = [str(here.parent / 'bot'), str(here)]
+
+    print(f"{args.messages:,} messages queued (albums as one item each)")
+    print(f"{'queued as':>18} {'items':>8} {'held MB':>8} {'peak MB':>8} {'B/msg':>6} {'seconds':>8}")
+    for label, records in (('Telethon Message', False), ('MessageRecord', True)):
+        r = asyncio.run(_queue(args.messages, records))
+        print(f"{label:>18} {r['queued']:>8,} {r['current_mb']:>8.1f} {r['peak_mb']:>8.1f} "
+              f"{r['current_mb'] * 2**20 / args.messages:>6.0f} {r['seconds']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import struct
+import zlib
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, List, Tuple
+
+import clock
+
+logger = logging.getLogger('CloneGram.ActivityLog')
+
+# Record layout: wall-clock timestamp (float64), flags (uint8), CRC32 of the first 9 bytes (uint32)
+_RECORD = struct.Struct('<dBI')
+_PAYLOAD = struct.Struct('<dB')
+RECORD_SIZE = _RECORD.size
+
+FLAG_MEDIA = 0x01
+
+
+def _pack(timestamp: float, is_media: bool) -> bytes:
+    payload = _PAYLOAD.pack(timestamp, FLAG_MEDIA if is_media else 0)
+    return payload + struct.pack('<I', zlib.crc32(payload))
+
+
+def _unpack(record: bytes) -> Tuple[float, bool] | None:
+    """Decode a record, returning None if its checksum does not match"""
+    timestamp, flags, crc = _RECORD.unpack(record)
+    if zlib.crc32(record[:_PAYLOAD.size]) != crc:
+        return None
+    return timestamp, bool(flags & FLAG_MEDIA)
+
+
+class ActivityLog:
+    """
+    Append-only log of sent messages used to persist the safety counters.
+
+    Every send appends one fixed-size, checksummed record, so recording is O(1).
+    The log is compacted (rewritten with only the entries still inside `horizon`)
+    once the number of appends since the last compaction exceeds the live entries,
+    which keeps the amortized cost constant and the file bounded.
+    A corrupted record only loses that record; a torn tail is truncated on load.
+    """
+
+    def __init__(self, path: str | Path = './data/activity_counters.bin', horizon: float = 86400):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.horizon = horizon
+        self.entries: Deque[Tuple[float, bool]] = deque()
+        self._appends_since_compaction = 0
+        self._file = None
+
+    def load(self, now: float | None = None) -> List[Tuple[float, bool]]:
+        """Replay the entries that are still inside the window and open the log for appending"""
+        now = clock.time() if now is None else now
+        cutoff = now - self.horizon
+        self.entries.clear()
+
+        if self.path.exists():
+            corrupted = 0
+            with open(self.path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                count = size // RECORD_SIZE
+                start = self._find_first_after(f, count, cutoff)
+                f.seek(start * RECORD_SIZE)
+                data = f.read((count - start) * RECORD_SIZE)
+
+            for offset in range(0, len(data), RECORD_SIZE):
+                entry = _unpack(data[offset:offset + RECORD_SIZE])
+                if entry is None:
+                    corrupted += 1
+                    continue
+                if entry[0] >= cutoff:
+                    self.entries.append(entry)
+
+            if size % RECORD_SIZE:
+                logger.warning(f"Truncating torn record at the end of {self.path}")
+            if corrupted:
+                logger.warning(f"Skipped {corrupted} corrupted record(s) in {self.path}")
+            # Start from a compacted file so stale and damaged records are dropped. The
+            # replayed entries stand even if that fails: the old file is still valid
+            try:
+                self.compact()
+            except OSError as e:
+                logger.warning(f"Could not compact {self.path}, appending to it as it is: {e}")
+                self._open()
+        else:
+            self._open()
+
+        logger.info(f"Replayed {len(self.entries)} activity entries from {self.path}")
+        return list(self.entries)
+
+    def _find_first_after(self, f, count: int, cutoff: float) -> int:
+        """Binary search for the first record not older than cutoff"""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(mid * RECORD_SIZE)
+            entry = _unpack(f.read(RECORD_SIZE))
+            # A damaged record gives no ordering information; scan from the low side instead
+            if entry is None or entry[0] >= cutoff:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'ab', buffering=0)
+
+    def append(self, timestamp: float, is_media: bool = False) -> None:
+        """Record one sent message"""
+        self._open()
+        self._file.write(_pack(timestamp, is_media))
+        self.entries.append((timestamp, is_media))
+
+        cutoff = timestamp - self.horizon
+        while self.entries and self.entries[0][0] < cutoff:
+            self.entries.popleft()
+
+        self._appends_since_compaction += 1
+        if self._appends_since_compaction > max(1024, len(self.entries)):
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrite the log with only the live entries"""
+        self.close()
+        data = b''.join(_pack(ts, is_media) for ts, is_media in self.entries)
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        try:
+            try:
+                self._write(tmp_path, data)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                # Renaming over a file that is bind-mounted on its own (Docker) fails with
+                # EBUSY; rewrite the file in place instead
+                tmp_path.unlink(missing_ok=True)
+                logger.debug("Rewriting %s in place (%s)", self.path, e)
+                self._write(self.path, data)
+        finally:
+            # Not retried on every append if it failed; the log keeps growing until the next one
+            self._appends_since_compaction = 0
+            self._open()
+        logger.debug("Compacted %s to %d entries", self.path, len(self.entries))
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> None:
+        with open(path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def import_legacy_json(self, json_file: str | Path) -> int:
+        """Seed an empty log from the old activity_counters.json format"""
+        json_file = Path(json_file)
+        if self.entries or not json_file.exists():
+            return 0
+        try:
+            with open(json_file, 'r') as f:
+                timestamps = json.load(f).get('timestamps', {})
+            media = {datetime.fromisoformat(ts).timestamp() for ts in timestamps.get('daily_media', [])}
+            sent = sorted(datetime.fromisoformat(ts).timestamp() for ts in timestamps.get('daily', []))
+        except Exception as e:
+            logger.warning(f"Could not import legacy counters from {json_file}: {e}")
+            return 0
+
+        cutoff = clock.time() - self.horizon
+        for ts in sent:
+            if ts >= cutoff:
+                self.entries.append((ts, ts in media))
+        self.compact()
+        logger.info(f"Imported {len(self.entries)} activity entries from {json_file}")
+        return len(self.entries)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
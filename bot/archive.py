@@ -0,0 +1,259 @@
+import bisect
+import logging
+import struct
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import metrics
+from records import KINDS, ButtonRecord, MessageRecord, kind_of
+
+logger = logging.getLogger('CloneGram.Archive')
+
+# Fixed part of a record: id, date, grouped_id, sender_id, media ID, kind, flags, then the
+# byte lengths of the raw text, of the formatted text (0: same as the raw text) and of the
+# button URLs (joined by newlines), which follow it
+_RECORD = struct.Struct('<iIqqqBBIII')
+# Index entry of a block: the IDs it covers (after_id, last_id], segment number, offset and
+# length of its compressed data, CRC32 of that data
+_INDEX = struct.Struct('<iiIQII')
+
+_KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+
+FLAG_NOFORWARDS = 1
+
+SEGMENT_SIZE = 64 * 2**20  # A new segment file is started past this size
+
+
+def encode(messages) -> bytes:
+    """Serialize messages or records (service messages are left out: they are never sent)"""
+    parts = []
+    for message in messages:
+        kind = message.kind if isinstance(message, MessageRecord) else kind_of(message)
+        if kind == 'service':
+            continue
+        media = getattr(message, 'photo', None) or getattr(message, 'document', None)
+        raw = (getattr(message, 'message', None) or '').encode('utf-8')
+        formatted = (message.text or '').encode('utf-8')
+        if formatted == raw:
+            formatted = b''
+        urls = '\n'.join(
+            button.url for row in message.buttons or [] for button in row if getattr(button, 'url', None)
+        ).encode('utf-8')
+        date = getattr(message, 'date', None)
+        parts.append(_RECORD.pack(
+            message.id,
+            int(date.timestamp()) if date else 0,
+            message.grouped_id or 0,
+            getattr(message, 'sender_id', None) or 0,
+            media.id if media is not None else 0,
+            _KIND_CODES[kind],
+            FLAG_NOFORWARDS if message.noforwards else 0,
+            len(raw), len(formatted), len(urls),
+        ))
+        parts += (raw, formatted, urls)
+    return b''.join(parts)
+
+
+def decode(data: bytes, chat) -> List[MessageRecord]:
+    messages = []
+    offset = 0
+    size = len(data)
+    while offset < size:
+        (message_id, date, grouped_id, sender_id, media_id, kind, flags,
+         raw_length, formatted_length, urls_length) = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        raw = data[offset:offset + raw_length].decode('utf-8')
+        offset += raw_length
+        formatted = data[offset:offset + formatted_length].decode('utf-8') if formatted_length else raw
+        offset += formatted_length
+        urls = data[offset:offset + urls_length].decode('utf-8') if urls_length else None
+        offset += urls_length
+        messages.append(MessageRecord(
+            message_id,
+            datetime.fromtimestamp(date, timezone.utc) if date else None,
+            grouped_id or None,
+            sender_id or None,
+            KINDS[kind],
+            media_id,
+            bool(flags & FLAG_NOFORWARDS),
+            raw,
+            formatted,
+            [[ButtonRecord(url) for url in urls.split('\n')]] if urls else None,
+            chat,
+        ))
+    return messages
+
+
+class ChatArchive:
+    """
+    History of one chat, as zlib-compressed blocks (one per fetched page) appended to
+    segment files, plus an index of the ID range each block covers.
+
+    The archive covers a single contiguous range of IDs (`start`, `high_water`]: a page
+    is only appended when it continues it. An index entry is written after its block,
+    so a torn write is detected when loading (the entry is missing or points past the
+    end of the segment) and the incomplete block is truncated away.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.path / 'index'
+        self.entries: List[Tuple[int, int, int, int, int, int]] = []
+        self._last_ids: List[int] = []
+        self._segment = None
+        self._cached: Tuple[int, List[MessageRecord]] = (-1, [])  # Last decoded block
+        self._load()
+
+    @property
+    def start(self) -> int:
+        return self.entries[0][0] if self.entries else 0
+
+    @property
+    def high_water(self) -> int:
+        return self.entries[-1][1] if self.entries else 0
+
+    def _segment_path(self, number: int) -> Path:
+        return self.path / f'{number:06d}.seg'
+
+    def _load(self) -> None:
+        data = self.index_path.read_bytes() if self.index_path.exists() else b''
+        usable = len(data) - len(data) % _INDEX.size
+        sizes: Dict[int, int] = {}
+        for entry in _INDEX.iter_unpack(data[:usable]):
+            after_id, last_id, segment, offset, length, _ = entry
+            if segment not in sizes:
+                segment_path = self._segment_path(segment)
+                sizes[segment] = segment_path.stat().st_size if segment_path.exists() else 0
+            if sizes[segment] < offset + length or (self.entries and after_id != self.entries[-1][1]):
+                logger.warning(f"Archive {self.path} is damaged after message {self.high_water}, truncating it")
+                break
+            self.entries.append(entry)
+        self._truncate(len(self.entries))
+        self._last_ids = [entry[1] for entry in self.entries]
+
+    def _truncate(self, count: int) -> None:
+        """Keep the first `count` blocks, dropping any data written after them"""
+        del self.entries[count:]
+        self._last_ids = self._last_ids[:count]
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+        with open(self.index_path, 'ab') as f:
+            f.truncate(count * _INDEX.size)
+        if self.entries:
+            _, _, segment, offset, length, _ = self.entries[-1]
+            end = offset + length
+        else:
+            segment, end = 0, 0
+        with open(self._segment_path(segment), 'ab') as f:
+            f.truncate(end)
+        for later in sorted(self.path.glob('*.seg')):
+            if int(later.stem) > segment:
+                later.unlink()
+
+    def covers(self, after_id: int) -> bool:
+        """Whether the messages following `after_id` can be read from the archive"""
+        return bool(self.entries) and self.start <= after_id < self.high_water
+
+    def append(self, after_id: int, messages: List) -> bool:
+        """Archive a page of messages fetched after `after_id`; returns False if it is not contiguous"""
+        if not messages or (self.entries and after_id != self.high_water):
+            return False
+        if self.entries:
+            _, _, segment, offset, length, _ = self.entries[-1]
+            offset += length
+            if offset >= SEGMENT_SIZE:
+                segment, offset = segment + 1, 0
+        else:
+            segment, offset = 0, 0
+        data = zlib.compress(encode(messages))
+        entry = (after_id, messages[-1].id, segment, offset, len(data), zlib.crc32(data))
+        try:
+            if self._segment is None or self._segment.name != str(self._segment_path(segment)):
+                if self._segment is not None:
+                    self._segment.close()
+                self._segment = open(self._segment_path(segment), 'ab')
+            self._segment.write(data)
+            self._segment.flush()
+            with open(self.index_path, 'ab') as f:
+                f.write(_INDEX.pack(*entry))
+        except OSError as e:
+            logger.error(f"Error writing the archive {self.path}: {e}")
+            self._truncate(len(self.entries))
+            return False
+        self.entries.append(entry)
+        self._last_ids.append(entry[1])
+        metrics.ARCHIVE_MESSAGES.labels('write').inc(len(messages))
+        return True
+
+    def _block(self, position: int, chat) -> List[MessageRecord]:
+        if self._cached[0] == position:
+            return self._cached[1]
+        _, _, segment, offset, length, crc = self.entries[position]
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        if zlib.crc32(data) != crc:
+            raise ValueError(f"checksum mismatch in block {position}")
+        messages = decode(zlib.decompress(data), chat)
+        self._cached = (position, messages)
+        return messages
+
+    def read(self, after_id: int, limit: int, chat) -> Tuple[List[MessageRecord], int]:
+        """
+        Up to `limit` archived messages after `after_id`, and the ID up to which the
+        history was read (the high-water mark once the archive is exhausted)
+        """
+        messages: List[MessageRecord] = []
+        position = bisect.bisect_right(self._last_ids, after_id)
+        while position < len(self.entries) and len(messages) < limit:
+            try:
+                block = self._block(position, chat)
+            except (OSError, ValueError, zlib.error, struct.error) as e:
+                logger.error(f"Unreadable archive block in {self.path} ({e}), fetching from message "
+                             f"{self.entries[position][0]} again")
+                self._truncate(position)
+                break
+            for message in block:
+                if message.id > after_id:
+                    messages.append(message)
+                    if len(messages) == limit:
+                        break
+            position += 1
+        covered = messages[-1].id if len(messages) == limit else max(after_id, self.high_water)
+        metrics.ARCHIVE_MESSAGES.labels('read').inc(len(messages))
+        return messages, covered
+
+    def close(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+
+class MessageArchive:
+    """
+    Local archive of fetched history, one ChatArchive per origin chat under `path`.
+    History is served from it up to the archived high-water mark and fetched from
+    Telegram only past it, so restarts, crash recovery and filter changes do not read
+    the same pages again. It is a snapshot: edits and deletions made after a page was
+    archived are not seen (messages are still forwarded by ID, in their current form).
+    """
+
+    def __init__(self, path: str | Path = './data/archive'):
+        self.path = Path(path)
+        self.chats: Dict[int, ChatArchive] = {}
+
+    def chat(self, chat_id: int) -> ChatArchive:
+        archive = self.chats.get(chat_id)
+        if archive is None:
+            archive = self.chats[chat_id] = ChatArchive(self.path / str(chat_id))
+            if archive.entries:
+                logger.info(f"Archive of chat {chat_id}: messages {archive.start + 1}-{archive.high_water}")
+        return archive
+
+    def close(self) -> None:
+        for archive in self.chats.values():
+            archive.close()
@@ -0,0 +1,110 @@
+"""
+Time source of the bot.
+
+Everything in bot/ reads the time through this module (`clock.time()`,
+`clock.monotonic()`, `clock.now()`), so a simulation can swap in a VirtualClock.
+asyncio.sleep follows the event loop's clock; VirtualClock.run() drives a loop
+whose timers fire on virtual time and which jumps ahead whenever it would
+otherwise wait, so a simulated day of delays and rate limit waits takes seconds.
+"""
+import asyncio
+import selectors
+import time as _time
+from datetime import datetime
+from typing import Optional
+
+
+class RealClock:
+    def time(self) -> float:
+        return _time.time()
+
+    def monotonic(self) -> float:
+        return _time.monotonic()
+
+
+class VirtualClock:
+    """Clock that only moves when the event loop has nothing to do but wait"""
+
+    def __init__(self, start: Optional[float] = None):
+        self.start = _time.time() if start is None else start
+        self.elapsed = 0.0
+
+    def time(self) -> float:
+        return self.start + self.elapsed
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def advance(self, seconds: float) -> None:
+        if seconds > 0:
+            self.elapsed += seconds
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        return _VirtualTimeEventLoop(self)
+
+    def run(self, coro):
+        """Install this clock and run `coro` to completion on virtual time"""
+        previous = _source
+        use(self)
+        loop = self.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+            use(previous)
+
+
+class _VirtualSelector:
+    """Selector that polls for real I/O and advances the virtual clock instead of blocking"""
+
+    # Real wait when the loop has no timers, so other threads can still wake it up
+    IDLE_POLL = 0.01
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self.selector = selectors.DefaultSelector()
+
+    def select(self, timeout: Optional[float] = None):
+        if timeout is None:
+            return self.selector.select(self.IDLE_POLL)
+        events = self.selector.select(0)
+        if not events:
+            self.clock.advance(timeout)
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+
+class _VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock: VirtualClock):
+        super().__init__(selector=_VirtualSelector(clock))
+        self.clock = clock
+
+    def time(self) -> float:
+        return self.clock.monotonic()
+
+
+_source = RealClock()
+
+
+def use(clock) -> None:
+    """Make `clock` the time source of the bot"""
+    global _source
+    _source = clock
+
+
+def time() -> float:
+    """Wall-clock seconds since the epoch"""
+    return _source.time()
+
+
+def monotonic() -> float:
+    """Seconds on a clock that never goes backwards (for intervals and rate limits)"""
+    return _source.monotonic()
+
+
+def now() -> datetime:
+    """Local wall-clock time"""
+    return datetime.fromtimestamp(_source.time())
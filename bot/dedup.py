@@ -0,0 +1,249 @@
+import hashlib
+import logging
+import math
+import os
+import struct
+import zlib
+from collections import deque
+from pathlib import Path
+from typing import Deque, List, Optional, Set, Tuple
+
+from telethon.tl.types import MessageMediaWebPage
+
+import metrics
+
+logger = logging.getLogger('CloneGram.Dedup')
+
+# Snapshot layout: header, current and previous filter bits, recent hashes (uint64 each), CRC32 of everything before it
+_HEADER = struct.Struct('<4sBQBQQI')
+_MAGIC = b'CGDD'
+_VERSION = 1
+# Journal of keys added since the snapshot: the two 64-bit halves of each key hash
+_JOURNAL_RECORD = struct.Struct('<QQ')
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Case- and whitespace-insensitive form of a text, so trivial edits still match"""
+    return ' '.join((text or '').casefold().split())
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 128-bit hashes (double hashing)"""
+
+    __slots__ = ('num_bits', 'num_hashes', 'bits', 'count')
+
+    def __init__(self, num_bits: int, num_hashes: int, bits: Optional[bytearray] = None, count: int = 0):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+        self.count = count
+
+    def _positions(self, h1: int, h2: int):
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, h1: int, h2: int) -> None:
+        for position in self._positions(h1, h2):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def contains(self, h1: int, h2: int) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(h1, h2))
+
+
+class DedupIndex:
+    """
+    Content already sent to each destination, to skip reposts of the same media or text.
+
+    Keys are the photo/document ID plus the normalized caption for media, and the
+    normalized text for text messages; they are scoped to the destination chat.
+    Memory is bounded: an exact set holds the hashes of the last `recent` keys, and a
+    rotating pair of Bloom filters (each sized for `capacity` keys at `error_rate`)
+    remembers older ones, the oldest generation being dropped when the current one
+    is full. A Bloom false positive skips a message that was not a repost, so
+    `error_rate` is kept very low.
+    New keys are appended to a journal next to the snapshot (16 bytes each); the
+    snapshot is rewritten and the journal emptied every `snapshot_every` keys and
+    on close, so a crash loses nothing and the filters are not rewritten per key.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = './data/dedup.bin',
+        capacity: int = 1_000_000,
+        error_rate: float = 1e-6,
+        recent: int = 50_000,
+        min_text_length: int = 20,
+        snapshot_every: int = 50_000,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.journal_path = self.path.with_suffix(self.path.suffix + '.journal')
+        self.capacity = capacity
+        self.min_text_length = min_text_length
+        self.snapshot_every = snapshot_every
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.current = BloomFilter(self.num_bits, self.num_hashes)
+        self.previous = BloomFilter(self.num_bits, self.num_hashes)
+        self.recent: Deque[int] = deque(maxlen=recent)
+        self._recent_set: Set[int] = set()
+        self._journal = None
+        self._journaled = 0  # Keys in the journal
+
+        # What skipping the duplicates saved
+        self.saved_requests = 0
+        self.saved_messages = 0
+        self.saved_media = 0
+        self.saved_delay = 0.0
+
+        self._load()
+        self._replay_journal()
+        self._journal = open(self.journal_path, 'ab')
+
+    def _key(self, message) -> Optional[str]:
+        """Content key of a message, or None if it is not deduplicated"""
+        text = normalize_text(getattr(message, 'message', None))
+        photo = getattr(message, 'photo', None)
+        if photo is not None:
+            return f"photo:{photo.id}:{text}"
+        document = getattr(message, 'document', None)
+        if document is not None:
+            return f"document:{document.id}:{text}"
+        if message.media is not None and not isinstance(message.media, MessageMediaWebPage):
+            return None  # Polls, locations, contacts... are always sent
+        if len(text) < self.min_text_length:
+            return None  # Short texts ("ok", "+1") repeat without being reposts
+        return f"text:{text}"
+
+    def _hashes(self, scope: int, messages: List) -> Optional[List[Tuple[int, int]]]:
+        """Hash pairs of every message's key, or None if any message is not deduplicated"""
+        hashes = []
+        for message in messages:
+            key = self._key(message)
+            if key is None:
+                return None
+            digest = hashlib.blake2b(f"{scope}|{key}".encode('utf-8'), digest_size=16).digest()
+            hashes.append((int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1))
+        return hashes
+
+    def _seen(self, h1: int, h2: int) -> bool:
+        return h1 in self._recent_set or self.current.contains(h1, h2) or self.previous.contains(h1, h2)
+
+    def is_duplicate(self, scope: int, messages: List) -> bool:
+        """Whether all of the messages (a single message or a whole album) were already sent to `scope`"""
+        hashes = self._hashes(scope, messages)
+        return bool(hashes) and all(self._seen(h1, h2) for h1, h2 in hashes)
+
+    def _insert(self, h1: int, h2: int) -> bool:
+        """Add a key hash, returning False if it was among the recent ones already"""
+        if h1 in self._recent_set:
+            return False
+        if self.current.count >= self.capacity:
+            # Rotate: the oldest generation is forgotten
+            self.previous = self.current
+            self.current = BloomFilter(self.num_bits, self.num_hashes)
+        self.current.add(h1, h2)
+        if not self.recent.maxlen:
+            return True  # No recent keys are kept exactly (recent=0): the filters alone remember
+        if len(self.recent) == self.recent.maxlen:
+            self._recent_set.discard(self.recent[0])
+        self.recent.append(h1)
+        self._recent_set.add(h1)
+        return True
+
+    def add(self, scope: int, messages: List) -> None:
+        """Remember the content of messages sent to `scope`"""
+        for message in messages:
+            hashes = self._hashes(scope, [message])
+            if hashes is None or not self._insert(*hashes[0]):
+                continue
+            try:
+                self._journal.write(_JOURNAL_RECORD.pack(*hashes[0]))
+                self._journal.flush()
+            except OSError as e:
+                logger.error(f"Error writing the dedup journal: {e}")
+            self._journaled += 1
+        if self._journaled >= self.snapshot_every:
+            self.save()
+
+    def note_saved(self, messages: int, media: int, delay: float) -> None:
+        """Account a send request avoided by skipping a duplicate"""
+        self.saved_requests += 1
+        self.saved_messages += messages
+        self.saved_media += media
+        self.saved_delay += delay
+        metrics.DEDUP_SAVED.labels('message').inc(messages)
+        metrics.DEDUP_SAVED.labels('media').inc(media)
+        metrics.DEDUP_SAVED_DELAY_SECONDS.inc(delay)
+
+    def summary(self) -> str:
+        return (f"{self.saved_messages} duplicate message(s) skipped: {self.saved_requests} send request(s), "
+                f"{self.saved_media} media slot(s) and about {self.saved_delay:.0f}s of delays saved")
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            data = self.path.read_bytes()
+            if zlib.crc32(data[:-4]) != struct.unpack('<I', data[-4:])[0]:
+                raise ValueError("checksum mismatch")
+            magic, version, num_bits, num_hashes, current_count, previous_count, recent_count = \
+                _HEADER.unpack_from(data)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError("not a dedup index")
+            if (num_bits, num_hashes) != (self.num_bits, self.num_hashes):
+                logger.warning(f"DEDUP_CAPACITY changed, starting a new index in {self.path}")
+                return
+            size = (num_bits + 7) // 8
+            offset = _HEADER.size
+            self.current = BloomFilter(num_bits, num_hashes, bytearray(data[offset:offset + size]), current_count)
+            offset += size
+            self.previous = BloomFilter(num_bits, num_hashes, bytearray(data[offset:offset + size]), previous_count)
+            offset += size
+            self.recent.extend(struct.unpack_from(f'<{recent_count}Q', data, offset))
+            self._recent_set = set(self.recent)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Ignoring unreadable dedup index {self.path}: {e}")
+            return
+        logger.info(f"Dedup index loaded: {self.current.count + self.previous.count} keys")
+
+    def _replay_journal(self) -> None:
+        """Add the keys journaled after the snapshot (a torn last record is dropped)"""
+        if not self.journal_path.exists():
+            return
+        data = self.journal_path.read_bytes()
+        usable = len(data) - len(data) % _JOURNAL_RECORD.size
+        for h1, h2 in _JOURNAL_RECORD.iter_unpack(data[:usable]):
+            self._insert(h1, h2)
+        self._journaled = usable // _JOURNAL_RECORD.size
+        if usable != len(data):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(usable)
+
+    def save(self) -> None:
+        """Write a snapshot atomically and empty the journal"""
+        recent = list(self.recent)
+        data = b''.join((
+            _HEADER.pack(_MAGIC, _VERSION, self.num_bits, self.num_hashes,
+                         self.current.count, self.previous.count, len(recent)),
+            self.current.bits,
+            self.previous.bits,
+            struct.pack(f'<{len(recent)}Q', *recent),
+        ))
+        tmp_file = self.path.with_suffix(self.path.suffix + '.tmp')
+        try:
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+                f.write(struct.pack('<I', zlib.crc32(data)))
+            os.replace(tmp_file, self.path)
+            self._journal.truncate(0)
+        except OSError as e:
+            logger.error(f"Error saving the dedup index: {e}")
+            return
+        self._journaled = 0
+
+    def close(self) -> None:
+        if self._journaled:
+            self.save()
+        self._journal.close()
@@ -0,0 +1,197 @@
+import json
+import logging
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from telethon import utils
+from telethon.tl.types import (
+    InputMessagesFilterDocument, InputMessagesFilterMusic, InputMessagesFilterPhotoVideo,
+    InputMessagesFilterRoundVideo, InputMessagesFilterVoice, MessageMediaWebPage,
+)
+
+logger = logging.getLogger('CloneGram.Filters')
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Kinds accepted by the "media" rule ('text' being a message without media)
+KINDS = ('text', 'photo', 'video', 'gif', 'sticker', 'voice', 'round', 'audio', 'document', 'other')
+
+# Server-side filters for kind sets that never split an album: Telegram albums are
+# photos/videos, documents or audio only, so e.g. a photos-only filter would drop the
+# videos of a mixed album while these return every member of the albums they match
+SERVER_FILTERS = {
+    frozenset({'photo', 'video'}): InputMessagesFilterPhotoVideo,
+    frozenset({'document'}): InputMessagesFilterDocument,
+    frozenset({'audio'}): InputMessagesFilterMusic,
+    frozenset({'voice'}): InputMessagesFilterVoice,
+    frozenset({'round'}): InputMessagesFilterRoundVideo,
+}
+
+
+def message_kind(message) -> str:
+    """Kind of a message for the "media" rule"""
+    media = getattr(message, 'media', None)
+    if media is None or isinstance(media, MessageMediaWebPage):
+        return 'text'
+    for kind, attribute in (('sticker', 'sticker'), ('gif', 'gif'), ('voice', 'voice'), ('round', 'video_note'),
+                            ('audio', 'audio'), ('video', 'video'), ('photo', 'photo'), ('document', 'document')):
+        if getattr(message, attribute, None) is not None:
+            return kind
+    return 'other'  # Polls, locations, contacts...
+
+
+def parse_date(value, end: bool = False) -> datetime:
+    """
+    Aware datetime from an ISO date/datetime (naive values are UTC).
+    A bare date used as an end bound includes that whole day.
+    """
+    if isinstance(value, datetime):
+        moment = value
+    elif isinstance(value, date):
+        moment = datetime.combine(value + timedelta(days=1) if end else value, time())
+    elif len(str(value)) == 10:
+        return parse_date(date.fromisoformat(str(value)), end)
+    else:
+        moment = datetime.fromisoformat(str(value))
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+class MessageFilter:
+    """
+    Compiled filter rules of a pair. Every rule is optional:
+
+        media:      kinds to keep, among KINDS ('text' = no media)
+        include:    regexes; keep only messages whose text matches one of them
+        exclude:    regexes; drop messages whose text matches any of them
+        search:     text searched by Telegram itself (case-insensitive, whole words)
+        from_users: sender IDs or usernames to keep
+        since:      keep messages from this date/datetime (UTC unless given)
+        until:      ...up to this one (a bare date includes that day)
+
+    Albums are judged as a unit: their captions are joined, every member must be of
+    a kept kind, and the sender and date are the first member's.
+    Rules Telegram can apply are also turned into iter_messages parameters (see
+    iter_params), so the messages they reject are never downloaded.
+    """
+
+    def __init__(self, rules: Dict):
+        unknown = set(rules) - {'media', 'include', 'exclude', 'search', 'from_users', 'since', 'until'}
+        if unknown:
+            raise ValueError(f"Unknown filter rule(s): {', '.join(sorted(unknown))}")
+
+        media = rules.get('media')
+        self.kinds = frozenset([media] if isinstance(media, str) else media) if media else None
+        if self.kinds and not self.kinds <= set(KINDS):
+            raise ValueError(f"Unknown media kind(s): {', '.join(sorted(self.kinds - set(KINDS)))}")
+        self.include = [re.compile(pattern, re.IGNORECASE) for pattern in rules.get('include') or []]
+        self.exclude = [re.compile(pattern, re.IGNORECASE) for pattern in rules.get('exclude') or []]
+        self.search: Optional[str] = rules.get('search') or None
+        self.from_users: List = list(rules.get('from_users') or [])
+        self.since = parse_date(rules['since']) if rules.get('since') else None
+        self.until = parse_date(rules['until'], end=True) if rules.get('until') else None
+
+        self.sender_ids: Optional[set] = None  # Filled by resolve()
+        self.from_user = None  # Input entity of the only sender, pushed down to Telegram
+
+    @property
+    def server_filter(self):
+        return SERVER_FILTERS.get(self.kinds) if self.kinds else None
+
+    async def resolve(self, client) -> None:
+        """Resolve the senders (usernames included) to peer IDs"""
+        if not self.from_users or self.sender_ids is not None:
+            return
+        entities = [await client.get_input_entity(user) for user in self.from_users]
+        self.sender_ids = {utils.get_peer_id(entity) for entity in entities}
+        self.from_user = entities[0] if len(entities) == 1 else None
+
+    def iter_params(self) -> Dict:
+        """iter_messages parameters applying the rules Telegram can evaluate"""
+        params = {}
+        if self.server_filter is not None:
+            params['filter'] = self.server_filter
+        if self.search:
+            params['search'] = self.search
+        if self.from_user is not None:
+            params['from_user'] = self.from_user
+        return params
+
+    def after_range(self, message) -> bool:
+        """Whether a message is past `until` (history is read oldest first, so fetching can stop)"""
+        return self.until is not None and message.date is not None and message.date >= self.until
+
+    def accepts(self, item, searched: bool = False) -> bool:
+        """
+        Whether a queue item (a message or a whole album) passes every rule.
+        `searched` tells that the item came from a server-side search already.
+        """
+        messages = item[2] if isinstance(item, tuple) else [item]
+        first = messages[0]
+
+        if self.kinds is not None and any(message_kind(message) not in self.kinds for message in messages):
+            return False
+        if self.since is not None and first.date is not None and first.date < self.since:
+            return False
+        if self.after_range(first):
+            return False
+        if self.sender_ids is not None and first.sender_id not in self.sender_ids:
+            return False
+
+        if self.include or self.exclude or (self.search and not searched):
+            text = '\n'.join(message.message for message in messages if getattr(message, 'message', None))
+            if self.search and not searched and self.search.casefold() not in text.casefold():
+                return False
+            if self.include and not any(pattern.search(text) for pattern in self.include):
+                return False
+            if any(pattern.search(text) for pattern in self.exclude):
+                return False
+        return True
+
+    def __repr__(self):
+        rules = []
+        if self.kinds:
+            rules.append(f"media={'/'.join(sorted(self.kinds))}")
+        if self.include:
+            rules.append(f"include={len(self.include)}")
+        if self.exclude:
+            rules.append(f"exclude={len(self.exclude)}")
+        if self.search:
+            rules.append(f"search={self.search!r}")
+        if self.from_users:
+            rules.append(f"from_users={len(self.from_users)}")
+        if self.since:
+            rules.append(f"since={self.since:%Y-%m-%d %H:%M}")
+        if self.until:
+            rules.append(f"until={self.until:%Y-%m-%d %H:%M}")
+        return f"MessageFilter({', '.join(rules)})"
+
+
+def compile_filter(rules: Optional[Dict]) -> Optional[MessageFilter]:
+    """Compile a rules mapping, or return None when there is nothing to filter"""
+    return MessageFilter(rules) if rules else None
+
+
+def load_filter(settings) -> Optional[MessageFilter]:
+    """
+    Compile the rules of FILTERS_FILE, a JSON (or YAML, if PyYAML is installed) object
+    such as {"media": ["photo", "video"], "exclude": ["giveaway"], "since": "2024-01-01"}.
+    They apply to every pair without rules of its own in PAIRS_FILE.
+    """
+    if not settings.filters_file:
+        return None
+    path = Path(settings.filters_file)
+    with open(path, 'r') as f:
+        if path.suffix in ('.yml', '.yaml'):
+            if yaml is None:
+                raise RuntimeError("PyYAML is required to read YAML filter files (pip install pyyaml)")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    message_filter = compile_filter(data)
+    logger.info(f"Loaded {message_filter} from {path}")
+    return message_filter
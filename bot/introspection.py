@@ -0,0 +1,256 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import signal
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from typing import List, Optional, Set
+
+import clock
+
+logger = logging.getLogger('CloneGram.Introspection')
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Where profiled time outside the bot's own modules goes, first match wins.
+# Builtins are matched on their name (e.g. "<method 'execute' of 'sqlite3.Cursor' objects>")
+_COMPONENTS = (
+    ('idle (waiting for I/O)', ('select.', 'epoll', 'kqueue')),
+    ('sqlite3', ('sqlite3',)),
+    ('json', ('json',)),
+    ('logging', ('logging',)),
+    ('network', ('socket', 'ssl', 'telethon/network', 'telethon/crypto')),
+    ('telethon', ('telethon',)),
+    ('asyncio', ('asyncio', 'selectors')),
+)
+
+HELP = """\
+Commands:
+  tasks                  asyncio tasks with their stacks
+  lag [SECONDS]          event loop lag, sampled for SECONDS (default 1)
+  profile start|stop     cProfile the event loop; stop saves it and prints where the time went
+  memory start [FRAMES]  start tracing allocations (tracemalloc)
+  memory snapshot        allocations that grew since the previous snapshot
+  memory stop            stop tracing
+  dump                   tasks, lag and memory growth, saved to a file
+  help                   this text"""
+
+
+def component_of(filename: str, function: str) -> str:
+    """Part of the program a profiled function belongs to: a bot module or a library"""
+    if filename.startswith(BOT_DIR):
+        return os.path.basename(filename)
+    where = f"{filename} {function}"
+    for component, needles in _COMPONENTS:
+        if any(needle in where for needle in needles):
+            return component
+    return 'other'
+
+
+def profile_summary(stats: pstats.Stats, top: int = 20) -> str:
+    """Own time per component, then the bot functions with the most cumulative time"""
+    per_component = defaultdict(float)
+    total = 0.0
+    for (filename, _, function), (_, _, own, _, _) in stats.stats.items():
+        per_component[component_of(filename, function)] += own
+        total += own
+
+    out = io.StringIO()
+    out.write(f"{total:.3f} s profiled\n")
+    for component, seconds in sorted(per_component.items(), key=lambda item: -item[1]):
+        out.write(f"  {component:<24} {seconds:>9.3f} s {seconds / total if total else 0:>6.1%}\n")
+    stats.stream = out
+    stats.sort_stats('cumulative').print_stats(re.escape(BOT_DIR), top)
+    return out.getvalue()
+
+
+def dump_tasks() -> str:
+    tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+    out = io.StringIO()
+    out.write(f"{len(tasks)} tasks\n")
+    for task in tasks:
+        out.write('\n')
+        task.print_stack(file=out)
+    return out.getvalue()
+
+
+async def measure_lag(duration: float = 1.0, interval: float = 0.05) -> str:
+    """How late the loop wakes up a sleeping task, sampled every `interval` for `duration` seconds"""
+    samples: List[float] = []
+    end = clock.monotonic() + duration
+    while clock.monotonic() < end:
+        started = clock.monotonic()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, clock.monotonic() - started - interval))
+    samples.sort()
+    return (f"event loop lag over {duration:g} s ({len(samples)} samples): "
+            f"mean {sum(samples) / len(samples) * 1000:.1f} ms, "
+            f"p90 {samples[int(len(samples) * 0.9)] * 1000:.1f} ms, max {samples[-1] * 1000:.1f} ms")
+
+
+class Introspector:
+    """
+    Runtime hooks for a running bot: profiling, task dumps, allocation diffs, loop lag.
+
+    Nothing is measured until asked, so they cost nothing meanwhile. Commands (see HELP)
+    come from the control socket at `host`:`port`, when a port is given, e.g.
+    `echo tasks | nc 127.0.0.1 9465`, and from signals: SIGUSR1 saves a dump and
+    SIGUSR2 starts or stops the profile. Reports are also saved in `directory`.
+    """
+
+    def __init__(self, directory: str | Path = './data/introspect', host: str = '127.0.0.1', port: Optional[int] = None):
+        self.directory = Path(directory)
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.profile: Optional[cProfile.Profile] = None
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self._signals: List[int] = []
+        self._dumps: Set[asyncio.Task] = set()  # Dumps started by a signal, referenced until done
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        for signum, handler in ((getattr(signal, 'SIGUSR1', None), self._on_dump_signal),
+                                (getattr(signal, 'SIGUSR2', None), self._on_profile_signal)):
+            if signum is None:
+                continue
+            try:
+                loop.add_signal_handler(signum, handler)
+                self._signals.append(signum)
+            except (NotImplementedError, RuntimeError):
+                pass  # Not on this platform, or not in the main thread
+        if self.port:
+            self.server = await asyncio.start_server(self._handle, self.host, self.port)
+            logger.info(f"Introspection commands accepted at {self.host}:{self.port} (send 'help')")
+
+    async def close(self) -> None:
+        loop = asyncio.get_running_loop()
+        for signum in self._signals:
+            loop.remove_signal_handler(signum)
+        self._signals.clear()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.profile is not None:
+            logger.info(self.stop_profile())
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    async def command(self, line: str) -> str:
+        words = line.split()
+        if not words:
+            return ''
+        name, args = words[0].lower(), words[1:]
+        try:
+            if name == 'tasks':
+                return dump_tasks()
+            if name == 'lag':
+                return await measure_lag(float(args[0]) if args else 1.0)
+            if name == 'profile' and args and args[0] in ('start', 'stop'):
+                return self.start_profile() if args[0] == 'start' else self.stop_profile()
+            if name == 'memory' and args and args[0] == 'start':
+                return self.start_memory(int(args[1]) if len(args) > 1 else 10)
+            if name == 'memory' and args and args[0] == 'snapshot':
+                return self.memory_growth()
+            if name == 'memory' and args and args[0] == 'stop':
+                return self.stop_memory()
+            if name == 'dump':
+                return f"Saved to {await self.dump()}"
+        except ValueError as e:
+            return f"Invalid argument: {e}"
+        return HELP
+
+    # Profile
+
+    def start_profile(self) -> str:
+        if self.profile is not None:
+            return "Already profiling"
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return "Profiling started"
+
+    def stop_profile(self) -> str:
+        if self.profile is None:
+            return "Not profiling"
+        profile, self.profile = self.profile, None
+        profile.disable()
+        path = self._path('profile', 'prof')
+        profile.dump_stats(path)
+        summary = profile_summary(pstats.Stats(profile))
+        path.with_suffix('.txt').write_text(summary)
+        return f"Profile saved to {path} (python -m pstats {path})\n{summary}"
+
+    # Memory
+
+    def start_memory(self, frames: int = 10) -> str:
+        if tracemalloc.is_tracing():
+            return "Already tracing allocations"
+        tracemalloc.start(frames)
+        self.snapshot = self._take_snapshot()
+        return f"Tracing allocations ({frames} frames); 'memory snapshot' shows what grew"
+
+    def memory_growth(self, top: int = 20) -> str:
+        if not tracemalloc.is_tracing():
+            return "Not tracing allocations ('memory start' first)"
+        snapshot = self._take_snapshot()
+        previous, self.snapshot = self.snapshot, snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced {current / 2**20:.1f} MB (peak {peak / 2**20:.1f} MB); growth since the previous snapshot:"]
+        lines.extend(str(stat) for stat in snapshot.compare_to(previous, 'lineno')[:top])
+        return '\n'.join(lines)
+
+    def stop_memory(self) -> str:
+        if not tracemalloc.is_tracing():
+            return "Not tracing allocations"
+        tracemalloc.stop()
+        self.snapshot = None
+        return "Stopped tracing allocations"
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+
+    # Dump
+
+    async def dump(self) -> Path:
+        parts = [await measure_lag(), dump_tasks()]
+        if tracemalloc.is_tracing():
+            parts.append(self.memory_growth())
+        path = self._path('dump', 'txt')
+        path.write_text('\n\n'.join(parts))
+        return path
+
+    def _on_dump_signal(self) -> None:
+        async def dump():
+            logger.info(f"Introspection dump saved to {await self.dump()}")
+        task = asyncio.ensure_future(dump())
+        self._dumps.add(task)
+        task.add_done_callback(self._dumps.discard)
+
+    def _on_profile_signal(self) -> None:
+        logger.info(self.start_profile() if self.profile is None else self.stop_profile())
+
+    def _path(self, kind: str, suffix: str) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return self.directory / f"{kind}-{clock.now().strftime('%Y%m%d-%H%M%S')}.{suffix}"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                reply = await self.command(line.decode('utf-8', 'replace'))
+                if reply:
+                    writer.write(reply.encode() + b'\n')
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from typing import Dict, List
+
+from telethon import events
+from telethon.errors import FloodWaitError
+
+import clock
+from media_groups import MediaGroupAssembler
+from pipeline import ClonePipeline
+from records import MessageRecord, to_records
+
+logger = logging.getLogger('CloneGram.Live')
+
+
+class LiveMode:
+    """
+    Event-driven continuous mode.
+
+    New messages (and albums) in the origin chats are pushed into their pipelines as
+    soon as Telegram delivers the update. A jump in message IDs (missed updates, e.g.
+    after a reconnect) is filled from history starting at the last queued message.
+    History is only polled when no message of the origin chats was posted or edited for
+    `quiet_interval` (updates of other chats do not count), and is read in pages of `page_size` messages, paced like the other history requests.
+    `pipelines` are the leaders: updates and gap fills of an origin with several
+    destinations are handled once and queued for each of its lanes.
+    """
+
+    def __init__(self, bot, pipelines: List[ClonePipeline], quiet_interval: float = 300, page_size: int = 100):
+        self.bot = bot
+        self.pipelines = pipelines
+        self.quiet_interval = quiet_interval
+        self.page_size = page_size
+        self.routes: Dict[int, List[ClonePipeline]] = {}
+        for pipe in pipelines:
+            self.routes.setdefault(pipe.origin_chat.peer_id, []).append(pipe)
+        self.last_update = clock.monotonic()
+
+    async def run(self) -> None:
+        consumers = []
+        for pipe in self.pipelines:
+            for lane in pipe.lanes:
+                await self.bot._settle_last_run(lane)
+                lane.reset()
+                lane.start_id = lane.last_processed_msg = self.bot._progress(lane)
+                consumers.append(asyncio.create_task(self.bot._consume(lane)))
+            pipe.last_fetched_msg = min(lane.start_id for lane in pipe.lanes)
+
+        chats = list(self.routes)
+        handlers = [
+            (self._on_update, events.MessageEdited(chats=chats)),
+            (self._on_message, events.NewMessage(chats=chats)),
+            (self._on_album, events.Album(chats=chats)),
+        ]
+        for callback, event in handlers:
+            self.bot.add_event_handler(callback, event)
+        logger.info(f"Live mode: listening to {len(chats)} origin chat(s)")
+
+        try:
+            # Anything posted since the last run
+            await self._poll()
+            while True:
+                await asyncio.sleep(self.quiet_interval)
+                self.bot.message_map.flush()
+                self.bot.progress_tracker.flush()
+                if clock.monotonic() - self.last_update >= self.quiet_interval:
+                    logger.info("Update stream is quiet, checking history for missed messages...")
+                    await self._poll()
+        finally:
+            for callback, event in handlers:
+                self.bot.remove_event_handler(callback, event)
+            for consumer in consumers:
+                if not consumer.done():
+                    consumer.cancel()
+            await asyncio.gather(*consumers, return_exceptions=True)
+            self.bot.message_map.flush()
+            self.bot.progress_tracker.flush()
+
+    async def _on_update(self, event) -> None:
+        """An update of an origin chat arrived, so its stream is not quiet"""
+        self.last_update = clock.monotonic()
+
+    async def _on_message(self, event) -> None:
+        await self._on_update(event)
+        # Album members are delivered together by the Album handler
+        if event.message.grouped_id:
+            return
+        for pipe in self.routes.get(event.chat_id, []):
+            record = MessageRecord.from_message(event.message, pipe.origin_chat)
+            await self._enqueue(pipe, [record], record)
+
+    async def _on_album(self, event) -> None:
+        messages = sorted(event.messages, key=lambda m: m.id)
+        for pipe in self.routes.get(event.chat_id, []):
+            records = to_records(messages, pipe.origin_chat)
+            await self._enqueue(pipe, records, ("media_group", str(records[0].grouped_id), records))
+
+    async def _enqueue(self, pipe: ClonePipeline, messages: List, item) -> None:
+        """Queue a live item, filling any gap before it from history"""
+        async with pipe.enqueue_lock:
+            if messages[-1].id <= pipe.last_fetched_msg:
+                return  # Already queued by a gap fill or poll
+
+            if messages[0].id > pipe.last_fetched_msg + 1:
+                await self._fill(pipe, max_id=messages[0].id)
+
+            await self._put(pipe, item)
+
+    async def _fill(self, pipe: ClonePipeline, max_id: int = 0) -> None:
+        """Queue history after the last queued message (up to max_id, exclusive)"""
+        assembler = MediaGroupAssembler()
+        after = pipe.last_fetched_msg
+        try:
+            while True:
+                page = await self.bot._api(
+                    'fetch',
+                    self.bot.get_messages,
+                    entity=pipe.origin_chat,
+                    limit=self.page_size,
+                    min_id=after,
+                    max_id=max_id,
+                    reverse=True,
+                )
+                for message in page:
+                    after = message.id
+                    for item in assembler.feed(MessageRecord.from_message(message, pipe.origin_chat)):
+                        await self._put(pipe, item)
+                if len(page) < self.page_size:
+                    break
+        except FloodWaitError as e:
+            # Drop the partial album; the next poll or event resumes after the last queued item
+            logger.warning(f"FloodWaitError when filling a gap. Waiting {e.seconds} seconds...")
+            await self.bot._wait_for_server(e)
+            return
+        for item in assembler.flush():
+            await self._put(pipe, item)
+
+    async def _put(self, pipe: ClonePipeline, item) -> None:
+        # Filter rules are evaluated locally: updates cannot be filtered by the server
+        await self.bot._queue_item(pipe, item)
+        pipe.last_fetched_msg = item[2][-1].id if isinstance(item, tuple) else item.id
+
+    async def _poll(self) -> None:
+        """Catch up every pipeline with a single request per origin when nothing is new"""
+        for pipe in self.pipelines:
+            async with pipe.enqueue_lock:
+                latest = await self.bot._api('fetch', self.bot.get_last_message, chat=pipe.origin_chat)
+                if latest > pipe.last_fetched_msg:
+                    logger.info(f"[{pipe.name}] {latest - pipe.last_fetched_msg} message(s) to catch up")
+                    await self._fill(pipe)
@@ -0,0 +1,118 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import clock
+
+LOG_FORMAT = '[%(levelname) 5s/%(asctime)s] %(name)s: %(message)s'
+
+logger = logging.getLogger('CloneGram.Summary')
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg (and exc when present)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+    The stock handler formats the record before queueing it, which would keep the
+    string work on the event loop. Log arguments are IDs, counts and strings, so
+    handing the record over as-is is safe.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: str = 'INFO', fmt: str = 'text', use_queue: bool = True) -> Optional[logging.handlers.QueueListener]:
+    """
+    Configure the root logger.
+    With `use_queue`, records are only queued on the event loop; a listener thread
+    formats them and writes to stderr. `fmt` is 'text' or 'json'.
+    """
+    global _listener
+    stop_logging()
+
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+    if not use_queue:
+        root.addHandler(output)
+        return None
+
+    records = queue.SimpleQueue()
+    root.addHandler(DeferredQueueHandler(records))
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def console_handlers() -> List[logging.StreamHandler]:
+    """Handlers writing the log to the console (behind the queue listener, if there is one)"""
+    handlers = logging.getLogger().handlers + (list(_listener.handlers) if _listener is not None else [])
+    return [h for h in handlers if isinstance(h, logging.StreamHandler) and not isinstance(h, logging.FileHandler)]
+
+
+@atexit.register
+def stop_logging() -> None:
+    """Write out what is still queued and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RunSummary:
+    """
+    Per-message events are logged at DEBUG; this keeps their counts and logs one
+    INFO line with totals and rates every `interval` seconds instead.
+    """
+
+    EVENTS = ('fetched', 'filtered', 'forwarded', 'skipped', 'duplicate', 'failed')
+
+    def __init__(self, interval: float = 60.0, clock=clock.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.totals: Dict[str, int] = dict.fromkeys(self.EVENTS, 0)
+        self._last_totals = dict(self.totals)
+        self._last_log = clock()
+
+    def add(self, event: str, n: int = 1) -> None:
+        self.totals[event] += n
+        if self.interval > 0 and self.clock() - self._last_log >= self.interval:
+            self.log()
+
+    def log(self) -> None:
+        """Log the summary line now and start a new interval"""
+        now = self.clock()
+        elapsed = max(now - self._last_log, 1e-9)
+        parts = []
+        for event in self.EVENTS:
+            delta = self.totals[event] - self._last_totals[event]
+            parts.append(f"{event}={self.totals[event]} ({delta / elapsed:.2f}/s)")
+        logger.info("Summary over %.0fs: %s", elapsed, ", ".join(parts))
+        self._last_totals = dict(self.totals)
+        self._last_log = now
@@ -1,21 +1,45 @@
 from settings import Settings
-from rate_limit import TokenBucket
-from progress_tracker import ProgressTracker
+from rate_limit import AdaptiveRates
+from progress_tracker import ProgressTracker, create_progress_backend
 from safety import AntiDetectionSafety
+from pairs import ClonePair, load_pairs
+from pipeline import ClonePipeline
+from records import MessageRecord
+from live_mode import LiveMode
+from peer_cache import PeerCache, CachedPeer
+from archive import MessageArchive
+from dedup import DedupIndex
+from filters import load_filter, parse_date
+from message_map import FAILED, SENT, MessageMap, matches
+from retry import SERVER_WAITS, TRANSIENT_ERRORS, RetryScheduler, is_retryable
+from planner import Planner, backlog_from_chat, synthetic_backlog
+from logging_setup import RunSummary, setup_logging
+from introspection import Introspector
+from metrics import MetricsServer
+from progress_display import ProgressDisplay
+import clock
+import metrics
 
 from telethon import TelegramClient
-from telethon.tl.types import Message, MessageService
-from telethon.errors import FloodWaitError, SlowModeWaitError, ChatWriteForbiddenError
+from telethon.tl.types import Message
+from telethon.errors import (
+    FloodWaitError, SlowModeWaitError, ChatWriteForbiddenError,
+    ChannelInvalidError, ChannelPrivateError, ChatIdInvalidError, PeerIdInvalidError,
+)
 
+import argparse
 import asyncio
+import os
+from collections import deque
+from functools import partial
 from datetime import datetime
 import logging
-from typing import Optional, Dict, List, Set
+from pathlib import Path
+from typing import Optional, Dict, List, Set, Tuple
 
-logging.basicConfig(
-    format='[%(levelname) 5s/%(asctime)s] %(name)s: %(message)s',
-    level=logging.INFO
-)
+settings = Settings()
+
+setup_logging(settings.log_level, settings.log_format, settings.log_queue)
 
 logger = logging.getLogger('CloneGram')
 
@@ -26,50 +50,181 @@ try:
 except ImportError:
     logger.info("uvloop not installed, using the default asyncio event loop.")
 
-settings = Settings()
+# Telegram accepts at most 100 message IDs per forward request
+MAX_FORWARD_BATCH = 100
+
+
+
+def create_rates() -> AdaptiveRates:
+    """
+    Request rates per request type, on top of the safety delays: each starts at its
+    learned rate (or ceiling), halves on FloodWait and creeps back up while accepted
+    """
+    return AdaptiveRates(
+        {
+            'forward': settings.api_rate_limit,
+            'send': settings.api_rate_limit,
+            'fetch': settings.fetch_rate_limit,
+        },
+        settings.rate_state_file,
+        increase=settings.rate_increase,
+        decrease=settings.rate_decrease,
+    )
+
+# State kept in the working directory by older versions, now under ./data by default
+LEGACY_STATE = {
+    'progress_db': ('progress.db', 'progress.db-wal', 'progress.db-shm', 'progress.json'),
+    'message_map_db': ('message_map.db', 'message_map.db-wal', 'message_map.db-shm'),
+    'peer_cache_file': ('peer_cache.json',),
+    'activity_log_file': ('activity_counters.bin', 'activity_counters.json'),
+    'rate_state_file': ('rate_state.json',),
+    'dedup_file': ('dedup.bin', 'dedup.bin.journal'),
+    'archive_dir': ('archive',),
+}
+
+def move_legacy_state() -> None:
+    """Move the state files an older version left in the working directory to their default place, once"""
+    for name, files in LEGACY_STATE.items():
+        path = Path(getattr(settings, name))
+        if path != Path(Settings.model_fields[name].default) or path.exists():
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        for file in files:
+            if Path(file).exists() and not (path.parent / file).exists():
+                os.replace(file, path.parent / file)
+                logger.info(f"Moved {file} to {path.parent}")
+
+# Errors meaning a cached peer (access hash) is no longer valid
+PEER_INVALID_ERRORS = (ChannelInvalidError, ChannelPrivateError, ChatIdInvalidError, PeerIdInvalidError)
 
 class Bot(TelegramClient):
-    def __init__(self):
-        self.messages_queue = asyncio.Queue()
-        self.media_groups: Dict[str, List[Message]] = {}  # Store media groups by grouping ID
-        self.processed_media_groups: Set[str] = set()  # Track processed media groups
-        self.finished_queue = False
+    def __init__(self, read_only: bool = False):
+        """
+        With read_only, only what reading the history needs is set up (the client, the
+        peer cache and the progress tracker): nothing can be sent, and the safety
+        windows, the message map and the optional stores are left untouched.
+        """
+        # One pipeline per origin -> destination pair, all served by this client
+        self.pipelines: Dict[Tuple[int, int], ClonePipeline] = {}
+        # Shared send scheduler: one send at a time across all pipelines (FIFO-fair),
+        # so the global safety limits are checked and recorded consistently
+        self.send_scheduler = asyncio.Lock()
 
-        # Progress tracking
-        self.progress_tracker = ProgressTracker()
-        
-        # Anti-ban safety measures
-        self.safety = AntiDetectionSafety(settings)
+        # Resolved chats persisted across restarts (avoids get_dialogs() on every run)
+        self.peer_cache = PeerCache(settings.peer_cache_file, settings.peer_cache_ttl)
+        self.dialogs_loaded = False
+        self.resolve_requests = 0  # API requests spent resolving chats
 
-        # Rate limiting (based on settings)
-        seconds_in_minute = 60
-        self.rate_limit = 20
-        self.interval = seconds_in_minute / self.rate_limit
-        self.bucket = TokenBucket(
-            initial_tokens=1,
-            max_tokens=self.rate_limit,
-            refill_interval=self.interval
+        # Progress tracking
+        self.progress_tracker = ProgressTracker(
+            backend=create_progress_backend(
+                settings.progress_backend,
+                settings.progress_db if settings.progress_backend == 'sqlite' else None
+            ),
+            flush_every=settings.progress_flush_every,
+            flush_interval=settings.progress_flush_interval,
         )
+        if not read_only:
+            self._setup_sending()
 
         # Initialize TelegramClient
         super().__init__(
             session="./sessions/"+settings.account_name,
             api_id=settings.api_id,
             api_hash=settings.api_hash,
-            flood_sleep_threshold=11,
+            flood_sleep_threshold=settings.flood_sleep_threshold,
             
         )
 
+    def _setup_sending(self) -> None:
+        """State and stores used to clone messages"""
+        # Source -> destination message IDs, with intents recorded before every send
+        self.message_map = MessageMap(
+            settings.message_map_db,
+            flush_every=settings.progress_flush_every,
+            flush_interval=settings.progress_flush_interval,
+        )
+        
+        # Reposts of content already sent are skipped (optional)
+        self.dedup = DedupIndex(
+            settings.dedup_file,
+            capacity=settings.dedup_capacity,
+            recent=settings.dedup_recent,
+            min_text_length=settings.dedup_min_text_length,
+        ) if settings.dedup else None
+
+        # Fetched history kept on disk, read instead of refetching it (optional)
+        self.archive = MessageArchive(settings.archive_dir) if settings.archive else None
+
+        # Filter rules for the pairs without rules of their own, compiled once
+        self.filters = load_filter(settings)
+
+        # Anti-ban safety measures
+        self.safety = AntiDetectionSafety(settings)
+
+        # Per-message events are counted here and summarized periodically at INFO
+        self.summary = RunSummary(settings.log_summary_interval)
+
+        # Progress of the history being cloned, with an ETA under the safety limits
+        self.progress_display = ProgressDisplay(self.safety, settings.progress_display, settings.progress_interval)
+        metrics.QUEUE_DEPTH.set_function(
+            lambda: {(pipe.name,): pipe.messages_queue.qsize() for pipe in self.pipelines.values()}
+        )
+
+        # Rate limiting (based on settings), adapted to the FloodWaits the server returns
+        self.rates = create_rates()
+
+        # Failed sends waiting to be retried, per pair (the other pairs keep sending meanwhile)
+        self.retries = RetryScheduler(
+            base_delay=settings.retry_base_delay,
+            max_delay=settings.retry_max_delay,
+            max_attempts=settings.retry_max_attempts,
+        )
+        metrics.RETRIES_PENDING.set_function(
+            lambda: {(pipe.name,): self.retries.pending(pipe.key) for pipe in self.pipelines.values()}
+        )
+
     async def get_last_message(self, chat):
         """Get the last message ID in a chat"""
         async for message in self.iter_messages(entity=chat, limit=1, min_id=0):
-            logger.info(f"Total messages in the group: {message.id}")
+            logger.debug("Total messages in the group: %s", message.id)
             return message.id
         return 0
 
+    async def _last_message_id(self, pipe: ClonePipeline) -> int:
+        """Newest message ID of a pair's origin, capped at the end of the range being cloned"""
+        latest = await self.get_last_message(pipe.origin_chat)
+        return latest if pipe.max_id is None else min(latest, pipe.max_id)
+
+    async def _message_id_before(self, chat, moment: datetime) -> int:
+        """
+        ID of the last message posted before `moment` (0 if there is none).
+        History requests take an offset date, so Telegram looks the boundary up in its
+        date index and this costs one request however long the chat is.
+        """
+        messages = await self._api('fetch', self.get_messages, entity=chat, limit=1, offset_date=moment)
+        return messages[0].id if messages else 0
+
+    async def _api(self, kind: str, method, **kwargs):
+        """
+        Make a rate-limited request of the given kind ('forward', 'send', 'fetch'),
+        feeding the outcome back to that kind's adaptive rate
+        """
+        waited = await self.rates.acquire(kind)
+        if waited:
+            logger.debug("Preventing API flood, waited %.2f seconds", waited)
+        try:
+            with metrics.API_CALL_SECONDS.labels(method.__name__).time():
+                result = await method(**kwargs)
+        except FloodWaitError as e:
+            self.rates.on_flood(kind, e.seconds)
+            raise
+        self.rates.on_success(kind)
+        return result
+
     async def _get_chat_messages(
         self, 
-        origin_chat,
+        pipe: ClonePipeline,
         offset_id: int = 0,
         limit: int = 100,
         reverse: bool = True,
@@ -79,67 +234,207 @@ class Bot(TelegramClient):
         try:
             if offset_id is None:
                 offset_id = 0
+            if pipe.max_id is not None and offset_id >= pipe.max_id:
+                pipe.finished_queue = True
+                logger.info("Reached the end of the range to clone")
+                return
+
+            archive = self.archive.chat(pipe.origin_chat.id) if self.archive is not None else None
+            if archive is not None and archive.covers(offset_id):
+                await self._read_archived(pipe, archive, offset_id, limit)
+                return
+
+            # Rules Telegram can apply are sent with the request, so what they reject is never downloaded.
+            # With the archive, whole pages are fetched instead, so a filter change needs no refetch
+            rules = pipe.filters
+            params = rules.iter_params() if rules is not None and archive is None else {}
+            searched = 'search' in params
+            if rules is not None and rules.since is not None and not offset_id and offset_date is None:
+                offset_date = rules.since  # Start reading at the first message of the range
 
             message_count = 0
+            page = []
+            # Time spent blocked on the full queue is backpressure, not fetch latency
+            waited = await self.rates.acquire('fetch')
+            if waited:
+                logger.debug("Preventing API flood, waited %.2f seconds before fetching", waited)
+            page_started = clock.monotonic()
+            queue_wait = 0.0
             async for message in self.iter_messages(
-                entity=origin_chat,
+                entity=pipe.origin_chat,
                 limit=limit,
                 offset_id=offset_id,
                 offset_date=offset_date,
                 reverse=reverse,
                 min_id=0,
+                max_id=pipe.max_id + 1 if pipe.max_id is not None else 0,
+                **params,
             ):
+                # Only the fields the pipeline uses are kept from here on
+                message = MessageRecord.from_message(message, pipe.origin_chat)
+                page.append(message)
+                if rules is not None and rules.after_range(message):
+                    pipe.finished_queue = True
+                    logger.info("Reached the end of the filter date range")
+                    break
                 message_count += 1
-                logger.info(f"Fetched message ID: {message.id}")
-                
-                # Check if message is part of a media group
-                if message.grouped_id:
-                    group_id = str(message.grouped_id)
-                    if group_id not in self.processed_media_groups:
-                        if group_id not in self.media_groups:
-                            self.media_groups[group_id] = []
-                        self.media_groups[group_id].append(message)
-                else:
-                    # Regular message, add to queue
-                    await self.messages_queue.put(message)
+                pipe.last_fetched_msg = message.id
+                logger.debug("Fetched message ID: %s", message.id)
+                self.summary.add('fetched')
+                metrics.FETCHED.inc()
+
+                members = [message]
+                if searched and message.grouped_id:
+                    if message.grouped_id == pipe.media_groups.grouped_id:
+                        continue  # Queued with the rest of its album already
+                    members = await self._fetch_album(pipe, message)
+
+                # Albums are held until a message outside the group arrives
+                put_started = clock.monotonic()
+                for member in members:
+                    for item in pipe.media_groups.feed(member):
+                        await self._queue_item(pipe, item, searched)
+                queue_wait += clock.monotonic() - put_started
 
-                if message.id == self.last_msg_id:
-                    self.finished_queue = True
+                if message.id == pipe.last_msg_id:
+                    pipe.finished_queue = True
                     logger.info("All messages fetched")
-                    
-                    # Process any remaining media groups
-                    for group_id, messages in self.media_groups.items():
-                        if group_id not in self.processed_media_groups:
-                            # Sort messages by ID to maintain original order
-                            messages.sort(key=lambda m: m.id)
-                            await self.messages_queue.put(("media_group", group_id, messages))
-                            self.processed_media_groups.add(group_id)
-                    
-                    return
+                    break
+            metrics.FETCH_PAGE_SECONDS.observe(clock.monotonic() - page_started - queue_wait)
+            self.rates.on_success('fetch')
+            if archive is not None and offset_date is None and reverse:
+                archive.append(offset_id, page)
+            if pipe.finished_queue:
+                return
             
             # Se não encontrou mais mensagens ou chegou ao limite
             if message_count == 0:
-                self.finished_queue = True
+                pipe.finished_queue = True
                 logger.info("No more messages to fetch")
             elif message_count < limit:
-                self.finished_queue = True
+                pipe.finished_queue = True
                 logger.info(f"Fetched final {message_count} messages (less than limit)")
             else:
                 logger.info(f"Fetched {message_count} messages, continuing pagination...")
                 
         except FloodWaitError as e:
+            self.rates.on_flood('fetch', e.seconds)
             logger.warning(f"FloodError detected, waiting {e.seconds} seconds...")
-            await asyncio.sleep(e.seconds)
+            await self._wait_for_server(e)
+
+    async def _read_archived(self, pipe: ClonePipeline, archive, offset_id: int, limit: int) -> None:
+        """Queue the next page of history from the local archive (no request is made)"""
+        messages, covered = archive.read(offset_id, limit, pipe.origin_chat)
+        for message in messages:
+            if ((pipe.max_id is not None and message.id > pipe.max_id)
+                    or (pipe.filters is not None and pipe.filters.after_range(message))):
+                pipe.finished_queue = True
+                logger.info("Reached the end of the range to clone")
+                return
+            pipe.last_fetched_msg = message.id
+            self.summary.add('fetched')
+            metrics.FETCHED.inc()
+            for item in pipe.media_groups.feed(message):
+                await self._queue_item(pipe, item)
+            if message.id == pipe.last_msg_id:
+                pipe.finished_queue = True
+                logger.info("All messages fetched")
+                return
+
+        # Past the last archived message, pages are fetched from Telegram again
+        pipe.last_fetched_msg = covered
+        if covered >= pipe.last_msg_id:
+            pipe.finished_queue = True
+            logger.info("All messages fetched")
+        else:
+            logger.debug("Read %d messages from the archive, up to message %s", len(messages), covered)
+
+    async def _fetch_messages(
+        self,
+        pipe: ClonePipeline,
+        offset_id: int = 0,
+        offset_date: Optional[datetime] = None,
+    ) -> None:
+        """
+        Producer task: keep the bounded queue filled ahead of the sender.
+        put() blocks once the queue reaches its high-water mark, so pages are fetched
+        while the sender sleeps in the safety delays, never far ahead of it.
+        Transient errors are retried; any other error (the chat was deleted, access to it
+        was lost...) ends the senders' streams and is raised.
+        """
+        pipe.last_fetched_msg = offset_id or 0
+        # A page waits in memory while the queue is full, so it is not larger than the queue
+        page_size = min(settings.fetch_page_size, pipe.queue_size or settings.fetch_page_size)
+        try:
+            while not pipe.finished_queue:
+                try:
+                    await self._get_chat_messages(
+                        pipe=pipe,
+                        offset_id=pipe.last_fetched_msg,
+                        limit=page_size,
+                        offset_date=offset_date,
+                    )
+                except FloodWaitError as e:
+                    wait_time = e.seconds
+                    logger.warning(f"FloodWaitError when fetching messages. Waiting {wait_time} seconds...")
+                    await self._wait_for_server(e)
+                except TRANSIENT_ERRORS as e:
+                    logger.error(f"Error fetching messages: {e}. Retrying in 5 seconds...")
+                    await asyncio.sleep(5)
+        except Exception as e:
+            logger.error(f"[{pipe.name}] Error fetching messages: {e}. Stopping the pair")
+            for lane in pipe.lanes:
+                await lane.messages_queue.put(None)
+            raise
+
+        # Emit the last album, then the end-of-stream marker for the sender.
+        # With the archive, pages are not searched by Telegram (see _get_chat_messages)
+        searched = self.archive is None and pipe.filters is not None and bool(pipe.filters.search)
+        for item in pipe.media_groups.flush():
+            await self._queue_item(pipe, item, searched)
+        for lane in pipe.lanes:
+            await lane.messages_queue.put(None)
+
+    async def _fetch_album(self, pipe: ClonePipeline, message: MessageRecord) -> List[MessageRecord]:
+        """Every member of a message's album (search results only hold the members that matched)"""
+        # Album members have consecutive IDs and there are at most 10 of them
+        while True:
+            try:
+                around = await self._api('fetch', self.get_messages, entity=pipe.origin_chat,
+                                         ids=list(range(message.id - 9, message.id + 10)))
+                break
+            except FloodWaitError as e:
+                # Already fed back to the fetch rate by _api. Waiting here, instead of raising to
+                # the page being read, keeps the album and does not halve the rate a second time
+                logger.warning(f"FloodWaitError when fetching an album. Waiting {e.seconds} seconds...")
+                await self._wait_for_server(e)
+        return [MessageRecord.from_message(m, pipe.origin_chat)
+                for m in around if m is not None and m.grouped_id == message.grouped_id]
+
+    async def _queue_item(self, pipe: ClonePipeline, item, searched: bool = False) -> None:
+        """
+        Queue an item for the senders of every destination of the pair (the lanes of a
+        fan-out) unless the pair's filter rules reject it
+        """
+        messages = item[2] if isinstance(item, tuple) else [item]
+        if pipe.filters is not None and not pipe.filters.accepts(item, searched):
+            logger.debug("Message(s) %s filtered out", [m.id for m in messages])
+            self._count('filtered', len(messages), album=isinstance(item, tuple))
+            return
+        for lane in pipe.lanes:
+            # A destination that is ahead of the others already has the oldest items
+            if messages[-1].id > lane.start_id:
+                await lane.messages_queue.put(item)
 
     async def _send_media_group(
         self,
         chat_id: int | str,
-        messages: List[Message],
+        messages: List[MessageRecord],
         reply_to_message_id: int | None = None,
     ) -> List[Message] | None:
         """Forward a group of media messages as a group"""
         try:
-            logger.info(f"Forwarding media group with {len(messages)} items")
+            logger.debug("Forwarding media group with %d items", len(messages))
             
             # Para evitar problemas com o limite de batch, garantimos que os media groups 
             # sejam tratados como uma única entidade, não como mensagens individuais
@@ -154,44 +449,33 @@ class Bot(TelegramClient):
                 # Continue with the forwarding even if the safety mechanism fails
                 
             if not messages[0].noforwards:
-                # Se o forwarding é permitido, encaminhe como um grupo
-                # Adicionamos um tratamento de erro mais robusto aqui
-                try:
-                    result = await self.forward_messages(
-                        entity=chat_id,
-                        messages=messages,
-                        from_peer=messages[0].chat.id,
-                        drop_author=True,
-                    )
-                    return result
-                except Exception as e:
-                    logger.error(f"Error forwarding media group: {str(e)}")
-                    # Em caso de erro, tente enviar novamente após um breve intervalo
-                    await asyncio.sleep(5)
-                    return await self.forward_messages(
-                        entity=chat_id,
-                        messages=messages,
-                        from_peer=messages[0].chat.id,
-                        drop_author=True,
-                    )
+                # Se o forwarding é permitido, encaminhe como um grupo.
+                # Errors are raised: a blind retry could duplicate an album whose request
+                # was applied, so the caller checks the destination instead
+                return await self._api(
+                    'forward',
+                    self.forward_messages,
+                    entity=chat_id,
+                    messages=[message.id for message in messages],
+                    from_peer=messages[0].chat.id,
+                    drop_author=True,
+                )
             else:
                 # If forwarding is not allowed, inform and skip
                 logger.warning(f"Media group cannot be forwarded due to forward restrictions")
                 return None
                 
-        except FloodWaitError as e:
-            wait_time = e.seconds
-            logger.warning(f"FloodWaitError detected. Waiting {wait_time} seconds...")
-            await asyncio.sleep(wait_time)
-            return None
+        except (FloodWaitError, SlowModeWaitError):
+            # Nothing was delivered; the caller schedules the album again
+            raise
         except Exception as e:
             logger.error(f"Error sending media group: {str(e)}")
-            return None
+            raise
 
     async def _forward_message(
         self,
         chat_id: int | str,
-        message: Message,
+        message: MessageRecord,
         reply_to_message_id: int | None = None,
         group_policy: bool = False,
     ) -> Message | None:
@@ -210,9 +494,11 @@ class Bot(TelegramClient):
                 # Continue with the forwarding even if the safety mechanism fails
                 
             if not message.noforwards and not group_policy: 
-                return await self.forward_messages(
+                return await self._api(
+                    'forward',
+                    self.forward_messages,
                     entity=chat_id,
-                    messages=message,
+                    messages=message.id,
                     from_peer=message.chat.id,
                     drop_author=True,
                 )
@@ -227,7 +513,9 @@ class Bot(TelegramClient):
                                 if button.url:
                                     text += f"\n**[Access]({button.url})**"
                                     
-                    return await self.send_message(
+                    return await self._api(
+                        'send',
+                        self.send_message,
                         entity=chat_id,
                         message=text,
                         reply_to=reply_to_message_id,
@@ -235,165 +523,447 @@ class Bot(TelegramClient):
                 else:
                     logger.warning(f"Cannot forward message ID {message.id} (protected content)")
                     return None
-        except FloodWaitError as e:
-            wait_time = e.seconds
-            logger.warning(f"FloodWaitError. Waiting {wait_time} seconds...")
-            await asyncio.sleep(wait_time)
-            return None
+        except (FloodWaitError, SlowModeWaitError):
+            # Nothing was delivered; the caller schedules the message again
+            raise
         except Exception as e:
             logger.error(f"Unexpected error forwarding message {message.id}: {str(e)}")
-            return None
+            raise
 
     async def _process_message(
         self, 
         destiny_chat,
         origin_chat,
-        message: Message,
+        message: MessageRecord,
         topic_id: Optional[int] = None
     ) -> Message | None:
         """Process individual messages"""
         # Skip service messages
-        if isinstance(message, MessageService):
-            logger.info(f"Skipping message ID {message.id} as it's a service message.")
+        if message.service:
+            logger.debug("Skipping message ID %s as it's a service message.", message.id)
             return None
         
+        logger.debug("Forwarding message_id: %s", message.id)
+        return await self._forward_message(
+            chat_id=destiny_chat,
+            message=message,
+            reply_to_message_id=topic_id,
+            group_policy=origin_chat.noforwards
+        )
+
+    async def _wait_for_server(self, e) -> None:
+        """Sleep for a FloodWait/SlowMode error, accounting the time in the metrics"""
+        await asyncio.sleep(e.seconds)
+        metrics.SERVER_WAIT_SECONDS.labels(type(e).__name__).inc(e.seconds)
+
+    def _retry_later(self, pipe: ClonePipeline, items: List, error: Exception) -> bool:
+        """
+        Schedule queue items that failed with `error` to be sent again, returning False
+        when they have to be given up (permanent error or attempts exhausted)
+        """
+        delay = self.retries.schedule(pipe.key, items, error)
+        if delay is None:
+            return False
+        if isinstance(error, SERVER_WAITS):
+            metrics.SERVER_WAIT_SECONDS.labels(type(error).__name__).inc(error.seconds)
+        metrics.RETRIES.labels(type(error).__name__).inc()
+        messages = [m for item in items for m in (item[2] if isinstance(item, tuple) else [item])]
+        logger.warning(f"[{pipe.name}] {type(error).__name__} when sending message(s) "
+                       f"{messages[0].id}-{messages[-1].id}. Retrying in {delay:.0f} seconds...")
+        return True
+
+    def _progress(self, pipe: ClonePipeline) -> int:
+        """Last origin message handled for a pair's destination"""
+        return self.progress_tracker.get_progress(pipe.origin_chat.id, pipe.destiny_chat.id)
+
+    def _resume_point(self, pipe: ClonePipeline) -> int:
+        """Where a pair's history is fetched from: the earliest checkpoint of its destinations"""
+        return min(self._progress(lane) for lane in pipe.lanes)
+
+    def _checkpoint(self, pipe: ClonePipeline, msg_id: int) -> None:
+        """Record that the messages of a pair up to `msg_id` were handled"""
+        self.progress_display.advance(msg_id - pipe.last_processed_msg)
+        pipe.last_processed_msg = msg_id
+        self.progress_tracker.save_progress(pipe.origin_chat.id, msg_id, pipe.destiny_chat.id)
+        self.retries.forget(pipe.key, msg_id)
+
+    def _count(self, result: str, messages: int = 1, album: bool = False) -> None:
+        """Count sent items for the log summary and the metrics"""
+        self.summary.add(result, messages)
+        if result == 'forwarded':
+            self.progress_display.count_sent(messages)
+        metrics.ITEMS.labels('album' if album else 'message', result).inc(1 if album else messages)
+
+    def _can_batch(self, message: MessageRecord, origin_chat) -> bool:
+        """Whether a message may be forwarded as part of a batch"""
+        return (
+            settings.forward_batch_size > 1
+            and not message.service
+            and not message.noforwards
+            and not origin_chat.noforwards
+        )
+
+    def _note_destiny_messages(self, pipe: ClonePipeline, result) -> None:
+        """Remember the newest message ID we created in the destination chat"""
+        if result is None:
+            return
+        for sent in result if isinstance(result, list) else [result]:
+            if sent is not None and getattr(sent, 'id', None) and sent.id > (pipe.last_destiny_msg_id or 0):
+                pipe.last_destiny_msg_id = sent.id
+
+    async def _settle_in_doubt(
+        self,
+        pipe: ClonePipeline,
+        undelivered: Optional[int] = None,
+    ) -> Tuple[List[Message], List[int]]:
+        """
+        Settle the unacknowledged sends of a pair (interrupted by a crash or an ambiguous
+        error) by looking for their messages in the destination.
+        Messages found there are acknowledged with their destination IDs; the others are
+        recorded with the `undelivered` state or, when it is None, left unrecorded so they
+        are sent again. Returns the destination messages found and the source IDs not delivered.
+        """
+        intents = self.message_map.in_doubt(pipe.key)
+        if not intents:
+            return [], []
+
+        # Other members may have posted in between, so the history is read page by page
+        # until it holds twice as many messages of ours as were in doubt, or ends
+        expected = sum(len(intent.source_ids) for intent in intents)
+        candidates = []
+        async for sent in self.iter_messages(
+            pipe.destiny_chat,
+            min_id=min(intent.after_id for intent in intents),
+            reverse=True,
+        ):
+            if sent.out:
+                candidates.append(sent)
+                if len(candidates) >= expected * 2:
+                    break
+
+        # Requests were made in order, so their messages are matched in order
+        found, missing = [], []
+        position = 0
+        for intent in intents:
+            outcome = {}
+            for source_id, fingerprint in zip(intent.source_ids, intent.fingerprints):
+                for index in range(position, len(candidates)):
+                    sent = candidates[index]
+                    if sent.id > intent.after_id and matches(fingerprint, sent):
+                        outcome[source_id] = (SENT, [sent.id])
+                        found.append(sent)
+                        position = index + 1
+                        break
+                else:
+                    missing.append(source_id)
+                    if undelivered is not None:
+                        outcome[source_id] = (undelivered, [])
+            self.message_map.settle(intent, outcome)
+        self._note_destiny_messages(pipe, found)
+        return found, missing
+
+    async def _settle_last_run(self, pipe: ClonePipeline) -> None:
+        """
+        Settle the sends a previous run left in doubt before resuming a pair, moving its
+        checkpoint back before any message that has to be sent again
+        """
+        if pipe.last_destiny_msg_id is None:
+            pipe.last_destiny_msg_id = await self.get_last_message(pipe.destiny_chat)
+        found, missing = await self._settle_in_doubt(pipe)
+        if not found and not missing:
+            return
+        logger.info(f"[{pipe.name}] Unacknowledged sends of the last run: {len(found)} message(s) "
+                    f"found in the destination, {len(missing)} to send again")
+        if missing:
+            origin_id, destiny_id = pipe.origin_chat.id, pipe.destiny_chat.id
+            checkpoint = min(missing) - 1
+            if checkpoint < self.progress_tracker.get_progress(origin_id, destiny_id):
+                self.progress_tracker.save_progress(origin_id, checkpoint, destiny_id)
+
+    async def _send_tracked(self, pipe: ClonePipeline, messages: List[MessageRecord], send):
+        """
+        Make a send request for `messages` (the `send` coroutine function) under the
+        intent/ack protocol of the message map. FloodWait/SlowMode errors are raised, as
+        nothing was delivered. After any other error the destination is checked, since the
+        request may have been applied: the messages found are returned, otherwise the
+        error is raised, and the messages are recorded as failed unless they will be retried.
+        """
+        intent = self.message_map.intend(pipe.key, messages, pipe.last_destiny_msg_id or 0)
         try:
-            logger.info(f"Forwarding message_id: {message.id}")
-            return await self._forward_message(
-                chat_id=destiny_chat.id,
-                message=message,
-                reply_to_message_id=topic_id,
-                group_policy=origin_chat.noforwards
+            async with self.send_scheduler:
+                result = await send()
+        except (FloodWaitError, SlowModeWaitError):
+            self.message_map.drop(intent)
+            raise
+        except Exception as e:
+            logger.error(f"Error sending message(s) {[m.id for m in messages]}: {e}. Checking the destination...")
+            retry = self.retries.will_retry(pipe.key, messages, e)
+            found, _ = await self._settle_in_doubt(pipe, undelivered=None if retry else FAILED)
+            if not found:
+                raise
+            return found
+
+        if result is None:
+            self.message_map.skip(intent)
+        else:
+            self.message_map.ack(intent, result if isinstance(result, list) else [result])
+            self._remember_content(pipe, messages, result)
+        self._note_destiny_messages(pipe, result)
+        return result
+
+    def _remember_content(self, pipe: ClonePipeline, messages: List[MessageRecord], result) -> None:
+        """Add the messages that were delivered to the dedup index"""
+        if self.dedup is not None:
+            results = result if isinstance(result, list) else [result]
+            self.dedup.add(pipe.destiny_chat.id, [m for m, sent in zip(messages, results) if sent is not None])
+
+    def _is_duplicate(self, pipe: ClonePipeline, item) -> bool:
+        """Whether a queued item (a whole album at once) only repeats content already sent"""
+        if self.dedup is None or (not isinstance(item, tuple) and item.service):
+            return False
+        messages = item[2] if isinstance(item, tuple) else [item]
+        return self.dedup.is_duplicate(pipe.destiny_chat.id, messages)
+
+    def _is_settled(self, pipe: ClonePipeline, item) -> bool:
+        """Whether a queued item was already sent (or skipped) before, e.g. by a run that crashed"""
+        messages = item[2] if isinstance(item, tuple) else [item]
+        return self.message_map.is_settled(pipe.key, [message.id for message in messages])
+
+    async def _forward_batch(self, pipe: ClonePipeline, messages: List[MessageRecord]) -> Set[int]:
+        """
+        Forward consecutive messages in a single request and return the IDs of those delivered.
+        Every message delivered still counts against the hourly, daily and media limits; the
+        others are counted when they are sent again.
+        FloodWait and SlowMode errors are raised to the caller, since nothing was delivered.
+        """
+        media_count = sum(1 for message in messages if message.media is not None)
+        can_proceed = await self.safety.apply_delay(count=len(messages), media_count=media_count, record=False)
+        if not can_proceed:
+            return set()
+
+        logger.debug("Forwarding batch of %d messages (%s-%s)", len(messages), messages[0].id, messages[-1].id)
+        intent = self.message_map.intend(pipe.key, messages, pipe.last_destiny_msg_id or 0)
+        try:
+            result = await self._api(
+                'forward',
+                self.forward_messages,
+                entity=pipe.destiny_chat,
+                messages=[message.id for message in messages],
+                from_peer=messages[0].chat.id,
+                drop_author=True,
             )
-        except FloodWaitError as e:
-            wait_time = e.seconds
-            logger.warning(f"FloodWaitError. Waiting {wait_time} seconds...")
-            await asyncio.sleep(wait_time)
-            return None
+        except (FloodWaitError, SlowModeWaitError):
+            self.message_map.drop(intent)
+            raise
+        except Exception as e:
+            # The request may have been applied before the error; check what actually arrived.
+            # Messages not found stay unrecorded and are sent again one by one
+            logger.error(f"Error forwarding batch: {e}. Checking which messages arrived...")
+            # Any of them may be missing, not only the last ones
+            found, missing = await self._settle_in_doubt(pipe)
+            logger.info(f"{len(found)}/{len(messages)} messages of the batch arrived")
+            delivered = {message.id for message in messages} - set(missing)
+            self._record_delivered([message for message in messages if message.id in delivered])
+            return delivered
+
+        missing = [message.id for message, sent in zip(messages, result) if sent is None]
+        if missing:
+            logger.warning(f"Messages {missing} could not be forwarded and were skipped")
+        self.message_map.ack(intent, result)
+        self._record_delivered([message for message, sent in zip(messages, result) if sent is not None])
+        self._remember_content(pipe, messages, result)
+        self._note_destiny_messages(pipe, result)
+        return {message.id for message in messages}
+
+    def _record_delivered(self, messages: List[MessageRecord]) -> None:
+        """Count the messages of a batch that arrived against the safety limits"""
+        if messages:
+            self.safety.record_sent(len(messages), sum(1 for message in messages if message.media is not None))
 
     async def _process_messages(
         self,
-        origin_chat,
-        destiny_chat,
-        topic_id: Optional[int] = None,
+        pipe: ClonePipeline,
         offset_id: int = 0,
         offset_date: Optional[datetime] = None
     ) -> None:
-        """Process messages from the queue and forward them to the destination"""
-        self.last_processed_msg = offset_id
-        self.last_msg_id = await self.get_last_message(origin_chat)
+        """
+        Process messages from the queue and forward them to the destination (to every
+        destination of a fan-out, fetching from the earliest of their checkpoints)
+        """
+        for lane in pipe.lanes:
+            lane.start_id = lane.last_processed_msg = max(offset_id or 0, self._progress(lane))
+        pipe.last_msg_id = await self._last_message_id(pipe)
+        self.progress_display.add_total(sum(max(0, pipe.last_msg_id - lane.start_id) for lane in pipe.lanes))
+
+        # Fetching runs concurrently; the queues' maxsize applies backpressure to it, so
+        # it never runs further ahead than the slowest destination's queue
+        fetcher = asyncio.create_task(
+            self._fetch_messages(pipe=pipe, offset_id=offset_id, offset_date=offset_date)
+        )
+
+        try:
+            await asyncio.gather(*(self._consume(lane) for lane in pipe.lanes))
+        finally:
+            if not fetcher.done():
+                fetcher.cancel()
+            await asyncio.gather(fetcher, return_exceptions=True)
+        if not fetcher.cancelled() and fetcher.exception() is not None:
+            # What was fetched before the error was sent; the pair stops here
+            self.message_map.flush()
+            self.progress_tracker.flush()
+            raise fetcher.exception()
 
-        # Adicionamos uma flag para garantir que não vamos quebrar media groups entre batches
-        current_media_group_processing = False
+        if pipe.filters is not None and pipe.finished_queue:
+            for lane in pipe.lanes:
+                if pipe.last_fetched_msg > lane.last_processed_msg:
+                    # Everything fetched after the last sent message was filtered out
+                    self._checkpoint(lane, pipe.last_fetched_msg)
+        self.message_map.flush()
+        self.progress_tracker.flush()
+        self.summary.log()
+        logger.info(f"All messages processed for {', '.join(lane.name for lane in pipe.lanes)}")
+
+    async def _consume(self, pipe: ClonePipeline) -> None:
+        """Send stage: forward queued items in order until the end-of-stream marker"""
+        origin_chat = pipe.origin_chat
+        destiny_chat = pipe.destiny_chat
+        topic_id = pipe.topic_id
+
+        # Items to handle before reading the queue again: retries that came due and the
+        # look-ahead item that ended a forward batch. Retries are put in front rather than
+        # re-queued, so order is kept and the sender never blocks on its own full queue
+        pending = deque()
+        # Messages up to this ID are sent one by one (remainder of a partially delivered batch)
+        unbatched_until = 0
+        self.retries.clear(pipe.key)
 
         while True:
-            if self.messages_queue.empty():
-                if self.finished_queue:
+            item = None
+            try:
+                if self.retries.pending(pipe.key):
+                    # Everything after a failed item waits for its retry; other pairs keep sending
+                    pending.extendleft(reversed(await self.retries.take(pipe.key)))
+                if pending:
+                    item = pending.popleft()
+                else:
+                    item = await pipe.messages_queue.get()
+                    pipe.messages_queue.task_done()
+                if item is None:
                     break
-                
-                logger.info("All messages processed, fetching more...")
-                try:
-                    await self._get_chat_messages(
-                        origin_chat=origin_chat,
-                        offset_id=self.last_processed_msg,
-                        offset_date=offset_date,
-                    )
-                except FloodWaitError as e:
-                    wait_time = e.seconds
-                    logger.warning(f"FloodWaitError when fetching messages. Waiting {wait_time} seconds...")
-                    await asyncio.sleep(wait_time)
+
+                if self._is_settled(pipe, item):
+                    # Sent by a previous run after its last checkpoint
+                    last_id = item[2][-1].id if isinstance(item, tuple) else item.id
+                    logger.debug("Message(s) up to %s already sent, skipping", last_id)
+                    self._checkpoint(pipe, last_id)
                     continue
-                
-                # Process any media groups that were collected
-                for group_id, messages in list(self.media_groups.items()):
-                    if group_id not in self.processed_media_groups:
-                        # Sort messages by ID to maintain original order
-                        messages.sort(key=lambda m: m.id)
-                        await self.messages_queue.put(("media_group", group_id, messages))
-                        self.processed_media_groups.add(group_id)
-                        del self.media_groups[group_id]
 
-            try:
-                # Basic rate limiting is still applied to prevent API errors
-                # IMPORTANTE: Se estamos no meio de um media group, não fazemos o rate limiting
-                # para evitar que o grupo seja dividido
-                if not current_media_group_processing:
-                    while not self.bucket.consume():
-                        logger.info(f"Preventing API flood, waiting {self.interval} seconds")
-                        await asyncio.sleep(self.interval)
-                
-                # The more sophisticated safety delays are applied in the send methods
+                if self._is_duplicate(pipe, item):
+                    # Neither a send request nor a slot of the safety limits is spent on it
+                    messages = item[2] if isinstance(item, tuple) else [item]
+                    logger.debug("Message(s) %s repeat content already sent, skipping", [m.id for m in messages])
+                    media = sum(1 for m in messages if m.media is not None)
+                    self.dedup.note_saved(len(messages), media, self.safety.expected_delay())
+                    self._count('duplicate', len(messages), album=isinstance(item, tuple))
+                    self._checkpoint(pipe, messages[-1].id)
+                    continue
+
+                # Rate limiting (one token per request) and the more sophisticated safety
+                # delays are applied in the send methods
 
-                item = await self.messages_queue.get()
-                
                 # Check if it's a media group
                 if isinstance(item, tuple) and item[0] == "media_group":
                     _, group_id, messages = item
-                    current_media_group_processing = True  # Estamos processando um media group
-                    try:
-                        result = await self._send_media_group(
-                            chat_id=destiny_chat.id,
-                            messages=messages,
-                            reply_to_message_id=topic_id,
-                        )
-                        
-                        if result is None:
-                            # For protected content, we just continue
-                            latest_msg_id = max(msg.id for msg in messages)
-                            self.last_processed_msg = latest_msg_id
-                            self.progress_tracker.save_progress(origin_chat.id, latest_msg_id)
+                    # A failed album raises (and is recorded as failed in the message map unless
+                    # it is retried) instead of being checkpointed as if it had been sent
+                    result = await self._send_tracked(pipe, messages, partial(
+                        self._send_media_group,
+                        chat_id=destiny_chat,
+                        messages=messages,
+                        reply_to_message_id=topic_id,
+                    ))
+
+                    # For protected content (result None), we just continue
+                    self._count('skipped' if result is None else 'forwarded', len(messages), album=True)
+                    # Update progress with the latest message ID in the group
+                    self._checkpoint(pipe, max(msg.id for msg in messages))
+
+                    # Adicionamos um pequeno delay entre grupos de mídia
+                    await asyncio.sleep(2)
+                elif item.id > unbatched_until and self._can_batch(item, origin_chat):
+                    # Gather the consecutive forwardable messages that are already queued
+                    batch = [item]
+                    batch_limit = min(settings.forward_batch_size, MAX_FORWARD_BATCH, max(1, self.safety.capacity()))
+                    # The daily media budget only limits how many media messages join the batch
+                    media_left = max(1, self.safety.capacity(is_media=True)) - (item.media is not None)
+                    while len(batch) < batch_limit:
+                        if pending:
+                            candidate = pending.popleft()
                         else:
-                            # Update progress with the latest message ID in the group
-                            latest_msg_id = max(msg.id for msg in messages)
-                            self.last_processed_msg = latest_msg_id
-                            self.progress_tracker.save_progress(origin_chat.id, latest_msg_id)
-                        
-                        # Adicionamos um pequeno delay entre grupos de mídia
-                        await asyncio.sleep(2)
-                        
-                    except FloodWaitError as e:
-                        wait_time = e.seconds
-                        logger.warning(f"FloodWaitError when sending media group. Waiting {wait_time} seconds...")
-                        await asyncio.sleep(wait_time)
-                        # Put the item back in the queue to try again later
-                        await self.messages_queue.put(item)
-                    finally:
-                        current_media_group_processing = False  # Terminamos de processar o media group
+                            try:
+                                candidate = pipe.messages_queue.get_nowait()
+                            except asyncio.QueueEmpty:
+                                break
+                            pipe.messages_queue.task_done()
+                        if (candidate is None or isinstance(candidate, tuple)
+                                or not self._can_batch(candidate, origin_chat) or self._is_settled(pipe, candidate)
+                                or self._is_duplicate(pipe, candidate)
+                                or (candidate.media is not None and media_left <= 0)):
+                            pending.appendleft(candidate)
+                            break
+                        media_left -= candidate.media is not None
+                        batch.append(candidate)
+
+                    try:
+                        async with self.send_scheduler:
+                            delivered = await self._forward_batch(pipe, batch)
+                    except SERVER_WAITS as e:
+                        # Nothing was delivered; the whole batch is retried after the wait
+                        self._retry_later(pipe, batch, e)
+                        continue
+
+                    if delivered:
+                        self._count('forwarded', len(delivered))
+                    # The checkpoint only moves past the delivered messages that come before the first gap
+                    prefix = 0
+                    while prefix < len(batch) and batch[prefix].id in delivered:
+                        prefix += 1
+                    if prefix:
+                        self._checkpoint(pipe, batch[prefix - 1].id)
+                    remainder = [message for message in batch if message.id not in delivered]
+                    if remainder:
+                        # Send the rest one by one so a bad message cannot stall the batch forever
+                        unbatched_until = remainder[-1].id
+                        pending.extendleft(reversed(remainder))
                 else:
                     # Regular message
                     message = item
                     try:
-                        await self._process_message(
-                            destiny_chat=destiny_chat, 
+                        send = partial(
+                            self._process_message,
+                            destiny_chat=destiny_chat,
                             origin_chat=origin_chat,
                             message=message,
                             topic_id=topic_id,
                         )
-                        self.last_processed_msg = message.id
-                        self.progress_tracker.save_progress(origin_chat.id, message.id)
-                    except FloodWaitError as e:
-                        wait_time = e.seconds
-                        logger.warning(f"FloodWaitError when sending message {message.id}. Waiting {wait_time} seconds...")
-                        await asyncio.sleep(wait_time)
-                        # Put the message back in the queue to try again
-                        await self.messages_queue.put(message)
-                    except SlowModeWaitError as e:
-                        wait_time = e.seconds
-                        logger.warning(f"SlowModeWaitError for message {message.id}. Waiting {wait_time} seconds...")
-                        await asyncio.sleep(wait_time)
-                        await self.messages_queue.put(message)
+                        if message.service:
+                            result = await send()  # Skipped without any request
+                        else:
+                            result = await self._send_tracked(pipe, [message], send)
+                        self._count('skipped' if result is None else 'forwarded')
+                        self._checkpoint(pipe, message.id)
                     except ChatWriteForbiddenError:
+                        self._count('failed')
                         logger.error(f"No permission to write in the destination chat. Skipping message {message.id}")
-        
+
             except Exception as e:
+                if item is not None and is_retryable(e) and self._retry_later(pipe, [item], e):
+                    continue
+                messages = item[2] if isinstance(item, tuple) else [item]
+                self._count('failed', len(messages), album=isinstance(item, tuple))
                 logger.error(f"Unexpected error processing message: {e}")
                 # Continue processing other messages
                 continue
-            
-            finally:
-                self.messages_queue.task_done()
-
-        logger.info("All messages processed")
 
     async def clone_messages(
         self, 
@@ -401,89 +971,203 @@ class Bot(TelegramClient):
         destiny_group_id: int|str,
         topic_id: Optional[int] = None,
         offset_id: Optional[int] = None,
-        offset_date: Optional[datetime] = None
+        offset_date: Optional[datetime] = None,
+        until: Optional[datetime] = None,
     ) -> None:
         """Main method to clone messages from one group to another"""
-        # Get open dialogs, in case it's a private chat, etc...
-        await self.get_dialogs()
+        await self.clone_pairs(
+            [ClonePair(origin_group_id, destiny_group_id, topic_id)],
+            offset_id=offset_id,
+            offset_date=offset_date,
+            until=until,
+        )
 
-        try:
-            origin_chat = await self.get_entity(origin_group_id)
-            logger.info(f"Origin group: {origin_chat.title if hasattr(origin_chat, 'title') else origin_chat.id} is connected")
-        except Exception as e:
-            logger.error(f"Error with origin chat: {e}")
-            return
+    async def _resolve_chat(self, chat: int | str) -> CachedPeer:
+        """Resolve a configured chat, using the persistent peer cache when possible"""
+        peer = self.peer_cache.get(chat)
+        if peer is not None:
+            return peer
 
+        if not self.dialogs_loaded:
+            # Get open dialogs, in case it's a private chat, etc...
+            await self.get_dialogs()
+            self.dialogs_loaded = True
+            self.resolve_requests += 1
+        entity = await self.get_entity(chat)
+        self.resolve_requests += 1
+        return self.peer_cache.put(chat, entity)
+
+    async def _get_pipeline(self, pair: ClonePair, queue_size: int) -> ClonePipeline | None:
+        """
+        Resolve the chats of a pair and return its pipeline. With several destinations,
+        this is the leader, whose lanes are the pipelines of every destination resolved.
+        """
         try:
-            destiny_chat = await self.get_entity(destiny_group_id)
-            logger.info(f"Destiny group is connected")
+            origin_chat = await self._resolve_chat(pair.origin)
+            logger.info(f"Origin group: {origin_chat.title or origin_chat.id} is connected")
         except Exception as e:
-            logger.error(f"Error with destiny chat: {e}")
-            return
+            logger.error(f"Error with origin chat {pair.origin}: {e}")
+            return None
+
+        filters = pair.filters or self.filters
+        if filters is not None:
+            try:
+                await filters.resolve(self)
+            except Exception as e:
+                logger.error(f"Error resolving the senders of the filter rules for {pair}: {e}")
+                return None
+
+        lanes = []
+        for destiny in pair.destinies:
+            try:
+                destiny_chat = await self._resolve_chat(destiny)
+                logger.info(f"Destiny group {destiny_chat.title or destiny_chat.id} is connected")
+            except Exception as e:
+                logger.error(f"Error with destiny chat {destiny}: {e}")
+                continue
+
+            key = (origin_chat.id, destiny_chat.id)
+            pipe = self.pipelines.get(key)
+            if pipe is None:
+                pipe = ClonePipeline(origin_chat, destiny_chat, pair.topic_id, queue_size)
+                self.pipelines[key] = pipe
+            else:
+                pipe.origin_chat, pipe.destiny_chat = origin_chat, destiny_chat
+            pipe.filters = filters
+            lanes.append(pipe)
+        if not lanes:
+            return None
+
+        # The first destination's pipeline fetches for all of them
+        leader = lanes[0]
+        for lane in lanes:
+            lane.leader, lane.lanes = leader, [lane]
+        leader.lanes = lanes
+        return leader
+
+    async def clone_pairs(
+        self,
+        pairs: List[ClonePair],
+        offset_id: Optional[int] = None,
+        offset_date: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> None:
+        """
+        Clone every pair concurrently over this single connection.
+        offset_date/until restrict the history to a date range (see _clone_pipeline).
+        """
+        # The prefetch budget is shared, so memory does not grow with the number of destinations:
+        # each pipeline queues its share and fetches pages no larger than it (see _fetch_messages)
+        destinations = sum(len(pair.destinies) for pair in pairs)
+        queue_size = max(1, settings.prefetch_queue_size // destinations)
 
+        requests_before = self.resolve_requests
+        resolved = []
+        for pair in pairs:
+            pipe = await self._get_pipeline(pair, queue_size)
+            if pipe is not None:
+                resolved.append((pair, pipe))
+        logger.info(f"Resolved {len(resolved)} pair(s) with {self.resolve_requests - requests_before} API request(s)")
+
+        results = await asyncio.gather(
+            *(self._clone_pipeline(pipe, offset_id, offset_date, until) for _, pipe in resolved),
+            return_exceptions=True,
+        )
+        for (pair, pipe), result in zip(resolved, results):
+            if isinstance(result, PEER_INVALID_ERRORS):
+                # The cached peer is no longer usable; resolve it again on the next run
+                logger.warning(f"Peer error for {pipe.name}: {result}. Refreshing cached peers")
+                self.peer_cache.invalidate(pair.origin)
+                for destiny in pair.destinies:
+                    self.peer_cache.invalidate(destiny)
+            elif isinstance(result, Exception):
+                logger.error(f"Error cloning {pipe.name}: {result}")
+        self.progress_display.close()
+
+    async def run_live(self) -> None:
+        """Stream new messages of every resolved pair as they are posted"""
+        leaders = [pipe for pipe in self.pipelines.values() if pipe.leader is pipe]
+        await LiveMode(self, leaders, settings.check_interval, settings.fetch_page_size).run()
+
+    async def _clone_pipeline(
+        self,
+        pipe: ClonePipeline,
+        offset_id: Optional[int] = None,
+        offset_date: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> None:
+        """
+        Run one clone pass for a pair (and all of its destinations).
+        With offset_date, the pair's checkpoint is moved to the last message posted
+        before it; with until, cloning stops at the last message posted before that
+        date, on this pass and the following ones.
+        """
+        for lane in pipe.lanes:
+            await self._settle_last_run(lane)
+        if until is not None:
+            pipe.max_id = await self._message_id_before(pipe.origin_chat, until)
+            logger.info(f"[{pipe.name}] Cloning up to message {pipe.max_id} (posted before {until:%Y-%m-%d %H:%M %Z})")
+        if offset_date is not None:
+            start_id = await self._message_id_before(pipe.origin_chat, offset_date)
+            logger.info(f"[{pipe.name}] Starting after message {start_id} (posted before {offset_date:%Y-%m-%d %H:%M %Z})")
+            for lane in pipe.lanes:
+                self.progress_tracker.save_progress(lane.origin_chat.id, start_id, lane.destiny_chat.id)
+            self.progress_tracker.flush()
+            offset_date = None  # The checkpoint holds the start now
         # Se estamos começando do zero (primeira execução)
-        if offset_id is None and not self.progress_tracker.get_progress(origin_chat.id):
-            logger.info("Primeira execução, processando todas as mensagens...")
-            self.finished_queue = False  # Garantir que a flag está resetada
+        if offset_id is None and not self._resume_point(pipe):
+            logger.info(f"Primeira execução de {pipe.name}, processando todas as mensagens...")
+            for lane in pipe.lanes:
+                lane.reset()  # Garantir que a flag está resetada
             await self._process_messages(
-                destiny_chat=destiny_chat,
-                origin_chat=origin_chat,
-                topic_id=topic_id,
+                pipe=pipe,
                 offset_id=offset_id,
                 offset_date=offset_date,
             )
         else:
             # Para execuções subsequentes, use o método otimizado
             await self.check_and_clone_new_messages(
-                origin_chat=origin_chat,
-                destiny_chat=destiny_chat,
-                topic_id=topic_id,
+                pipe=pipe,
                 offset_date=offset_date
             )
 
     async def check_and_clone_new_messages(
         self,
-        origin_chat,
-        destiny_chat,
-        topic_id: Optional[int] = None,
+        pipe: ClonePipeline,
         offset_date: Optional[datetime] = None
     ) -> None:
         """Verifica e clona apenas mensagens novas"""
         
-        # Obter o último ID processado
-        last_processed_id = self.progress_tracker.get_progress(origin_chat.id)
+        # Obter o último ID processado (o mais antigo entre os destinos)
+        last_processed_id = self._resume_point(pipe)
         
         # Obter o ID da última mensagem no grupo de origem
-        latest_message_id = await self.get_last_message(origin_chat)
+        latest_message_id = await self._last_message_id(pipe)
         
-        logger.info(f"Última mensagem processada: {last_processed_id}, última mensagem no grupo: {latest_message_id}")
+        logger.info(f"[{pipe.name}] Última mensagem processada: {last_processed_id}, última mensagem no grupo: {latest_message_id}")
         
         # Verificar se há novas mensagens
         if last_processed_id >= latest_message_id:
-            logger.info("Nenhuma mensagem nova para processar.")
+            logger.info(f"[{pipe.name}] Nenhuma mensagem nova para processar.")
             return
         
         # Número de novas mensagens
         new_messages_count = latest_message_id - last_processed_id
-        logger.info(f"Detectadas {new_messages_count} novas mensagens para processar.")
+        logger.info(f"[{pipe.name}] Detectadas {new_messages_count} novas mensagens para processar.")
         
         # Reiniciar as filas e flags para nova execução
-        self.messages_queue = asyncio.Queue()
-        self.finished_queue = False
-        self.processed_media_groups.clear()
-        self.media_groups.clear()
+        for lane in pipe.lanes:
+            lane.reset()
         
         # Processar as novas mensagens
         await self._process_messages(
-            destiny_chat=destiny_chat,
-            origin_chat=origin_chat,
-            topic_id=topic_id,
+            pipe=pipe,
             offset_id=last_processed_id,
             offset_date=offset_date,
         )
 
 
-async def main():
+async def main(since: Optional[datetime] = None, until: Optional[datetime] = None):
     bot = Bot()
 
     await bot.start(
@@ -497,8 +1181,20 @@ async def main():
     # The last message it stopped at (if None, will use progress tracking)
     offset_id = None  # Using progress tracking
 
+    pairs = load_pairs(settings)
+
+    metrics_server = None
+    if settings.metrics_port:
+        metrics_server = MetricsServer(host=settings.metrics_host, port=settings.metrics_port)
+        await metrics_server.start()
+
+    introspector = Introspector(settings.introspect_dir, host=settings.introspect_host, port=settings.introspect_port)
+    await introspector.start()
+
     logger.info("\n>>> Cloner up and running.\n")
-    if settings.continuous_mode:
+    if settings.continuous_mode and settings.live_mode:
+        logger.info(f"Modo ao vivo ativado. Histórico verificado após {settings.check_interval} segundos sem atualizações")
+    elif settings.continuous_mode:
         logger.info(f"Modo contínuo ativado. Intervalo de verificação: {settings.check_interval} segundos")
     
     # Loop contínuo se continuous_mode estiver ativado
@@ -506,12 +1202,12 @@ async def main():
     
     while True:
         try:
-            # Execute a clonagem
-            await bot.clone_messages(
-                origin_group_id=settings.origin_group,
-                destiny_group_id=settings.destiny_group,
-                # topic_id=topic_id, (descomente se necessário)
-                offset_id=None if first_run else 1  # Na primeira execução processa tudo, depois apenas as novas
+            # Execute a clonagem de todos os pares
+            await bot.clone_pairs(
+                pairs,
+                offset_id=None if first_run else 1,  # Na primeira execução processa tudo, depois apenas as novas
+                offset_date=since if first_run else None,
+                until=until if first_run else None,
             )
             
             first_run = False
@@ -520,6 +1216,14 @@ async def main():
             if not settings.continuous_mode:
                 logger.info("Modo contínuo desativado. Encerrando após processamento.")
                 break
+            if until is not None:
+                logger.info("Intervalo --until concluído. Encerrando após processamento.")
+                break
+
+            # Modo ao vivo: recebe mensagens novas por eventos em vez de verificar periodicamente
+            if settings.live_mode:
+                await bot.run_live()
+                continue
             
             # Log informando que verificará novamente
             logger.info(f"Verificando novamente em {settings.check_interval} segundos...")
@@ -535,8 +1239,91 @@ async def main():
             logger.info("Tentando novamente em 60 segundos...")
             await asyncio.sleep(60)  # Espera 1 minuto em caso de erro
 
+    if metrics_server is not None:
+        await metrics_server.close()
+    await introspector.close()
+    bot.rates.save()
+    if bot.dedup is not None:
+        logger.info(f"Dedup: {bot.dedup.summary()}")
+        bot.dedup.close()
+    if bot.archive is not None:
+        bot.archive.close()
+    bot.message_map.close()
+    bot.progress_tracker.close()
+    bot.safety.close()
     await bot.disconnect()
     
 
+async def read_backlog(chat: str, after_id: Optional[int] = None):
+    """Describe the unprocessed history of an origin chat for the planner (read only)"""
+    bot = Bot(read_only=True)
+    await bot.start(phone=settings.phone_number, password=settings.password)
+    try:
+        origin = await bot._resolve_chat(int(chat) if chat.lstrip('-').isdigit() else chat)
+        if after_id is None:
+            # Resume point of the configured pair with this origin, if any
+            after_id = 0
+            for pair in load_pairs(settings):
+                if str(pair.origin) == str(chat):
+                    destinies = [await bot._resolve_chat(destiny) for destiny in pair.destinies]
+                    after_id = min(bot.progress_tracker.get_progress(origin.id, destiny.id) for destiny in destinies)
+                    break
+        logger.info(f"Reading the history of {origin.title or origin.id} after message {after_id}...")
+        return await backlog_from_chat(bot, origin, after_id, origin.noforwards)
+    finally:
+        bot.progress_tracker.close()
+        await bot.disconnect()
+
+
+def plan(args) -> None:
+    """Predict how long a backlog takes under the configured limits, without sending anything"""
+    if args.chat:
+        items = asyncio.run(read_backlog(args.chat, args.after_id))
+    else:
+        items = synthetic_backlog(
+            args.messages,
+            media_ratio=args.media,
+            album_ratio=args.albums,
+            album_size=args.album_size,
+            service_ratio=args.service,
+            protected_ratio=args.protected,
+        )
+    # Forwarding is paced at the rate learned so far (nothing is fed back or saved)
+    planner = Planner(settings, lambda: create_rates()['forward'], latency=args.latency,
+                      max_forward_batch=MAX_FORWARD_BATCH)
+    print(planner.run(items).render())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Clone messages between Telegram chats")
+    parser.add_argument('--since', type=parse_date, help="start at the first message posted from this date "
+                        "(YYYY-MM-DD or ISO datetime, UTC unless given), moving the saved progress of every pair")
+    parser.add_argument('--until', type=partial(parse_date, end=True), help="stop after the last message posted "
+                        "before this date (a date alone includes that day); runs a single pass")
+    commands = parser.add_subparsers(dest='command')
+
+    plan_parser = commands.add_parser(
+        'plan', help="predict when a backlog completes under the configured limits (sends nothing)"
+    )
+    source = plan_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--messages', type=int, help="size of a synthetic backlog")
+    source.add_argument('--chat', help="read the backlog from this origin chat (read only)")
+    plan_parser.add_argument('--after-id', type=int, help="with --chat: plan messages after this ID "
+                             "(default: saved progress of the pair)")
+    plan_parser.add_argument('--media', type=float, default=0.3, help="share of media messages (default 0.3)")
+    plan_parser.add_argument('--albums', type=float, default=0.0, help="share of messages sent in albums")
+    plan_parser.add_argument('--album-size', type=int, default=4, help="messages per album (default 4)")
+    plan_parser.add_argument('--service', type=float, default=0.0, help="share of service messages")
+    plan_parser.add_argument('--protected', type=float, default=0.0,
+                             help="share of protected (noforwards) messages")
+    plan_parser.add_argument('--latency', type=float, default=0.3, help="seconds per API request (default 0.3)")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    args = parse_args()
+    move_legacy_state()
+    if args.command == 'plan':
+        plan(args)
+    else:
+        asyncio.run(main(args.since, args.until))
\ No newline at end of file
@@ -0,0 +1,39 @@
+from typing import List, Optional
+
+
+class MediaGroupAssembler:
+    """
+    Streaming album assembler.
+
+    Album members have consecutive IDs, so an album is complete as soon as a message
+    with a different grouped_id arrives. Only the album currently being assembled is
+    held in memory, albums that cross page boundaries stay intact, and items are
+    emitted in strict source order.
+    """
+
+    def __init__(self):
+        self.grouped_id: Optional[int] = None
+        self.messages: List = []
+
+    def feed(self, message) -> List:
+        """Add a message and return the queue items that are now complete"""
+        if message.grouped_id and message.grouped_id == self.grouped_id:
+            self.messages.append(message)
+            return []
+
+        ready = self.flush()
+        if message.grouped_id:
+            self.grouped_id = message.grouped_id
+            self.messages = [message]
+        else:
+            ready.append(message)
+        return ready
+
+    def flush(self) -> List:
+        """Emit the album being assembled, if any"""
+        if self.grouped_id is None:
+            return []
+        item = ("media_group", str(self.grouped_id), self.messages)
+        self.grouped_id = None
+        self.messages = []
+        return [item]
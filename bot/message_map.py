@@ -0,0 +1,206 @@
+import logging
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from telethon.tl.types import MessageMediaWebPage
+
+import clock
+
+logger = logging.getLogger('CloneGram.MessageMap')
+
+# State of a source message in the map
+SENT = 1     # Delivered; its destination message IDs are known
+SKIPPED = 2  # Deliberately not sent (protected content, service message)
+FAILED = 3   # Refused by the server or lost to an error; not delivered
+
+
+def _media_key(message) -> str:
+    """
+    ID of a message's photo or document (its copies share it), '-' for other media
+    but link previews, '' without media
+    """
+    media = getattr(message, 'photo', None) or getattr(message, 'document', None)
+    if media is not None:
+        return str(media.id)
+    media = getattr(message, 'media', None)
+    return '-' if media is not None and not isinstance(media, MessageMediaWebPage) else ''
+
+
+def fingerprint(message) -> str:
+    """
+    Length and CRC32 of a message's text, which its copy in the destination starts with,
+    and its media, so that a message without text does not match any other
+    """
+    text = getattr(message, 'message', None) or ''
+    return f"{len(text)}:{zlib.crc32(text.encode('utf-8')):08x}:{_media_key(message)}"
+
+
+def matches(fingerprint: str, message) -> bool:
+    """Whether a destination message may be the copy of the message with this fingerprint"""
+    length, crc, *media = fingerprint.split(':')  # Intents of older versions have no media part
+    text = getattr(message, 'message', None) or ''
+    length = int(length)
+    if len(text) < length or zlib.crc32(text[:length].encode('utf-8')) != int(crc, 16):
+        return False
+    if not media or not media[0]:
+        return True
+    if media[0] == '-':
+        return _media_key(message) != ''
+    return _media_key(message) == media[0]
+
+
+class Intent:
+    """A send request recorded before it was made"""
+
+    __slots__ = ('id', 'pair', 'source_ids', 'fingerprints', 'after_id')
+
+    def __init__(self, id: int, pair: str, source_ids: List[int], fingerprints: List[str], after_id: int):
+        self.id = id
+        self.pair = pair
+        self.source_ids = source_ids
+        self.fingerprints = fingerprints
+        self.after_id = after_id  # Newest destination message when the request was made
+
+
+class MessageMap:
+    """
+    Source -> destination message IDs of every pair, in a WAL-mode SQLite database.
+
+    Sends follow an intent/ack protocol. intend() is committed before the request is
+    made; its outcome (ack, skip, or drop when nothing was delivered) is buffered and
+    committed in batches, together with the removal of the intent. An intent still
+    present after a crash is in doubt: the request may or may not have been applied,
+    and it is settled by looking for its messages in the destination (see
+    Bot._settle_in_doubt) instead of sending it again or skipping it.
+    """
+
+    def __init__(self, path: str | Path = './data/message_map.db', flush_every: int = 20, flush_interval: float = 5.0):
+        self.db_file = Path(path)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_file, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS message_map ("
+            " pair TEXT NOT NULL,"
+            " source_id INTEGER NOT NULL,"
+            " state INTEGER NOT NULL,"
+            " dest_ids TEXT NOT NULL,"
+            " PRIMARY KEY (pair, source_id)) WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS intents ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " pair TEXT NOT NULL,"
+            " source_ids TEXT NOT NULL,"
+            " fingerprints TEXT NOT NULL,"
+            " after_id INTEGER NOT NULL)"
+        )
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[str, int], Tuple[int, str]] = {}
+        self._settled: List[int] = []  # Intents whose outcome is pending
+        self._last_flush = clock.monotonic()
+        # Newest source ID in the map per pair: newer messages need no lookup
+        self._newest: Dict[str, int] = dict(
+            self.conn.execute("SELECT pair, MAX(source_id) FROM message_map GROUP BY pair")
+        )
+
+    def intend(self, pair: str, messages: List, after_id: int) -> Intent:
+        """Durably record a send request about to be made for `messages`"""
+        source_ids = [message.id for message in messages]
+        fingerprints = [fingerprint(message) for message in messages]
+        cursor = self.conn.execute(
+            "INSERT INTO intents (pair, source_ids, fingerprints, after_id) VALUES (?, ?, ?, ?)",
+            (pair, ','.join(map(str, source_ids)), ','.join(fingerprints), after_id)
+        )
+        return Intent(cursor.lastrowid, pair, source_ids, fingerprints, after_id)
+
+    def settle(self, intent: Intent, outcome: Dict[int, Tuple[int, List[int]]]) -> None:
+        """
+        Record the outcome of a send as {source_id: (state, destination IDs)}.
+        Source IDs left out were not delivered and are not recorded, so they are sent again.
+        """
+        for source_id, (state, dest_ids) in outcome.items():
+            self._pending[(intent.pair, source_id)] = (state, ','.join(map(str, dest_ids)))
+            if source_id > self._newest.get(intent.pair, 0):
+                self._newest[intent.pair] = source_id
+        self._settled.append(intent.id)
+        if (len(self._settled) >= self.flush_every
+                or clock.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def ack(self, intent: Intent, results: List) -> None:
+        """Record a completed send; `results` holds the destination message (None if refused) per source ID"""
+        self.settle(intent, {
+            source_id: (SENT, [sent.id]) if sent is not None else (FAILED, [])
+            for source_id, sent in zip(intent.source_ids, results)
+        })
+
+    def skip(self, intent: Intent) -> None:
+        self.settle(intent, {source_id: (SKIPPED, []) for source_id in intent.source_ids})
+
+    def drop(self, intent: Intent) -> None:
+        """Forget a request that delivered nothing"""
+        self.settle(intent, {})
+
+    def flush(self) -> None:
+        """Commit pending outcomes and remove their intents in a single transaction"""
+        if self._settled:
+            try:
+                with self.conn:
+                    self.conn.execute("BEGIN")
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO message_map (pair, source_id, state, dest_ids) VALUES (?, ?, ?, ?)",
+                        [(pair, source_id, state, dest_ids)
+                         for (pair, source_id), (state, dest_ids) in self._pending.items()]
+                    )
+                    self.conn.executemany("DELETE FROM intents WHERE id = ?", [(id,) for id in self._settled])
+            except sqlite3.Error as e:
+                logger.error(f"Error saving the message map: {e}")
+                return
+            logger.debug("Message map committed (%d sends, %d messages)", len(self._settled), len(self._pending))
+        self._pending = {}
+        self._settled = []
+        self._last_flush = clock.monotonic()
+
+    def get(self, pair: str, source_id: int) -> Optional[Tuple[int, List[int]]]:
+        """State and destination IDs of a source message, or None if it was never settled"""
+        entry = self._pending.get((pair, source_id))
+        if entry is None:
+            if source_id > self._newest.get(pair, 0):
+                return None
+            entry = self.conn.execute(
+                "SELECT state, dest_ids FROM message_map WHERE pair = ? AND source_id = ?", (pair, source_id)
+            ).fetchone()
+            if entry is None:
+                return None
+        state, dest_ids = entry
+        return state, [int(id) for id in dest_ids.split(',') if id]
+
+    def destination_ids(self, pair: str, source_id: int) -> List[int]:
+        """IDs of the destination copies of a source message (for reply threading)"""
+        entry = self.get(pair, source_id)
+        return entry[1] if entry is not None else []
+
+    def is_settled(self, pair: str, source_ids: Iterable[int]) -> bool:
+        """Whether every one of the source messages already has an outcome"""
+        return all(self.get(pair, source_id) is not None for source_id in source_ids)
+
+    def in_doubt(self, pair: str) -> List[Intent]:
+        """Intents of a pair that were never settled, oldest first"""
+        self.flush()
+        rows = self.conn.execute(
+            "SELECT id, source_ids, fingerprints, after_id FROM intents WHERE pair = ? ORDER BY id", (pair,)
+        )
+        return [
+            Intent(id, pair, [int(source_id) for source_id in source_ids.split(',')], fingerprints.split(','), after_id)
+            for id, source_ids, fingerprints, after_id in rows
+        ]
+
+    def close(self) -> None:
+        """Commit pending outcomes and close the database"""
+        self.flush()
+        self.conn.close()
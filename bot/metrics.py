@@ -0,0 +1,263 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import clock
+
+logger = logging.getLogger('CloneGram.Metrics')
+
+LabelValues = Tuple[str, ...]
+
+# Seconds; covers a fast API call up to a slow history page
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+INF_BUCKET = 'le="+Inf"'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    """Base of the metric types: a family of children keyed by label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, object] = {}
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in self._children.items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of the with-block"""
+        start = clock.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(clock.monotonic() - start)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self):
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(child.buckets, child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, values, INF_BUCKET)} {child.count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, values)} {_format_value(child.sum)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, values)} {child.count}"
+
+
+class Gauge(_Metric):
+    """
+    Gauge read at scrape time from a callback returning {label values: value}.
+    Used for state that already lives elsewhere (queue sizes, window budgets).
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[Callable[[], Dict[LabelValues, float]]] = None
+
+    def set_function(self, function: Callable[[], Dict[LabelValues, float]]) -> None:
+        self._function = function
+
+    def _samples(self):
+        if self._function is None:
+            return
+        try:
+            values = self._function()
+        except Exception as e:
+            logger.error(f"Error reading gauge {self.name}: {e}")
+            return
+        for label_values, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, label_values)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+ITEMS = REGISTRY.register(Counter(
+    'clonegram_items_total', 'Messages and albums handled by the sender, by result',
+    ('kind', 'result')))
+FETCHED = REGISTRY.register(Counter(
+    'clonegram_fetched_messages_total', 'Messages read from origin chat history'))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'clonegram_queue_depth', 'Items waiting in the prefetch queue of each pair', ('pair',)))
+FETCH_PAGE_SECONDS = REGISTRY.register(Histogram(
+    'clonegram_fetch_page_seconds', 'Time spent waiting for Telegram on one history page'))
+API_CALL_SECONDS = REGISTRY.register(Histogram(
+    'clonegram_api_call_seconds', 'Latency of send API calls', ('method',)))
+SAFETY_DELAY_SECONDS = REGISTRY.register(Counter(
+    'clonegram_safety_delay_seconds_total', 'Time spent in safety.apply_delay, by reason', ('reason',)))
+SERVER_WAIT_SECONDS = REGISTRY.register(Counter(
+    'clonegram_server_wait_seconds_total', 'Time slept on FloodWait/SlowMode errors', ('error',)))
+WINDOW_REMAINING = REGISTRY.register(Gauge(
+    'clonegram_window_remaining', 'Messages that can still be sent in each rolling window', ('window',)))
+SEND_RATE = REGISTRY.register(Gauge(
+    'clonegram_request_rate_per_minute', 'Current adaptive rate of each request type', ('kind',)))
+DEDUP_SAVED = REGISTRY.register(Counter(
+    'clonegram_dedup_saved_total', 'Duplicate messages not sent, and their media', ('kind',)))
+DEDUP_SAVED_DELAY_SECONDS = REGISTRY.register(Counter(
+    'clonegram_dedup_saved_delay_seconds_total', 'Estimated safety delay avoided by skipping duplicates'))
+RETRIES = REGISTRY.register(Counter(
+    'clonegram_retries_total', 'Sends scheduled again, by error', ('error',)))
+RETRIES_PENDING = REGISTRY.register(Gauge(
+    'clonegram_retries_pending', 'Retries waiting to be due for each pair', ('pair',)))
+ARCHIVE_MESSAGES = REGISTRY.register(Counter(
+    'clonegram_archive_messages_total', 'Messages written to and read from the local archive', ('op',)))
+
+
+class MetricsServer:
+    """Minimal HTTP endpoint serving the registry at /metrics"""
+
+    def __init__(self, registry: Registry = REGISTRY, host: str = '127.0.0.1', port: int = 9464):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Metrics available at http://{self.host}:{self.port}/metrics")
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Skip the headers; the request has no body
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass
+
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] in ('/', '/metrics'):
+                status, content_type = '200 OK', 'text/plain; version=0.0.4; charset=utf-8'
+                body = self.registry.render().encode()
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', b'Not found\n'
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,67 @@
+import json
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+from filters import MessageFilter, compile_filter
+
+logger = logging.getLogger('CloneGram.Pairs')
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+class ClonePair:
+    """One origin → destination mapping (or several destinations, fed by a single fetch)"""
+
+    def __init__(self, origin: int | str, destiny: int | str | List[int | str], topic_id: Optional[int] = None,
+                 filters: Optional[MessageFilter] = None):
+        self.origin = origin
+        self.destiny = destiny
+        self.topic_id = topic_id
+        self.filters = filters  # Rules of this pair (None: the global FILTERS_FILE rules)
+
+    @property
+    def destinies(self) -> List[int | str]:
+        return list(self.destiny) if isinstance(self.destiny, (list, tuple)) else [self.destiny]
+
+    def __repr__(self):
+        destiny = ', '.join(map(str, self.destinies))
+        return f"ClonePair({self.origin} -> {destiny})"
+
+
+def load_pairs(settings) -> List[ClonePair]:
+    """
+    Build the list of pairs to clone.
+    PAIRS_FILE points to a JSON (or YAML, if PyYAML is installed) list such as
+    [{"origin": -100123, "destiny": -100456, "topic_id": null}, ...].
+    "destiny" may be a list, to copy the origin to several chats from a single fetch.
+    An entry may have its own "filters" rules (see filters.MessageFilter).
+    Without it, the single ORIGIN_GROUP/DESTINY_GROUP pair is used.
+    """
+    pairs: List[ClonePair] = []
+
+    if settings.pairs_file:
+        path = Path(settings.pairs_file)
+        with open(path, 'r') as f:
+            if path.suffix in ('.yml', '.yaml'):
+                if yaml is None:
+                    raise RuntimeError("PyYAML is required to read YAML pair files (pip install pyyaml)")
+                data = yaml.safe_load(f)
+            else:
+                data = json.load(f)
+
+        for entry in data or []:
+            pairs.append(ClonePair(
+                entry['origin'], entry['destiny'], entry.get('topic_id'), compile_filter(entry.get('filters'))
+            ))
+        logger.info(f"Loaded {len(pairs)} clone pairs from {path}")
+
+    elif settings.origin_group is not None and settings.destiny_group is not None:
+        pairs.append(ClonePair(settings.origin_group, settings.destiny_group))
+
+    if not pairs:
+        raise ValueError("No clone pairs configured: set ORIGIN_GROUP/DESTINY_GROUP or PAIRS_FILE")
+    return pairs
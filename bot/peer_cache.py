@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from telethon import utils
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+
+import clock
+
+logger = logging.getLogger('CloneGram.PeerCache')
+
+
+class CachedPeer:
+    """
+    Resolved chat as stored in the peer cache.
+    Telethon accepts it wherever an entity is expected (through `input_entity`),
+    so a cached chat can be used without calling get_dialogs()/get_entity().
+    """
+
+    __slots__ = ('id', 'title', 'noforwards', 'input_entity', 'resolved_at')
+
+    def __init__(self, id: int, title: Optional[str], noforwards: bool, input_entity, resolved_at: float):
+        self.id = id
+        self.title = title
+        self.noforwards = noforwards
+        self.input_entity = input_entity
+        self.resolved_at = resolved_at
+
+    @property
+    def peer_id(self) -> int:
+        """Marked ID (-100... for channels), as used in update events"""
+        return utils.get_peer_id(self.input_entity)
+
+    @classmethod
+    def from_entity(cls, entity) -> 'CachedPeer':
+        return cls(
+            id=entity.id,
+            title=getattr(entity, 'title', None),
+            noforwards=bool(getattr(entity, 'noforwards', False)),
+            input_entity=utils.get_input_peer(entity),
+            resolved_at=clock.time(),
+        )
+
+    def to_dict(self) -> dict:
+        peer = self.input_entity
+        if isinstance(peer, InputPeerChannel):
+            kind, peer_id, access_hash = 'channel', peer.channel_id, peer.access_hash
+        elif isinstance(peer, InputPeerChat):
+            kind, peer_id, access_hash = 'chat', peer.chat_id, 0
+        else:
+            kind, peer_id, access_hash = 'user', peer.user_id, peer.access_hash
+        return {
+            'id': self.id,
+            'title': self.title,
+            'noforwards': self.noforwards,
+            'kind': kind,
+            'peer_id': peer_id,
+            'access_hash': access_hash,
+            'resolved_at': self.resolved_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CachedPeer':
+        if data['kind'] == 'channel':
+            peer = InputPeerChannel(data['peer_id'], data['access_hash'])
+        elif data['kind'] == 'chat':
+            peer = InputPeerChat(data['peer_id'])
+        else:
+            peer = InputPeerUser(data['peer_id'], data['access_hash'])
+        return cls(data['id'], data.get('title'), data.get('noforwards', False), peer, data['resolved_at'])
+
+
+class PeerCache:
+    """
+    Resolved peers keyed by the chat ID as configured, persisted across restarts.
+    Entries are refreshed when they are older than `ttl` seconds or after a
+    peer-invalid error invalidates them.
+    """
+
+    def __init__(self, path: str | Path = './data/peer_cache.json', ttl: float = 86400):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.peers: Dict[str, CachedPeer] = {}
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.peers = {key: CachedPeer.from_dict(item) for key, item in data.items()}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable peer cache {self.path}: {e}")
+            self.peers = {}
+
+    def _save(self):
+        tmp_file = self.path.with_suffix('.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump({key: peer.to_dict() for key, peer in self.peers.items()}, f, indent=2)
+        os.replace(tmp_file, self.path)
+
+    def get(self, chat: int | str) -> Optional[CachedPeer]:
+        """Return the cached peer if it is still fresh"""
+        peer = self.peers.get(str(chat))
+        if peer is None or clock.time() - peer.resolved_at > self.ttl:
+            return None
+        return peer
+
+    def put(self, chat: int | str, entity) -> CachedPeer:
+        peer = CachedPeer.from_entity(entity)
+        self.peers[str(chat)] = peer
+        try:
+            self._save()
+        except OSError as e:
+            logger.error(f"Error saving peer cache: {e}")
+        return peer
+
+    def invalidate(self, chat: int | str) -> None:
+        if self.peers.pop(str(chat), None) is not None:
+            logger.info(f"Peer cache entry for {chat} invalidated")
+            try:
+                self._save()
+            except OSError as e:
+                logger.error(f"Error saving peer cache: {e}")
@@ -0,0 +1,50 @@
+import asyncio
+from typing import List, Optional
+
+from media_groups import MediaGroupAssembler
+
+
+class ClonePipeline:
+    """
+    Runtime state of one origin → destination pair.
+    Each pipeline has its own bounded prefetch queue and album assembler, while the
+    client, the safety limits and the send scheduler are shared by all pipelines.
+
+    When an origin is cloned to several destinations (fan-out), the pipeline of the
+    first one is the leader: it fetches the history once and queues every item for
+    each of its lanes, the pipelines of all the destinations, which send on their own.
+    """
+
+    def __init__(self, origin_chat, destiny_chat, topic_id: Optional[int] = None, queue_size: int = 0):
+        self.origin_chat = origin_chat
+        self.destiny_chat = destiny_chat
+        self.topic_id = topic_id
+        self.filters = None  # Compiled filter rules (filters.MessageFilter), if any
+        self.queue_size = queue_size
+        self.last_destiny_msg_id: Optional[int] = None  # Newest message we created in the destination
+        self.max_id: Optional[int] = None  # Last origin message to clone (set by --until)
+        self.enqueue_lock = asyncio.Lock()  # Keeps live events and gap fills in source order
+        self.leader: 'ClonePipeline' = self  # Pipeline whose fetch stage feeds this one
+        self.lanes: List['ClonePipeline'] = [self]  # Pipelines fed by this one's fetch stage (leader only)
+        self.reset()
+
+    def reset(self) -> None:
+        """Prepare the pipeline for a new clone run"""
+        self.messages_queue = asyncio.Queue(maxsize=self.queue_size)
+        self.media_groups = MediaGroupAssembler()  # Assembles albums as messages stream in
+        self.finished_queue = False
+        self.last_fetched_msg = 0
+        self.last_msg_id = 0
+        self.last_processed_msg = 0
+        self.start_id = 0  # Checkpoint this run resumed from; older fetched items are not queued
+
+    @property
+    def key(self) -> str:
+        """Pair key, as used by the progress tracker and the message map"""
+        return f"{self.origin_chat.id}->{self.destiny_chat.id}"
+
+    @property
+    def name(self) -> str:
+        origin = getattr(self.origin_chat, 'title', None) or self.origin_chat.id
+        destiny = getattr(self.destiny_chat, 'title', None) or self.destiny_chat.id
+        return f"{origin} -> {destiny}"
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import random
+import shutil
+import tempfile
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from telethon.tl.types import MessageService
+
+import clock
+from media_groups import MediaGroupAssembler
+from safety import AntiDetectionSafety
+
+# Item of a backlog: (kind, messages, media, batchable), kind being 'message', 'album' or 'service'
+PlanItem = Tuple[str, int, int, bool]
+
+# Pause the sender takes after each album (see Bot._consume)
+ALBUM_PAUSE = 2
+
+CONSTRAINTS = {
+    'random': 'random delay (MIN_DELAY-MAX_DELAY, night/weekend multipliers)',
+    'hourly': 'HOURLY_LIMIT',
+    'daily': 'DAILY_LIMIT',
+    'daily_media': 'DAILY_MEDIA_LIMIT',
+    'cooldown': 'MAX_BATCH_SIZE/BATCH_COOLDOWN',
+    'api_rate': 'API rate limit (token bucket)',
+    'latency': 'API latency',
+    'album_pause': 'pause after albums',
+}
+
+
+def synthetic_backlog(
+    total: int,
+    media_ratio: float = 0.3,
+    album_ratio: float = 0.0,
+    album_size: int = 4,
+    service_ratio: float = 0.0,
+    protected_ratio: float = 0.0,
+    seed: int = 1,
+) -> Iterator[PlanItem]:
+    """
+    Backlog of `total` messages. `album_ratio` is the share of messages that arrive
+    in albums of `album_size`; the remaining media is spread over single messages.
+    Protected messages (noforwards) are never batched.
+    """
+    rng = random.Random(seed)
+    album_share = min(album_ratio, media_ratio)
+    # Probability of an album starting at an item so that album_share of the messages are in albums
+    album_start = album_share / (album_size - album_share * album_size + album_share) if album_share else 0.0
+    single_media = (media_ratio - album_share) / (1 - album_share) if album_share < 1 else 0.0
+
+    produced = 0
+    while produced < total:
+        if rng.random() < album_start and total - produced >= album_size:
+            yield ('album', album_size, album_size, False)
+            produced += album_size
+            continue
+        produced += 1
+        if rng.random() < service_ratio:
+            yield ('service', 1, 0, False)
+        else:
+            yield ('message', 1, int(rng.random() < single_media), rng.random() >= protected_ratio)
+
+
+async def backlog_from_chat(client, chat, after_id: int = 0, noforwards: bool = False) -> List[PlanItem]:
+    """Read the history of a chat after `after_id` (read only) and describe it as plan items"""
+    items: List[PlanItem] = []
+
+    def add(entry):
+        if isinstance(entry, tuple):
+            items.append(('album', len(entry[2]), len(entry[2]), False))
+        elif isinstance(entry, MessageService):
+            items.append(('service', 1, 0, False))
+        else:
+            items.append(('message', 1, int(entry.media is not None), not (entry.noforwards or noforwards)))
+
+    assembler = MediaGroupAssembler()
+    async for message in client.iter_messages(entity=chat, min_id=after_id, reverse=True):
+        for entry in assembler.feed(message):
+            add(entry)
+    for entry in assembler.flush():
+        add(entry)
+    return items
+
+
+@dataclass
+class DayPlan:
+    day: date
+    messages: int = 0
+    seconds: Counter = field(default_factory=Counter)
+
+    @property
+    def binding(self) -> str:
+        return self.seconds.most_common(1)[0][0] if self.seconds else 'latency'
+
+
+@dataclass
+class PlanReport:
+    start: float
+    end: float
+    messages: int
+    items: int
+    days: List[DayPlan]
+
+    def phases(self) -> List[Tuple[DayPlan, DayPlan, str]]:
+        """Consecutive days with the same binding constraint"""
+        phases = []
+        for day in self.days:
+            if phases and phases[-1][2] == day.binding:
+                phases[-1] = (phases[-1][0], day, day.binding)
+            else:
+                phases.append((day, day, day.binding))
+        return phases
+
+    def render(self) -> str:
+        duration = timedelta(seconds=round(self.end - self.start))
+        lines = [
+            f"Backlog: {self.messages:,} messages in {self.items:,} sends",
+            f"Start:      {datetime.fromtimestamp(self.start):%Y-%m-%d %H:%M}",
+            f"Completion: {datetime.fromtimestamp(self.end):%Y-%m-%d %H:%M} (in {duration})",
+            "",
+            "Phases:",
+        ]
+        for first, last, binding in self.phases():
+            days = [d for d in self.days if first.day <= d.day <= last.day]
+            per_day = sum(d.messages for d in days) / len(days)
+            span = f"{first.day}" if first is last else f"{first.day} .. {last.day}"
+            lines.append(f"  {span:<24} {per_day:>8,.0f} msgs/day  bound by {CONSTRAINTS.get(binding, binding)}")
+
+        lines += ["", "Messages per day:"]
+        peak = max((d.messages for d in self.days), default=0) or 1
+        cumulative = 0
+        for day in self.days:
+            cumulative += day.messages
+            bar = '#' * round(30 * day.messages / peak)
+            lines.append(f"  {day.day} {day.day:%a} {day.messages:>8,} {cumulative:>10,}  {bar:<30} {day.binding}")
+        return '\n'.join(lines)
+
+
+class Planner:
+    """
+    Replays a backlog through the real AntiDetectionSafety and token bucket on a
+    virtual clock, without sending anything.
+    The activity log is copied, so limits already used today are taken into account
+    and the real log is left untouched.
+    """
+
+    def __init__(self, settings, bucket_factory: Callable, latency: float = 0.3, max_forward_batch: int = 100):
+        self.settings = settings
+        self.bucket_factory = bucket_factory
+        self.latency = latency
+        self.max_forward_batch = max_forward_batch
+
+    def run(self, items: Iterable[PlanItem]) -> PlanReport:
+        virtual = clock.VirtualClock()
+        with tempfile.TemporaryDirectory() as tmp:
+            activity_log = Path(tmp) / 'activity_counters.bin'
+            if Path(self.settings.activity_log_file).exists():
+                shutil.copyfile(self.settings.activity_log_file, activity_log)
+            settings = self.settings.model_copy(update={'activity_log_file': str(activity_log)})
+
+            # Limit warnings would be logged for every simulated wait
+            safety_logger = logging.getLogger('CloneGram.Safety')
+            level = safety_logger.level
+            safety_logger.setLevel(logging.ERROR)
+            try:
+                return virtual.run(self._simulate(settings, items))
+            finally:
+                safety_logger.setLevel(level)
+
+    async def _simulate(self, settings, items: Iterable[PlanItem]) -> PlanReport:
+        safety = AntiDetectionSafety(settings)
+        bucket = self.bucket_factory()
+        start = clock.time()
+        days: List[DayPlan] = []
+        total_messages = sends = 0
+        pending: List[PlanItem] = []
+        iterator = iter(items)
+        waited = Counter()
+
+        def next_item() -> Optional[PlanItem]:
+            if pending:
+                return pending.pop()
+            return next(iterator, None)
+
+        async def sleep(seconds: float, cause: str) -> None:
+            await asyncio.sleep(seconds)
+            waited[cause] += seconds
+
+        try:
+            while True:
+                item = next_item()
+                if item is None:
+                    break
+                kind, messages, media, batchable = item
+
+                if kind == 'service':
+                    continue
+                waited['api_rate'] += await bucket.acquire()
+                if kind == 'album':
+                    await safety.apply_delay(is_media=True)
+                    await sleep(self.latency, 'latency')
+                    await sleep(ALBUM_PAUSE, 'album_pause')
+                    sent = messages
+                elif batchable and settings.forward_batch_size > 1:
+                    batch = [item]
+                    limit = min(settings.forward_batch_size, self.max_forward_batch, max(1, safety.capacity()))
+                    media_left = max(1, safety.capacity(is_media=True)) - media
+                    while len(batch) < limit:
+                        candidate = next_item()
+                        if candidate is None:
+                            break
+                        if candidate[0] != 'message' or not candidate[3] or (candidate[2] and media_left <= 0):
+                            pending.append(candidate)
+                            break
+                        media_left -= candidate[2]
+                        batch.append(candidate)
+                    await safety.apply_delay(count=len(batch), media_count=sum(entry[2] for entry in batch))
+                    await sleep(self.latency, 'latency')
+                    sent = len(batch)
+                else:
+                    await safety.apply_delay(is_media=bool(media))
+                    await sleep(self.latency, 'latency')
+                    sent = 1
+
+                sends += 1
+                total_messages += sent
+                today = clock.now().date()
+                if not days or days[-1].day != today:
+                    days.append(DayPlan(today))
+                days[-1].messages += sent
+                days[-1].seconds.update(safety.delay_breakdown)
+                days[-1].seconds.update(waited)
+                safety.delay_breakdown.clear()
+                waited.clear()
+        finally:
+            safety.close()
+
+        return PlanReport(start, clock.time(), total_messages, sends, days)
@@ -0,0 +1,272 @@
+import logging
+import math
+import sys
+from bisect import bisect_right
+from collections import Counter
+from datetime import timedelta
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from tqdm import tqdm
+
+import clock
+from logging_setup import console_handlers
+
+logger = logging.getLogger('CloneGram.Progress')
+
+HOUR = 3600
+DAY = 86400
+MAX_DAYS = 366  # ETAs are not projected further than this
+BAR_ETA_INTERVAL = 10  # Seconds between ETA updates on the bar
+WINDOW_WAITS = ('hourly', 'daily', 'daily_media')
+BINDING_NAMES = {'hourly': 'HOURLY_LIMIT', 'daily': 'DAILY_LIMIT', 'daily_media': 'DAILY_MEDIA_LIMIT'}
+
+
+class WindowBudget(NamedTuple):
+    """A safety window as seen by the ETA projection"""
+    name: str
+    limit: int
+    period: float
+    events: List[float]  # Sends inside the window, in seconds from now (<= 0), oldest first
+    share: float         # Part of the remaining messages that counts against it
+
+
+def project_finish(remaining: float, pace: Callable, start, windows: List[WindowBudget]) -> Tuple[Optional[float], str]:
+    """
+    Seconds until `remaining` messages are sent, and what bounds that time the most:
+    'pace' or the name of a window.
+
+    Time is walked hour by hour from `start` (a datetime); `pace(when)` gives the seconds
+    per message at that hour, so night and weekend multipliers apply where they fall.
+    Each hour sends what its pace allows, but no more than every window has room for
+    at the end of that hour: the sends already in the window expire when they really
+    do, and the projected sends join them. None when it takes longer than MAX_DAYS.
+    """
+    elapsed = 0.0
+    ends: List[float] = []       # End of each projected hour...
+    sent_by: List[float] = [0.0]  # ...and the messages projected up to it
+    bound_for = Counter()
+    when = start
+    while elapsed < MAX_DAYS * DAY:
+        step = HOUR - (when.minute * 60 + when.second + when.microsecond / 1e6)
+        end = elapsed + step
+        seconds_per_message = pace(when)
+        budget, binding = step / seconds_per_message, 'pace'
+        for window in windows:
+            if not window.share:
+                continue
+            cutoff = end - window.period
+            used = (len(window.events) - bisect_right(window.events, cutoff)
+                    + window.share * (sent_by[-1] - sent_by[bisect_right(ends, cutoff)]))
+            room = max(0.0, window.limit - used) / window.share
+            if room < budget:
+                budget, binding = room, window.name
+
+        if remaining <= budget:
+            return elapsed + remaining * seconds_per_message, max(bound_for, key=bound_for.get, default='pace')
+        bound_for[binding] += step
+        remaining -= budget
+        ends.append(end)
+        sent_by.append(sent_by[-1] + budget)
+        elapsed = end
+        when += timedelta(seconds=step)
+    return None, max(bound_for, key=bound_for.get)
+
+
+def format_duration(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days}d {hours}h"
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    return f"{minutes}m {int(seconds % 60):02d}s"
+
+
+class _BarSafeStream:
+    """Console stream for log handlers: clears the bar, writes the line and redraws the bar"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text: str) -> None:
+        tqdm.write(text, file=self.stream, end='')
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+class ProgressDisplay:
+    """
+    Progress of the history being cloned, with the throughput and an ETA.
+
+    Progress is counted in origin message IDs, from each destination's checkpoint up
+    to the newest message, summed over every pair. The throughput is an exponentially
+    weighted moving average over `tau` seconds.
+
+    The ETA comes from the budget model rather than from that rate alone. The time
+    per message sent is measured without the waits for the hourly/daily windows and
+    the batch cooldowns, and with the random delays taken back to a multiplier of 1.
+    It is then projected through the remaining window budgets, the night and weekend
+    multipliers of the hours ahead, and a cooldown every MAX_BATCH_SIZE messages
+    (see project_finish).
+
+    `mode` is 'bar' (tqdm, log lines are written above it), 'log' (a summary line
+    every `interval` seconds, for Docker logs and other non-terminals), 'off', or
+    'auto': a bar when stderr is a terminal, lines otherwise.
+    """
+
+    def __init__(self, safety, mode: str = 'auto', interval: float = 60.0, tau: float = 600.0):
+        self.safety = safety
+        if mode == 'auto':
+            mode = 'bar' if sys.stderr.isatty() else 'log'
+        self.mode = mode
+        self.interval = interval
+        self.tau = tau
+        self._reset()
+
+    def _reset(self) -> None:
+        self.total = 0
+        self.done = 0
+        self.bar: Optional[tqdm] = None
+        self._streams = []
+        # Decayed sums of IDs done, messages sent, seconds elapsed, random delay seconds
+        # (at a multiplier of 1) and other seconds, then what was counted since the last sample
+        self._ids = self._sends = self._seconds = self._random = self._other = 0.0
+        self._pending_ids = self._pending_sends = 0
+        self._last_sample = self._last_log = self._last_eta = clock.monotonic()
+        self._breakdown = dict(self.safety.delay_breakdown)
+
+    def add_total(self, messages: int) -> None:
+        """Add a destination's share of the history (newest message ID minus its checkpoint)"""
+        if self.mode == 'off' or messages <= 0:
+            return
+        self.total += messages
+        if self.mode == 'bar':
+            if self.bar is None:
+                self._open_bar()
+            self.bar.total = self.total
+            self.bar.refresh()
+
+    def advance(self, messages: int) -> None:
+        """A checkpoint moved `messages` IDs forward"""
+        if not self.total or messages <= 0:
+            return
+        messages = min(messages, self.total - self.done)
+        self.done += messages
+        self._pending_ids += messages
+        now = clock.monotonic()
+        if now - self._last_sample >= 1:
+            self._sample()
+        if self.bar is not None:
+            if now - self._last_eta >= BAR_ETA_INTERVAL:
+                self.bar.set_postfix_str(self.describe(with_count=False), refresh=False)
+                self._last_eta = now
+            self.bar.update(messages)
+        elif self.mode == 'log' and now - self._last_log >= self.interval:
+            self.log()
+
+    def count_sent(self, messages: int) -> None:
+        if self.total:
+            self._pending_sends += messages
+
+    @property
+    def rate(self) -> float:
+        """Moving average of the message IDs done per second"""
+        return self._ids / self._seconds if self._seconds else 0.0
+
+    def seconds_per_send(self, when=None) -> float:
+        """Expected seconds per message sent at `when` (now by default), window waits aside"""
+        settings = self.safety.settings
+        if self._sends >= 1:
+            random_delay = self._random / self._sends
+            other = self._other / self._sends
+        else:
+            random_delay = (settings.min_delay + settings.max_delay) / 2
+            other = 0.0
+        cooldown = settings.batch_cooldown / max(1, settings.max_batch_size)
+        return random_delay * self.safety._get_delay_multiplier(when) + other + cooldown
+
+    def eta(self) -> Tuple[Optional[float], str]:
+        """Seconds left and the constraint that bounds them the most"""
+        limits = self.safety.limits
+        sends_per_id = self._sends / self._ids if self._ids >= 1 else 1.0
+        remaining = (self.total - self.done) * sends_per_id
+        if remaining <= 0:
+            return 0.0, 'pace'
+
+        # Media messages count against their own window too, in the share seen today.
+        # Windows with room for everything left cannot bind and are left out
+        now = clock.monotonic()
+        sent_today = limits.count('daily', now)
+        shares = {'daily_media': limits.count('daily_media', now) / sent_today if sent_today else 0.0}
+        windows = []
+        for name, window in limits.windows.items():
+            share = shares.get(name, 1.0)
+            if share and limits.count(name, now) + remaining * share > window.limit:
+                events = [t - now for t in limits.events(name, now)]
+                windows.append(WindowBudget(name, window.limit, window.period, events, share))
+        return project_finish(remaining, self.seconds_per_send, clock.now(), windows)
+
+    def _sample(self) -> None:
+        """Fold what happened since the last sample into the moving averages"""
+        now = clock.monotonic()
+        elapsed = now - self._last_sample
+        breakdown = self.safety.delay_breakdown
+        spent = {cause: breakdown[cause] - self._breakdown.get(cause, 0.0) for cause in breakdown}
+        self._breakdown = dict(breakdown)
+        random_delay = spent.get('random', 0.0)
+        waits = sum(spent.get(cause, 0.0) for cause in WINDOW_WAITS + ('cooldown',))
+
+        decay = math.exp(-elapsed / self.tau)
+        self._ids = self._ids * decay + self._pending_ids
+        self._sends = self._sends * decay + self._pending_sends
+        self._seconds = self._seconds * decay + elapsed
+        self._random = self._random * decay + random_delay / self.safety._get_delay_multiplier()
+        self._other = self._other * decay + max(0.0, elapsed - random_delay - waits)
+        self._pending_ids = self._pending_sends = 0
+        self._last_sample = now
+
+    def describe(self, with_count: bool = True) -> str:
+        seconds, binding = self.eta()
+        if seconds is None:
+            eta = f"ETA over {MAX_DAYS} days"
+        else:
+            finish = clock.now() + timedelta(seconds=seconds)
+            eta = f"ETA {format_duration(seconds)} ({finish:%Y-%m-%d %H:%M})"
+        if binding != 'pace':
+            eta += f", bound by {BINDING_NAMES[binding]}"
+        per_minute = self.rate * 60
+        rate = f"{per_minute:.1f} msg/min" if per_minute >= 1 else f"{per_minute * 60:.1f} msg/h"
+        text = f"{rate}, {eta}"
+        if with_count:
+            percent = self.done / self.total if self.total else 1.0
+            text = f"{self.done:,}/{self.total:,} ({percent:.1%}), {text}"
+        return text
+
+    def log(self) -> None:
+        self._sample()
+        logger.info("Progress: %s", self.describe())
+        self._last_log = clock.monotonic()
+
+    def close(self) -> None:
+        """End of a pass: show the final state and start over for the next one"""
+        if self.bar is not None:
+            self._sample()
+            self.bar.set_postfix_str(self.describe(with_count=False), refresh=False)
+            self.bar.close()
+            for handler, stream in self._streams:
+                handler.setStream(stream)
+        elif self.total and self.mode == 'log':
+            self.log()
+        self._reset()
+
+    def _open_bar(self) -> None:
+        self.bar = tqdm(
+            total=self.total, unit='msg', file=sys.stderr, dynamic_ncols=True, mininterval=1,
+            bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}{postfix}]', postfix='measuring...',
+        )
+        # Log lines are written above the bar instead of through it
+        for handler in console_handlers():
+            if handler.stream in (sys.stderr, sys.stdout):
+                self._streams.append((handler, handler.setStream(_BarSafeStream(handler.stream))))
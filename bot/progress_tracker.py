@@ -1,21 +1,44 @@
 import json
+import os
+import sqlite3
 from pathlib import Path
 import logging
-from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import clock
 
 logger = logging.getLogger('CloneGram.Progress')
 
-class ProgressTracker:
-    def __init__(self):
-        self.progress_file = Path('./progress.json')
+
+class ProgressBackend:
+    """Storage interface used by ProgressTracker"""
+
+    def load_all(self) -> Dict[str, int]:
+        """Return every stored checkpoint as {chat_id: last_message_id}"""
+        raise NotImplementedError
+
+    def write(self, entries: Dict[str, Tuple[int, str]]) -> None:
+        """Persist {chat_id: (last_message_id, timestamp)} in a single transaction"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JsonProgressBackend(ProgressBackend):
+    """Legacy progress.json storage, kept for compatibility and migration"""
+
+    def __init__(self, path: str | Path = './data/progress.json'):
+        self.progress_file = Path(path)
+        self.progress_file.parent.mkdir(parents=True, exist_ok=True)
         self._ensure_progress_file()
-    
+
     def _ensure_progress_file(self):
         """Make sure the progress file exists"""
         if not self.progress_file.exists():
             with open(self.progress_file, 'w') as f:
                 json.dump({}, f)
-    
+
     def _load_progress(self) -> dict:
         """Load progress data from file"""
         try:
@@ -26,23 +49,169 @@ class ProgressTracker:
             with open(self.progress_file, 'w') as f:
                 json.dump({}, f)
             return {}
-    
-    def save_progress(self, origin_chat_id: int, last_message_id: int) -> None:
-        """Save progress to file"""
-        progress_data = self._load_progress()
-        
-        progress_data[str(origin_chat_id)] = {
-            "last_message_id": last_message_id,
-            "timestamp": datetime.now().isoformat()
+
+    def load_all(self) -> Dict[str, int]:
+        return {
+            chat_id: data.get("last_message_id", 0)
+            for chat_id, data in self._load_progress().items()
         }
-        
-        with open(self.progress_file, 'w') as f:
-            json.dump(progress_data, f, indent=2)
-        
-        logger.info(f"Progress saved: Last processed message for chat {origin_chat_id} is {last_message_id}")
-    
-    def get_progress(self, origin_chat_id: int) -> int:
-        """Get the last processed message ID for a specific chat"""
+
+    def write(self, entries: Dict[str, Tuple[int, str]]) -> None:
         progress_data = self._load_progress()
-        chat_data = progress_data.get(str(origin_chat_id), {})
-        return chat_data.get("last_message_id", 0)
\ No newline at end of file
+        for chat_id, (last_message_id, timestamp) in entries.items():
+            progress_data[chat_id] = {
+                "last_message_id": last_message_id,
+                "timestamp": timestamp
+            }
+
+        # Write to a temporary file and rename it so a crash never leaves a half-written file
+        tmp_file = self.progress_file.with_suffix('.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(progress_data, f, indent=2)
+        os.replace(tmp_file, self.progress_file)
+
+
+class SqliteProgressBackend(ProgressBackend):
+    """WAL-mode SQLite storage with one row per origin chat"""
+
+    def __init__(self, path: str | Path = './data/progress.db', legacy_json: str | Path | None = './data/progress.json'):
+        self.db_file = Path(path)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_file, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS progress ("
+            " chat_id TEXT PRIMARY KEY,"
+            " last_message_id INTEGER NOT NULL,"
+            " timestamp TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        if legacy_json is not None:
+            self._migrate_from_json(Path(legacy_json))
+
+    def _migrate_from_json(self, json_file: Path):
+        """Import progress.json once, the first time the database is opened"""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'migrated_json'").fetchone()
+        if row is not None or not json_file.exists():
+            return
+
+        try:
+            with open(json_file, 'r') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Could not read {json_file} for migration: {e}")
+            data = {}
+
+        entries = {
+            chat_id: (item.get("last_message_id", 0), item.get("timestamp", clock.now().isoformat()))
+            for chat_id, item in data.items()
+            if isinstance(item, dict)
+        }
+        self.write(entries)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)",
+            (clock.now().isoformat(),)
+        )
+        logger.info(f"Migrated {len(entries)} chat checkpoints from {json_file} to {self.db_file}")
+
+    def load_all(self) -> Dict[str, int]:
+        rows = self.conn.execute("SELECT chat_id, last_message_id FROM progress")
+        return {chat_id: last_message_id for chat_id, last_message_id in rows}
+
+    def write(self, entries: Dict[str, Tuple[int, str]]) -> None:
+        if not entries:
+            return
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT INTO progress (chat_id, last_message_id, timestamp) VALUES (?, ?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET "
+                "last_message_id = excluded.last_message_id, timestamp = excluded.timestamp",
+                [(chat_id, msg_id, ts) for chat_id, (msg_id, ts) in entries.items()]
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def create_progress_backend(kind: str = 'sqlite', path: Optional[str] = None) -> ProgressBackend:
+    """Build a progress backend by name ('sqlite' or 'json')"""
+    if kind == 'json':
+        return JsonProgressBackend(path or './data/progress.json')
+    if kind == 'sqlite':
+        return SqliteProgressBackend(path or './data/progress.db')
+    raise ValueError(f"Unknown progress backend: {kind}")
+
+
+class ProgressTracker:
+    """
+    Keeps the last processed message ID per origin chat.
+    Reads are served from memory and writes are committed to the backend in batches,
+    either every `flush_every` checkpoints or every `flush_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[ProgressBackend] = None,
+        flush_every: int = 1,
+        flush_interval: float = 0.0,
+    ):
+        self.backend = backend or JsonProgressBackend()
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self._cache: Dict[str, int] = self.backend.load_all()
+        self._pending: Dict[str, Tuple[int, str]] = {}
+        self._pending_count = 0
+        self._last_flush = clock.monotonic()
+
+    @staticmethod
+    def _key(origin_chat_id: int, destiny_chat_id: Optional[int] = None) -> str:
+        """Progress key: the origin chat, or origin->destination when tracked per pair"""
+        if destiny_chat_id is None:
+            return str(origin_chat_id)
+        return f"{origin_chat_id}->{destiny_chat_id}"
+
+    def save_progress(self, origin_chat_id: int, last_message_id: int, destiny_chat_id: Optional[int] = None) -> None:
+        """Record a checkpoint, committing it once the batch is due"""
+        key = self._key(origin_chat_id, destiny_chat_id)
+        self._cache[key] = last_message_id
+        self._pending[key] = (last_message_id, clock.now().isoformat())
+        self._pending_count += 1
+
+        if (self._pending_count >= self.flush_every
+                or clock.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+        logger.debug("Progress saved: Last processed message for chat %s is %s", key, last_message_id)
+
+    def flush(self) -> None:
+        """Commit pending checkpoints to the backend"""
+        if self._pending:
+            try:
+                self.backend.write(self._pending)
+            except Exception as e:
+                logger.error(f"Error saving progress: {e}")
+                return
+            logger.debug("Progress committed for %d chat(s) (%d checkpoints)",
+                         len(self._pending), self._pending_count)
+        self._pending = {}
+        self._pending_count = 0
+        self._last_flush = clock.monotonic()
+
+    def close(self) -> None:
+        """Flush pending checkpoints and release the backend"""
+        self.flush()
+        self.backend.close()
+
+    def get_progress(self, origin_chat_id: int, destiny_chat_id: Optional[int] = None) -> int:
+        """
+        Get the last processed message ID for a specific chat (or pair).
+        A pair without its own checkpoint falls back to the origin-only entry
+        written by single-pair versions.
+        """
+        key = self._key(origin_chat_id, destiny_chat_id)
+        if key in self._cache:
+            return self._cache[key]
+        return self._cache.get(str(origin_chat_id), 0)
@@ -1,26 +1,200 @@
-import time
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+import clock
+import metrics
+
+logger = logging.getLogger('CloneGram.RateLimit')
+
+
+class Reservation:
+    """
+    Tokens taken from a TokenBucket ahead of time.
+    They may be used once `delay` reaches zero; cancel() returns them if they won't be used.
+    """
+
+    __slots__ = ('bucket', 'tokens', 'ready_at', 'cancelled')
+
+    def __init__(self, bucket: 'TokenBucket', tokens: float, ready_at: float):
+        self.bucket = bucket
+        self.tokens = tokens
+        self.ready_at = ready_at
+        self.cancelled = False
+
+    @property
+    def delay(self) -> float:
+        return max(0.0, self.ready_at - clock.monotonic())
+
+    async def wait(self) -> float:
+        """Sleep until the tokens are available and return the seconds waited"""
+        delay = self.delay
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def cancel(self) -> None:
+        if not self.cancelled:
+            self.cancelled = True
+            self.bucket._refund(self.tokens)
+
 
 class TokenBucket:
+    """
+    Token bucket on the monotonic clock with fractional refill.
+
+    Each caller takes its tokens when it asks for them, going into debt if needed,
+    and then sleeps exactly until the debt is paid off. Concurrent waiters are thus
+    served in FIFO order without polling, and a request for several tokens (a whole
+    album) is never starved by single-token requests.
+    """
+
     def __init__(self, initial_tokens: int, max_tokens: int, refill_interval: float):
         self.max_tokens = max_tokens
-        self.refill_interval = refill_interval
-        self.tokens = initial_tokens
-        self.last_refill_time = time.time()
+        self.refill_interval = refill_interval  # Seconds per token
+        self.tokens = float(initial_tokens)
+        self.last_refill_time = clock.monotonic()
 
     def _refill_tokens(self):
-        now = time.time()
+        now = clock.monotonic()
         elapsed = now - self.last_refill_time
-        refill_tokens = int(elapsed / self.refill_interval)
-        
-        if refill_tokens > 0:
-            self.tokens = min(self.max_tokens, self.tokens + refill_tokens)
-            self.last_refill_time += refill_tokens * self.refill_interval
+        self.tokens = min(self.max_tokens, self.tokens + elapsed / self.refill_interval)
+        self.last_refill_time = now
 
-    def consume(self, tokens: int = 1) -> bool:
+    def _refund(self, tokens: float) -> None:
         self._refill_tokens()
+        self.tokens = min(self.max_tokens, self.tokens + tokens)
 
-        # If we have enough tokens to subtract
+    def _check(self, tokens: float) -> None:
+        if tokens > self.max_tokens:
+            raise ValueError(f"Cannot take {tokens} tokens from a bucket of {self.max_tokens}")
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """Seconds until `tokens` could be taken, given the requests already made"""
+        self._refill_tokens()
+        return max(0.0, (tokens - self.tokens) * self.refill_interval)
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take the tokens if they are available now, without waiting"""
+        self._check(tokens)
+        self._refill_tokens()
         if self.tokens >= tokens:
             self.tokens -= tokens
             return True
-        return False
\ No newline at end of file
+        return False
+
+    def reserve(self, tokens: float = 1) -> Reservation:
+        """Take the tokens now, to be used after the returned reservation's delay"""
+        self._check(tokens)
+        wait = self.wait_time(tokens)
+        self.tokens -= tokens
+        return Reservation(self, tokens, clock.monotonic() + wait)
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """Wait until the tokens are available, take them and return the seconds waited"""
+        reservation = self.reserve(tokens)
+        try:
+            return await reservation.wait()
+        except asyncio.CancelledError:
+            reservation.cancel()
+            raise
+
+
+class AdaptiveRate:
+    """
+    Send rate for one request type, in requests per minute, adjusted by AIMD:
+    every accepted request adds `increase / rate` (about `increase` per minute of
+    successful sending) up to `ceiling`, and every FloodWait multiplies the rate
+    by `decrease`, down to `floor`.
+    """
+
+    def __init__(self, ceiling: float, floor: float = 1.0, rate: Optional[float] = None,
+                 increase: float = 1.0, decrease: float = 0.5, burst: Optional[int] = None):
+        self.ceiling = ceiling
+        self.floor = min(floor, ceiling)
+        self.increase = increase
+        self.decrease = decrease
+        self.rate = min(ceiling, max(self.floor, rate or ceiling))
+        self.floods = 0
+        self.bucket = TokenBucket(
+            initial_tokens=1,
+            max_tokens=burst or max(1, int(ceiling)),
+            refill_interval=60 / self.rate,
+        )
+
+    def _set_rate(self, rate: float) -> None:
+        self.bucket._refill_tokens()  # Tokens earned so far keep the old rate
+        self.rate = rate
+        self.bucket.refill_interval = 60 / rate
+
+    async def acquire(self, tokens: float = 1) -> float:
+        return await self.bucket.acquire(tokens)
+
+    def on_success(self) -> None:
+        if self.rate < self.ceiling:
+            self._set_rate(min(self.ceiling, self.rate + self.increase / self.rate))
+
+    def on_flood(self, seconds: float) -> None:
+        self.floods += 1
+        self._set_rate(max(self.floor, self.rate * self.decrease))
+
+
+class AdaptiveRates:
+    """
+    AdaptiveRate per request type ('forward', 'send', 'fetch'), with the learned
+    rates persisted so a restart does not begin at the ceiling again.
+    """
+
+    SAVE_INTERVAL = 60  # Seconds between saves while rates only creep up
+
+    def __init__(self, ceilings: Dict[str, float], path: str | Path = './data/rate_state.json', **aimd):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        saved = self._load()
+        self.rates: Dict[str, AdaptiveRate] = {
+            kind: AdaptiveRate(ceiling, rate=saved.get(kind), **aimd) for kind, ceiling in ceilings.items()
+        }
+        self._last_save = clock.monotonic()
+        metrics.SEND_RATE.set_function(lambda: {(kind,): rate.rate for kind, rate in self.rates.items()})
+        if saved:
+            logger.info("Learned rates: " + ", ".join(f"{kind}={rate.rate:.1f}/min" for kind, rate in self.rates.items()))
+
+    def __getitem__(self, kind: str) -> AdaptiveRate:
+        return self.rates[kind]
+
+    def _load(self) -> Dict[str, float]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return {kind: float(rate) for kind, rate in json.load(f).items()}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable rate state {self.path}: {e}")
+            return {}
+
+    def save(self) -> None:
+        tmp_file = self.path.with_suffix('.json.tmp')
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump({kind: round(rate.rate, 3) for kind, rate in self.rates.items()}, f, indent=2)
+            os.replace(tmp_file, self.path)
+        except OSError as e:
+            logger.error(f"Error saving rate state: {e}")
+        self._last_save = clock.monotonic()
+
+    async def acquire(self, kind: str, tokens: float = 1) -> float:
+        return await self.rates[kind].acquire(tokens)
+
+    def on_success(self, kind: str) -> None:
+        self.rates[kind].on_success()
+        if clock.monotonic() - self._last_save >= self.SAVE_INTERVAL:
+            self.save()
+
+    def on_flood(self, kind: str, seconds: float) -> None:
+        rate = self.rates[kind]
+        rate.on_flood(seconds)
+        logger.warning(f"FloodWait of {seconds}s on {kind} requests, lowering the rate to {rate.rate:.1f}/min")
+        self.save()
@@ -0,0 +1,152 @@
+from datetime import datetime
+from typing import List, Optional
+
+from telethon.tl.types import MessageMediaWebPage, MessageService, WebPageEmpty
+
+from filters import message_kind
+
+# Kinds of message records: the "media" filter kinds plus link previews and service messages.
+# Their positions are the kind codes stored in the archive, so new kinds go at the end
+KINDS = ('text', 'webpage', 'photo', 'video', 'gif', 'sticker', 'voice', 'round', 'audio', 'document', 'other',
+         'service')
+# Kinds whose media is a document, as in Message.document
+DOCUMENT_KINDS = frozenset({'video', 'gif', 'sticker', 'voice', 'round', 'audio', 'document'})
+
+_WEBPAGE = MessageMediaWebPage(webpage=WebPageEmpty(id=0))
+
+
+class MediaRef:
+    """ID of a message's photo or document"""
+
+    __slots__ = ('id',)
+
+    def __init__(self, id: int):
+        self.id = id
+
+
+class ButtonRecord:
+    __slots__ = ('url',)
+
+    def __init__(self, url: str):
+        self.url = url
+
+
+def kind_of(message) -> str:
+    """Record kind of a Telethon message"""
+    if isinstance(message, MessageService):
+        return 'service'
+    if isinstance(getattr(message, 'media', None), MessageMediaWebPage):
+        return 'webpage'
+    return message_kind(message)
+
+
+class MessageRecord:
+    """
+    What the pipeline keeps of a message between fetching and sending.
+
+    Messages are turned into records as soon as they are fetched (or read from the
+    archive, or received in live mode), so the queues and the album being assembled
+    hold a few fields per message instead of Telethon objects with their entities,
+    media structures and raw TL data. Records have the Message attributes the send
+    path, the filters and the dedup index use; messages are forwarded by ID.
+    """
+
+    __slots__ = ('id', 'date', 'grouped_id', 'sender_id', 'kind', 'media_id', 'noforwards',
+                 'message', '_text', 'buttons', 'chat')
+
+    out = False
+
+    def __init__(self, id: int, date: Optional[datetime], grouped_id: Optional[int], sender_id: Optional[int],
+                 kind: str, media_id: int, noforwards: bool, message: str, text: Optional[str],
+                 buttons: Optional[List[List[ButtonRecord]]], chat):
+        self.id = id
+        self.date = date
+        self.grouped_id = grouped_id
+        self.sender_id = sender_id
+        self.kind = kind
+        self.media_id = media_id
+        self.noforwards = noforwards
+        self.message = message
+        self._text = text if text != message else None  # Formatted text, only kept when it differs
+        self.buttons = buttons
+        self.chat = chat
+
+    @classmethod
+    def from_message(cls, message, chat) -> 'MessageRecord':
+        """Record of a fetched message; `chat` is its (shared) origin chat"""
+        kind = kind_of(message)
+        media = getattr(message, 'photo', None) or getattr(message, 'document', None)
+        urls = [
+            ButtonRecord(button.url)
+            for row in getattr(message, 'buttons', None) or [] for button in row if getattr(button, 'url', None)
+        ]
+        raw = getattr(message, 'message', None) or ''
+        return cls(
+            message.id,
+            getattr(message, 'date', None),
+            getattr(message, 'grouped_id', None),
+            getattr(message, 'sender_id', None),
+            kind,
+            media.id if media is not None else 0,
+            bool(getattr(message, 'noforwards', False)),
+            raw,
+            getattr(message, 'text', None) or raw,
+            [urls] if urls else None,
+            chat,
+        )
+
+    @property
+    def text(self) -> str:
+        return self.message if self._text is None else self._text
+
+    @property
+    def service(self) -> bool:
+        """Whether this is a service message (joins, title changes...), which is never sent"""
+        return self.kind == 'service'
+
+    def _media_of(self, *kinds) -> Optional[MediaRef]:
+        return MediaRef(self.media_id) if self.kind in kinds else None
+
+    @property
+    def media(self):
+        if self.kind in ('text', 'service'):
+            return None
+        if self.kind == 'webpage':
+            return _WEBPAGE
+        return MediaRef(self.media_id)
+
+    @property
+    def photo(self):
+        return self._media_of('photo')
+
+    @property
+    def document(self):
+        return self._media_of(*DOCUMENT_KINDS)
+
+    @property
+    def video(self):
+        return self._media_of('video')
+
+    @property
+    def gif(self):
+        return self._media_of('gif')
+
+    @property
+    def sticker(self):
+        return self._media_of('sticker')
+
+    @property
+    def voice(self):
+        return self._media_of('voice')
+
+    @property
+    def video_note(self):
+        return self._media_of('round')
+
+    @property
+    def audio(self):
+        return self._media_of('audio')
+
+
+def to_records(messages, chat) -> List[MessageRecord]:
+    return [MessageRecord.from_message(message, chat) for message in messages]
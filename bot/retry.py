@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from telethon.errors import (
+    FloodWaitError, RpcCallFailError, ServerError, SlowModeWaitError, TimedOutError,
+)
+
+import clock
+
+logger = logging.getLogger('CloneGram.Retry')
+
+# Errors worth sending again: the server asked to wait, or the request failed on its side
+# or on the way. Anything else (no rights, invalid message...) fails the item at once
+SERVER_WAITS = (FloodWaitError, SlowModeWaitError)
+TRANSIENT_ERRORS = (ServerError, TimedOutError, RpcCallFailError, ConnectionError, asyncio.TimeoutError)
+
+
+def is_retryable(error: BaseException) -> bool:
+    return isinstance(error, SERVER_WAITS + TRANSIENT_ERRORS)
+
+
+class Retry:
+    """Queue items waiting to be sent again"""
+
+    __slots__ = ('due', 'items')
+
+    def __init__(self, due: float, items: List):
+        self.due = due
+        self.items = items
+
+
+class RetryScheduler:
+    """
+    Delay queues of the items to send again, one per destination (pair key).
+
+    FloodWait and SlowMode errors are retried after the wait the server asks for and
+    do not count as attempts; other transient errors back off exponentially from
+    `base_delay` up to `max_delay`, and the item fails after `max_attempts`.
+    A destination's retries are due in the order they were scheduled, and its sender
+    takes them before anything else it has queued, so source order is kept; each
+    destination waits only for its own retries.
+    """
+
+    def __init__(self, base_delay: float = 5.0, max_delay: float = 300.0, max_attempts: int = 5):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self._queues: Dict[str, Deque[Retry]] = {}  # Retries waiting per key, in due order
+        self._attempts: Dict[Tuple[str, int], int] = {}  # Failed attempts per (key, first message ID)
+
+    def schedule(self, key: str, items: List, error: BaseException) -> Optional[float]:
+        """
+        Schedule items (that failed with `error`) to be sent again, returning the delay,
+        or None when the error is not retryable or the attempts are exhausted
+        """
+        if isinstance(error, SERVER_WAITS):
+            delay = float(error.seconds)
+        elif isinstance(error, TRANSIENT_ERRORS):
+            attempt_key = (key, _first_id(items[0]))
+            attempts = self._attempts.get(attempt_key, 0) + 1
+            if attempts >= self.max_attempts:
+                self._attempts.pop(attempt_key, None)
+                return None
+            self._attempts[attempt_key] = attempts
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        else:
+            return None
+
+        # Never due before an earlier retry of the same destination
+        queue = self._queues.setdefault(key, deque())
+        due = max(clock.monotonic() + delay, queue[-1].due if queue else 0.0)
+        queue.append(Retry(due, items))
+        return delay
+
+    def will_retry(self, key: str, items: List, error: BaseException) -> bool:
+        """Whether scheduling `items` after `error` would retry them rather than give them up"""
+        if isinstance(error, SERVER_WAITS):
+            return True
+        if isinstance(error, TRANSIENT_ERRORS):
+            return self._attempts.get((key, _first_id(items[0])), 0) + 1 < self.max_attempts
+        return False
+
+    def pending(self, key: Optional[str] = None) -> int:
+        """Retries waiting for one destination (pair key), or for all of them"""
+        if key is not None:
+            return len(self._queues.get(key, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    def next_due(self, key: str) -> Optional[Retry]:
+        """Earliest retry of a destination"""
+        queue = self._queues.get(key)
+        return queue[0] if queue else None
+
+    async def take(self, key: str) -> List:
+        """Wait until the next retry of a destination is due and return its items"""
+        retry = self.next_due(key)
+        delay = retry.due - clock.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        queue = self._queues.get(key)
+        if queue and queue[0] is retry:  # Not cleared meanwhile
+            queue.popleft()
+            if not queue:
+                del self._queues[key]
+        return retry.items
+
+    def forget(self, key: str, up_to_id: int) -> None:
+        """Drop the attempt counts of items up to a checkpoint, which went through"""
+        if not self._attempts:
+            return
+        for attempt_key in [k for k in self._attempts if k[0] == key and k[1] <= up_to_id]:
+            del self._attempts[attempt_key]
+
+    def clear(self, key: str) -> None:
+        """Drop the retries of a destination whose sender stopped (they are fetched again)"""
+        self._queues.pop(key, None)
+
+
+def _first_id(item) -> int:
+    return item[2][0].id if isinstance(item, tuple) else item.id
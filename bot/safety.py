@@ -1,350 +1,245 @@
 import random
-import time
 import logging
-from datetime import datetime, timedelta
-from collections import defaultdict, deque
-import json
 from pathlib import Path
 import asyncio
+from collections import Counter
+
+import clock
+import metrics
+from activity_log import ActivityLog
+from window_limiter import SlidingWindowLimiter
 
 logger = logging.getLogger('CloneGram.Safety')
 
+HOUR = 3600
+DAY = 86400
+
 class AntiDetectionSafety:
     """
     Safety mechanisms to prevent account bans by making the bot behave more human-like
     and respecting Telegram's rate limits.
     """
-    
+
     def __init__(self, settings):
         self.settings = settings
-        self.counters_file = Path('./activity_counters.json')
-        
-        # Initialize counters for tracking message activity
-        self.hourly_counters = defaultdict(int)
-        self.daily_counters = defaultdict(int)
-        self.daily_media_counters = defaultdict(int)
-        
-        # Queue to keep track of message timestamps for rolling window calculations
-        self.hourly_timestamps = deque(maxlen=self.settings.hourly_limit)
-        self.daily_timestamps = deque(maxlen=self.settings.daily_limit)
-        self.daily_media_timestamps = deque(maxlen=self.settings.daily_media_limit)
-        
+        self.activity_log = ActivityLog(settings.activity_log_file)
+        self.legacy_counters_file = Path(settings.activity_log_file).with_name('activity_counters.json')
+
+        # Rolling windows for message activity (monotonic time, exact)
+        self.limits = SlidingWindowLimiter(clock.monotonic)
+        self.limits.add_window('hourly', self.settings.hourly_limit, HOUR)
+        self.limits.add_window('daily', self.settings.daily_limit, DAY)
+        self.limits.add_window('daily_media', self.settings.daily_media_limit, DAY)
+
         # Batch processing tracking
         self.current_batch_count = 0
-        
-        # Create the counters file if it doesn't exist
-        if not self.counters_file.exists():
-            try:
-                with open(self.counters_file, 'w') as f:
-                    json.dump({
-                        'hourly': {},
-                        'daily': {},
-                        'daily_media': {},
-                        'timestamps': {
-                            'hourly': [],
-                            'daily': [],
-                            'daily_media': []
-                        }
-                    }, f, indent=2)
-                logger.info(f"Created new activity counters file: {self.counters_file}")
-            except Exception as e:
-                logger.error(f"Error creating counters file: {str(e)}")
-        
+
+        # Seconds spent in apply_delay by cause: 'random', 'cooldown' or the binding window
+        self.delay_breakdown = Counter()
+
+        # Remaining budget of each window, read when metrics are scraped
+        metrics.WINDOW_REMAINING.set_function(
+            lambda: {(name,): self.limits.remaining(name) for name in self.limits.windows}
+        )
+
         # Load previous counters if available
         self._load_counters()
-        
-        # Clean up expired counters
-        self._cleanup_expired_counters()
-        
+
         # Log current limits
         logger.info(f"Safety system initialized with limits: daily={self.settings.daily_limit}, "
                    f"hourly={self.settings.hourly_limit}, media={self.settings.daily_media_limit}, "
                    f"delay={self.settings.min_delay}-{self.settings.max_delay}s")
-    
+
+    def _windows_for(self, is_media=False):
+        """Names of the windows a message counts against"""
+        return ('hourly', 'daily', 'daily_media') if is_media else ('hourly', 'daily')
+
     def _load_counters(self):
-        """Load activity counters from file"""
-        if not self.counters_file.exists():
-            logger.warning(f"Counters file {self.counters_file} does not exist. Will be created.")
-            return
-        
+        """Rebuild activity windows by replaying the activity log"""
         try:
-            with open(self.counters_file, 'r') as f:
-                data = json.load(f)
-                
-            # Load hourly counters (only those from the current hour)
-            current_hour = self._get_current_hour_key()
-            if 'hourly' in data and current_hour in data['hourly']:
-                self.hourly_counters[current_hour] = data['hourly'][current_hour]
-            
-            # Load daily counters (only those from the current day)
-            current_day = self._get_current_day_key()
-            if 'daily' in data and current_day in data['daily']:
-                self.daily_counters[current_day] = data['daily'][current_day]
-                
-            # Load daily media counters
-            if 'daily_media' in data and current_day in data['daily_media']:
-                self.daily_media_counters[current_day] = data['daily_media'][current_day]
-                
-            # Load timestamps (for more accurate tracking)
-            if 'timestamps' in data:
-                for ts_str in data['timestamps'].get('hourly', []):
-                    try:
-                        self.hourly_timestamps.append(datetime.fromisoformat(ts_str))
-                    except Exception as e:
-                        logger.error(f"Error parsing hourly timestamp {ts_str}: {str(e)}")
-                
-                for ts_str in data['timestamps'].get('daily', []):
-                    try:
-                        self.daily_timestamps.append(datetime.fromisoformat(ts_str))
-                    except Exception as e:
-                        logger.error(f"Error parsing daily timestamp {ts_str}: {str(e)}")
-                
-                for ts_str in data['timestamps'].get('daily_media', []):
-                    try:
-                        self.daily_media_timestamps.append(datetime.fromisoformat(ts_str))
-                    except Exception as e:
-                        logger.error(f"Error parsing media timestamp {ts_str}: {str(e)}")
-                    
-            logger.info(f"Loaded activity counters: hourly={self.hourly_counters.get(current_hour, 0)}, "
-                       f"daily={self.daily_counters.get(current_day, 0)}, "
-                       f"daily_media={self.daily_media_counters.get(current_day, 0)}")
+            entries = self.activity_log.load()
+            if not entries and self.activity_log.import_legacy_json(self.legacy_counters_file):
+                entries = list(self.activity_log.entries)
+
+            # The log stores wall-clock times; map them onto the monotonic clock
+            offset = self.limits.clock() - clock.time()
+            for ts, is_media in entries:
+                self.limits.record(self._windows_for(is_media), ts + offset)
+
+            logger.info(f"Loaded activity counters: hourly={self.limits.count('hourly')}, "
+                       f"daily={self.limits.count('daily')}, "
+                       f"daily_media={self.limits.count('daily_media')}")
         except Exception as e:
             logger.error(f"Error loading counters: {str(e)}")
             import traceback
             logger.error(traceback.format_exc())
-    
-    def _save_counters(self):
-        """Save activity counters to file"""
+
+    def _save_counters(self, timestamp: float, is_media: bool = False):
+        """Append the send to the activity log (O(1), no file rewrite)"""
         try:
-            # Prepare data structure
-            data = {
-                'hourly': dict(self.hourly_counters),
-                'daily': dict(self.daily_counters),
-                'daily_media': dict(self.daily_media_counters),
-                'timestamps': {
-                    'hourly': [ts.isoformat() for ts in self.hourly_timestamps],
-                    'daily': [ts.isoformat() for ts in self.daily_timestamps],
-                    'daily_media': [ts.isoformat() for ts in self.daily_media_timestamps]
-                }
-            }
-            
-            # Write to file (ensure the path exists)
-            with open(self.counters_file, 'w') as f:
-                json.dump(data, f, indent=2)
-                
-            logger.info(f"Saved activity counters to {self.counters_file}")
+            self.activity_log.append(timestamp, is_media)
         except Exception as e:
             logger.error(f"Error saving counters: {str(e)}")
             # Print detailed information for debugging
             import traceback
             logger.error(traceback.format_exc())
-    
-    def _cleanup_expired_counters(self):
-        """Clean up counters that are no longer relevant (older than a day)"""
-        current_hour = self._get_current_hour_key()
-        current_day = self._get_current_day_key()
-        
-        # Keep only the current hour and the previous hour
-        self.hourly_counters = {
-            k: v for k, v in self.hourly_counters.items()
-            if k == current_hour or k == self._get_hour_key(hours_ago=1)
-        }
-        
-        # Keep only the current day and the previous day
-        self.daily_counters = {
-            k: v for k, v in self.daily_counters.items()
-            if k == current_day or k == self._get_day_key(days_ago=1)
-        }
-        
-        # Same for media counters
-        self.daily_media_counters = {
-            k: v for k, v in self.daily_media_counters.items()
-            if k == current_day or k == self._get_day_key(days_ago=1)
-        }
-    
-    def _get_current_hour_key(self):
-        """Get a string key for the current hour"""
-        return datetime.now().strftime('%Y-%m-%d-%H')
-    
-    def _get_hour_key(self, hours_ago=0):
-        """Get a string key for X hours ago"""
-        return (datetime.now() - timedelta(hours=hours_ago)).strftime('%Y-%m-%d-%H')
-    
-    def _get_current_day_key(self):
-        """Get a string key for the current day"""
-        return datetime.now().strftime('%Y-%m-%d')
-    
-    def _get_day_key(self, days_ago=0):
-        """Get a string key for X days ago"""
-        return (datetime.now() - timedelta(days=days_ago)).strftime('%Y-%m-%d')
-    
-    def _is_night_time(self):
-        """Check if current time is within night hours"""
+
+    def close(self):
+        """Release the activity log file"""
+        self.activity_log.close()
+
+    def _is_night_time(self, when=None):
+        """Check if current time (or `when`) is within night hours"""
         if not self.settings.night_mode:
             return False
-            
-        current_hour = datetime.now().hour
+
+        current_hour = (when or clock.now()).hour
         # Handle cases where night spans across midnight
         if self.settings.night_start <= self.settings.night_end:
             return self.settings.night_start <= current_hour < self.settings.night_end
         else:
             return current_hour >= self.settings.night_start or current_hour < self.settings.night_end
-    
-    def _is_weekend(self):
-        """Check if current day is a weekend day"""
+
+    def _is_weekend(self, when=None):
+        """Check if current day (or the day of `when`) is a weekend day"""
         if not self.settings.weekend_mode:
             return False
-            
+
         # 5 = Saturday, 6 = Sunday
-        return datetime.now().weekday() >= 5
-    
-    def _get_delay_multiplier(self):
-        """Calculate the current delay multiplier based on time factors"""
+        return (when or clock.now()).weekday() >= 5
+
+    def _get_delay_multiplier(self, when=None):
+        """Calculate the delay multiplier based on time factors, now or at `when`"""
         multiplier = 1.0
-        
+
         # Apply night mode multiplier if applicable
-        if self._is_night_time():
+        if self._is_night_time(when):
             multiplier *= self.settings.night_multiplier
-            
+
         # Apply weekend multiplier if applicable
-        if self._is_weekend():
+        if self._is_weekend(when):
             multiplier *= self.settings.weekend_multiplier
-            
+
         return multiplier
-        
+
     def _get_random_delay(self):
         """Get a random delay between min and max delay, adjusted for time-based factors"""
         base_delay = random.uniform(self.settings.min_delay, self.settings.max_delay)
         return base_delay * self._get_delay_multiplier()
-    
-    def _update_counters(self, is_media=False):
+
+    def expected_delay(self):
+        """Mean random delay a send would take now"""
+        return (self.settings.min_delay + self.settings.max_delay) / 2 * self._get_delay_multiplier()
+
+    def _update_counters(self, is_media=False, count=1, media_count=None):
         """Update activity counters"""
         try:
-            now = datetime.now()
-            
-            # Update hourly counter
-            current_hour = self._get_current_hour_key()
-            if current_hour not in self.hourly_counters:
-                self.hourly_counters[current_hour] = 0
-            self.hourly_counters[current_hour] += 1
-            self.hourly_timestamps.append(now)
-            
-            # Update daily counter
-            current_day = self._get_current_day_key()
-            if current_day not in self.daily_counters:
-                self.daily_counters[current_day] = 0
-            self.daily_counters[current_day] += 1
-            self.daily_timestamps.append(now)
-            
-            # Update media counter if applicable
-            if is_media:
-                if current_day not in self.daily_media_counters:
-                    self.daily_media_counters[current_day] = 0
-                self.daily_media_counters[current_day] += 1
-                self.daily_media_timestamps.append(now)
-            
+            media_count = (count if is_media else 0) if media_count is None else media_count
+            self.limits.record(('hourly', 'daily'), n=count)
+            self.limits.record(('daily_media',), n=media_count)
+
             # Increment batch counter
-            self.current_batch_count += 1
-            
-            # Log current counts
-            logger.info(f"Updated counters: hourly={self.hourly_counters[current_hour]}/{self.settings.hourly_limit}, "
-                      f"daily={self.daily_counters[current_day]}/{self.settings.daily_limit}"
-                      + (f", media={self.daily_media_counters[current_day]}/{self.settings.daily_media_limit}" if is_media else ""))
-            
-            # Save counters every time (for debugging)
-            self._save_counters()
+            self.current_batch_count += count
+
+            # Log current counts (counting prunes the windows, so only when DEBUG is on)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Updated counters: hourly=%d/%d, daily=%d/%d, media=%d/%d",
+                             self.limits.count('hourly'), self.settings.hourly_limit,
+                             self.limits.count('daily'), self.settings.daily_limit,
+                             self.limits.count('daily_media'), self.settings.daily_media_limit)
+
+            # Persist the sends (one append per message to the activity log)
+            now = clock.time()
+            for index in range(count):
+                self._save_counters(now, index < media_count)
         except Exception as e:
             logger.error(f"Error updating counters: {str(e)}")
             import traceback
             logger.error(traceback.format_exc())
             # Error in updating counters shouldn't prevent the message from being processed
-    
-    def _check_rate_limits(self, is_media=False):
-        """Check if we've hit any rate limits"""
-        current_hour = self._get_current_hour_key()
-        current_day = self._get_current_day_key()
-        
-        # Check hourly limit
-        hourly_count = self.hourly_counters.get(current_hour, 0)
-        if hourly_count >= self.settings.hourly_limit:
-            # If we have timestamps to check, calculate remaining time more precisely
-            if self.hourly_timestamps:
-                remaining = 3600 - (datetime.now() - min(self.hourly_timestamps)).total_seconds()
-                wait_time = max(60, int(remaining))
-                logger.warning(f"Hourly limit reached ({hourly_count}/{self.settings.hourly_limit}). Waiting {wait_time} seconds")
-                return False, wait_time
-            else:
-                # If no timestamps, just wait for an hour
-                logger.warning(f"Hourly limit reached ({hourly_count}/{self.settings.hourly_limit}). Waiting 3600 seconds")
-                return False, 3600
-        
-        # Check daily limit
-        daily_count = self.daily_counters.get(current_day, 0)
-        if daily_count >= self.settings.daily_limit:
-            # Calculate seconds until midnight
-            now = datetime.now()
-            tomorrow = datetime(now.year, now.month, now.day) + timedelta(days=1)
-            wait_time = int((tomorrow - now).total_seconds())
-            logger.warning(f"Daily limit reached ({daily_count}/{self.settings.daily_limit}). Waiting until midnight ({wait_time} seconds)")
-            return False, wait_time
-            
-        # Check daily media limit (if applicable)
-        if is_media:
-            daily_media_count = self.daily_media_counters.get(current_day, 0)
-            if daily_media_count >= self.settings.daily_media_limit:
-                # Calculate seconds until midnight
-                now = datetime.now()
-                tomorrow = datetime(now.year, now.month, now.day) + timedelta(days=1)
-                wait_time = int((tomorrow - now).total_seconds())
-                logger.warning(f"Daily media limit reached ({daily_media_count}/{self.settings.daily_media_limit}). Waiting until midnight ({wait_time} seconds)")
-                return False, wait_time
-        
+
+    def _check_rate_limits(self, is_media=False, count=1, media_count=None):
+        """
+        Check if we've hit any rate limits.
+        Returns (can_proceed, wait_time, reason), reason being the binding window or 'cooldown'.
+        """
+        media_count = (count if is_media else 0) if media_count is None else media_count
+
+        # Exact wait until enough old messages leave their rolling windows
+        wait_time, window = self.limits.wait_time(('hourly', 'daily'), n=count)
+        media_wait, media_window = self.limits.wait_time(('daily_media',), n=media_count)
+        if media_wait > wait_time:
+            wait_time, window = media_wait, media_window
+        if wait_time > 0:
+            limit = self.limits.windows[window].limit
+            logger.warning(f"{window.replace('_', ' ').capitalize()} limit reached ({limit}/{limit}). "
+                           f"Waiting {wait_time:.0f} seconds")
+            return False, wait_time, window
+
         # Check batch size limit - MODIFICAÇÃO PARA RESOLVER O PROBLEMA
         # Só verifica o limite de batch se não for uma mensagem de mídia,
         # pois os media groups precisam ser tratados de forma especial
-        if not is_media and self.current_batch_count >= self.settings.max_batch_size:
+        if (not is_media or count > 1) and self.current_batch_count >= self.settings.max_batch_size:
             self.current_batch_count = 0  # Reset batch counter
             logger.warning(f"Batch size limit reached ({self.settings.max_batch_size}). Taking a break for {self.settings.batch_cooldown} seconds")
-            return False, self.settings.batch_cooldown
-        
-        return True, 0
-    
-    async def apply_delay(self, is_media=False):
+            return False, self.settings.batch_cooldown, 'cooldown'
+
+        return True, 0, None
+
+    def capacity(self, is_media=False):
+        """
+        How many messages (media messages, if is_media) can be sent right now without
+        hitting a limit or the batch cooldown
+        """
+        room = [
+            self.limits.remaining('hourly'),
+            self.limits.remaining('daily'),
+            self.settings.max_batch_size - self.current_batch_count,
+        ]
+        if is_media:
+            room.append(self.limits.remaining('daily_media'))
+        return max(0, min(room))
+
+    def record_sent(self, count=1, media_count=0):
+        """Count messages against the limits (after apply_delay(..., record=False))"""
+        self._update_counters(count=count, media_count=media_count)
+
+    async def apply_delay(self, is_media=False, count=1, media_count=None, record=True):
         """
         Apply appropriate delay and check rate limits.
+        `count` messages sent in one request (with `media_count` of them carrying media)
+        share a single random delay but each one counts against the limits.
+        With record=False they are not counted yet: the caller counts what was actually
+        delivered with record_sent.
         Returns True if should continue, False if should stop.
         """
         try:
-            # Get current counts for logging
-            current_hour = self._get_current_hour_key()
-            current_day = self._get_current_day_key()
-            hourly_count = self.hourly_counters.get(current_hour, 0)
-            daily_count = self.daily_counters.get(current_day, 0)
-            daily_media_count = self.daily_media_counters.get(current_day, 0) if is_media else 0
-            
-            logger.info(f"Current counts: hourly={hourly_count}/{self.settings.hourly_limit}, "
-                    f"daily={daily_count}/{self.settings.daily_limit}, "
-                    f"media={daily_media_count}/{self.settings.daily_media_limit}")
-            
-            # Check if we're within rate limits
-            can_proceed, wait_time = self._check_rate_limits(is_media)
-            
-            if not can_proceed:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Current counts: hourly=%d/%d, daily=%d/%d, media=%d/%d",
+                             self.limits.count('hourly'), self.settings.hourly_limit,
+                             self.limits.count('daily'), self.settings.daily_limit,
+                             self.limits.count('daily_media'), self.settings.daily_media_limit)
+
+            # Check if we're within rate limits. Waits are exact, so keep waiting
+            # until a slot is free instead of giving up after one attempt
+            can_proceed, wait_time, reason = self._check_rate_limits(is_media, count, media_count)
+            while not can_proceed:
                 await asyncio.sleep(wait_time)
-                # After waiting, check again
-                can_proceed, wait_time = self._check_rate_limits(is_media)
-                if not can_proceed:
-                    logger.error("Still hitting rate limits after waiting. Stopping.")
-                    return False
-            
+                self.delay_breakdown[reason] += wait_time
+                metrics.SAFETY_DELAY_SECONDS.labels('cooldown' if reason == 'cooldown' else 'limit_wait').inc(wait_time)
+                can_proceed, wait_time, reason = self._check_rate_limits(is_media, count, media_count)
+
             # Add a random delay to make the bot seem more human-like
             delay = self._get_random_delay()
-            logger.info(f"Applying safety delay of {delay:.2f} seconds")
+            logger.debug("Applying safety delay of %.2f seconds", delay)
             await asyncio.sleep(delay)
-            
+            self.delay_breakdown['random'] += delay
+            metrics.SAFETY_DELAY_SECONDS.labels('random').inc(delay)
+
             # Update counters after successful delay
-            self._update_counters(is_media)
-            
+            if record:
+                self._update_counters(is_media, count, media_count)
+
             return True
         except Exception as e:
             logger.error(f"Error in safety delay mechanism: {str(e)}")
@@ -352,4 +247,4 @@ class AntiDetectionSafety:
             logger.error(traceback.format_exc())
             # Return True to allow the operation to continue anyway
             # This prevents the safety mechanism from blocking normal operation
-            return True
\ No newline at end of file
+            return True
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional, Union
 
 class Settings(BaseSettings):
     # Account credentials
@@ -9,8 +9,10 @@ class Settings(BaseSettings):
     api_id: str
     api_hash: str
 
-    origin_group: int
-    destiny_group: int
+    origin_group: Optional[int] = None
+    destiny_group: Optional[Union[int, List[int]]] = None  # One ID, or a JSON list of IDs to copy the origin to each
+    pairs_file: Optional[str] = None  # JSON/YAML list of {origin, destiny, topic_id} pairs (replaces the two above)
+    filters_file: Optional[str] = None  # JSON/YAML filter rules applied before messages are queued (see filters.py)
     
     # Anti-ban settings with default values
     min_delay: int = 3            # Minimum delay between messages (seconds)
@@ -28,6 +30,63 @@ class Settings(BaseSettings):
     weekend_multiplier: float = 1.5 # Multiply delays by this factor during weekends
     check_interval: int = 300    # Intervalo para verificar novas mensagens (segundos)
     continuous_mode: bool = True # Executar continuamente verificando novas mensagens
+    live_mode: bool = False      # Receber mensagens novas por eventos (check_interval vira o tempo de silêncio antes de verificar o histórico)
+
+    # Fetch pipeline
+    fetch_page_size: int = 100      # Messages requested per history page
+    prefetch_queue_size: int = 500  # High-water mark of the prefetch queue (fetching pauses when full)
+    forward_batch_size: int = 1     # Forward up to N consecutive messages per request (1 = off, max 100)
+
+    # API rate limits, adapted by AIMD: halved on every FloodWait, raised slowly back up to the ceiling
+    api_rate_limit: int = 20          # Ceiling of forward/send requests per minute (each type learns its own rate)
+    fetch_rate_limit: int = 60        # Ceiling of history page requests per minute
+    rate_increase: float = 1.0        # Requests per minute added for each minute of accepted requests
+    rate_decrease: float = 0.5        # Rate multiplier applied on FloodWait
+    rate_state_file: str = './data/rate_state.json'  # Learned rates, kept across restarts
+    flood_sleep_threshold: int = 11   # FloodWaits up to this many seconds are slept by Telethon itself (not learned from)
+
+    # Sends that fail are retried later, in order within their destination (FloodWait/SlowMode: after the wait asked for)
+    retry_base_delay: float = 5.0     # First backoff after a transient error (seconds), doubled on each attempt...
+    retry_max_delay: float = 300.0    # ...up to this
+    retry_max_attempts: int = 5       # Give a message up after this many transient errors
+
+    # Progress persistence
+    progress_backend: str = 'sqlite'     # 'sqlite' (WAL, batched commits) or 'json' (legacy progress.json)
+    progress_db: str = './data/progress.db' # SQLite database file (progress.json is migrated into it once)
+    progress_flush_every: int = 20       # Commit progress after this many checkpoints...
+    progress_flush_interval: float = 5.0 # ...or after this many seconds, whichever comes first
+    message_map_db: str = './data/message_map.db'  # Source -> destination message IDs (exactly-once resume)
+    peer_cache_file: str = './data/peer_cache.json'  # Resolved chats (input peer, title, noforwards)
+    peer_cache_ttl: int = 86400                 # Re-resolve cached chats after this many seconds
+    activity_log_file: str = './data/activity_counters.bin'  # Append-only log backing the safety counters
+
+    # Content dedup: reposts of media/text already sent to the destination are skipped
+    dedup: bool = False                 # Enable the dedup stage
+    dedup_file: str = './data/dedup.bin' # Persistent index (Bloom filters + recent exact hashes)
+    dedup_capacity: int = 1_000_000     # Keys per Bloom generation (two generations kept; about 3.6 MB each)
+    dedup_recent: int = 50_000          # Most recent keys kept exactly (0 = Bloom filters only)
+    dedup_min_text_length: int = 20     # Shorter text-only messages are never treated as duplicates
+
+    # Local archive of fetched history: re-runs read it instead of fetching the same pages again
+    archive: bool = False               # Enable the archive
+    archive_dir: str = './data/archive' # One directory of segments and an ID index per origin chat
+
+    # Logging
+    log_level: str = 'INFO'            # Per-message lines (fetched, forwarded, delays, counters) are DEBUG
+    log_format: str = 'text'           # 'text' or 'json' (one JSON object per line)
+    log_queue: bool = True             # Write logs from a background thread instead of the event loop
+    log_summary_interval: float = 60.0 # Seconds between INFO summary lines with counts and rates (0 = off)
+    progress_display: str = 'auto'     # 'bar' (tqdm), 'log' (a line every PROGRESS_INTERVAL), 'off'; 'auto' = bar on a terminal
+    progress_interval: float = 60.0    # Seconds between progress lines in 'log' mode
+
+    # Metrics
+    metrics_port: Optional[int] = None # Serve Prometheus metrics at http://METRICS_HOST:METRICS_PORT/metrics
+    metrics_host: str = '127.0.0.1'
+
+    # Introspection: profiles, task dumps, allocation diffs and loop lag on demand (also via SIGUSR1/SIGUSR2)
+    introspect_port: Optional[int] = None   # Accept commands at INTROSPECT_HOST:INTROSPECT_PORT (e.g. `echo help | nc`)
+    introspect_host: str = '127.0.0.1'
+    introspect_dir: str = './data/introspect' # Where profiles and dumps are saved
 
     class Config:
         env_file = '.env'
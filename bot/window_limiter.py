@@ -0,0 +1,88 @@
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Tuple
+
+import clock
+
+
+class _Window:
+    __slots__ = ('limit', 'period', 'events')
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        # Only the newest `limit` events can ever decide the next allowed time
+        self.events: Deque[float] = deque(maxlen=max(1, limit))
+
+    def prune(self, now: float) -> None:
+        cutoff = now - self.period
+        events = self.events
+        while events and events[0] <= cutoff:
+            events.popleft()
+
+    def next_allowed(self, now: float, n: int = 1) -> float:
+        """Earliest time at which n more events fit in the window"""
+        if n > self.limit:
+            return float('inf')
+        self.prune(now)
+        overflow = len(self.events) + n - self.limit
+        if overflow <= 0:
+            return now
+        return self.events[overflow - 1] + self.period
+
+
+class SlidingWindowLimiter:
+    """
+    Exact sliding-window limits keyed on monotonic time.
+
+    Each named window allows at most `limit` events in any `period` seconds.
+    Checking, recording and computing the next allowed time are O(1) amortized,
+    since every event is appended and expired exactly once. Rolling windows on a
+    monotonic clock are unaffected by midnight, DST changes or wall-clock jumps.
+    """
+
+    def __init__(self, clock: Callable[[], float] = clock.monotonic):
+        self.clock = clock
+        self.windows: Dict[str, _Window] = {}
+
+    def add_window(self, name: str, limit: int, period: float) -> None:
+        self.windows[name] = _Window(limit, period)
+
+    def next_allowed(self, names: Iterable[str], now: float | None = None, n: int = 1) -> Tuple[float, str | None]:
+        """Return the earliest time n events may be recorded in all windows, and the binding window"""
+        now = self.clock() if now is None else now
+        allowed_at, binding = now, None
+        if n <= 0:
+            return allowed_at, binding
+        for name in names:
+            window_time = self.windows[name].next_allowed(now, n)
+            if window_time > allowed_at:
+                allowed_at, binding = window_time, name
+        return allowed_at, binding
+
+    def wait_time(self, names: Iterable[str], now: float | None = None, n: int = 1) -> Tuple[float, str | None]:
+        """Seconds to wait before n events fit in all windows (0 if they fit now)"""
+        now = self.clock() if now is None else now
+        allowed_at, binding = self.next_allowed(names, now, n)
+        return allowed_at - now, binding
+
+    def record(self, names: Iterable[str], now: float | None = None, n: int = 1) -> None:
+        now = self.clock() if now is None else now
+        for name in names:
+            events = self.windows[name].events
+            for _ in range(n):
+                events.append(now)
+
+    def count(self, name: str, now: float | None = None) -> int:
+        """Events currently inside the window (capped at its limit)"""
+        window = self.windows[name]
+        window.prune(self.clock() if now is None else now)
+        return len(window.events)
+
+    def remaining(self, name: str, now: float | None = None) -> int:
+        return max(0, self.windows[name].limit - self.count(name, now))
+
+    def events(self, name: str, now: float | None = None) -> List[float]:
+        """Times of the events currently inside the window, oldest first"""
+        window = self.windows[name]
+        window.prune(self.clock() if now is None else now)
+        return list(window.events)
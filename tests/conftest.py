@@ -0,0 +1,28 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The bot's modules import each other as top-level modules (python bot/main.py);
+# the fake Telegram client lives with the benchmarks
+sys.path[:0] = [str(ROOT / 'bot'), str(ROOT / 'benchmarks')]
+
+# bot/main.py reads its settings from the environment when it is imported
+os.environ.update({
+    'ACCOUNT_NAME': 'test', 'PHONE_NUMBER': '0', 'PASSWORD': '', 'API_ID': '1', 'API_HASH': 'test',
+    'ORIGIN_GROUP': '-1000000001001', 'DESTINY_GROUP': '-1000000001002',
+    'LOG_LEVEL': 'ERROR', 'LOG_QUEUE': 'false', 'LOG_SUMMARY_INTERVAL': '0', 'PROGRESS_DISPLAY': 'off',
+    'MIN_DELAY': '0', 'MAX_DELAY': '0', 'NIGHT_MODE': 'false', 'WEEKEND_MODE': 'false',
+    'FORWARD_BATCH_SIZE': '10',
+})
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory, where the bot keeps its state files"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'sessions').mkdir()
+    return tmp_path
@@ -0,0 +1,57 @@
+"""
+Errors while reading the origin history: transient ones are retried, any other one
+stops the pair instead of being retried forever.
+"""
+import asyncio
+
+from telethon.errors import ChannelPrivateError, ServerError
+
+import clock
+from fake_telegram import FakeTelegram, SyntheticHistory
+from main import Bot
+from pairs import ClonePair
+
+ORIGIN_ID = 1001
+DESTINY_ID = 1002
+ORIGIN_GROUP = -1000000000000 - ORIGIN_ID
+DESTINY_GROUP = -1000000000000 - DESTINY_ID
+SIZE = 300
+
+
+class FailingBot(FakeTelegram, Bot):
+    """Raises the next of `errors` on history pages (not on the newest-message lookup)"""
+
+    latency = 0.0
+    errors = ()
+
+    async def iter_messages(self, entity, limit=None, offset_id=0, **kwargs):
+        if entity.id == self.origin.chat.id and limit != 1 and self.errors:
+            error, self.errors = self.errors[0], self.errors[1:]
+            raise error
+        async for message in super().iter_messages(entity, limit=limit, offset_id=offset_id, **kwargs):
+            yield message
+
+
+def _clone(errors):
+    async def clone():
+        bot = FailingBot()
+        bot.setup_fake(SyntheticHistory(ORIGIN_ID, SIZE), DESTINY_ID)
+        bot.errors = tuple(errors)
+        try:
+            # A pair that never ends would hang here
+            await asyncio.wait_for(bot.clone_pairs([ClonePair(ORIGIN_GROUP, DESTINY_GROUP)]), timeout=7 * 86400)
+            return [pipe.last_processed_msg for pipe in bot.pipelines.values()]
+        finally:
+            bot.message_map.close()
+            bot.progress_tracker.close()
+            bot.safety.close()
+
+    return clock.VirtualClock().run(clone())
+
+
+def test_transient_errors_are_retried(workdir):
+    assert _clone([ServerError(None, 'try again'), ConnectionError('reset')]) == [SIZE]
+
+
+def test_permanent_error_stops_the_pair(workdir):
+    assert _clone([ChannelPrivateError(None)] * 1000) == [0]
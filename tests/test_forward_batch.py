@@ -0,0 +1,84 @@
+"""
+Forwarding a batch against FakeTelegram: only the messages that arrived count against
+the safety limits, so those sent again one by one are not counted twice, and a spent
+media budget does not keep text messages from being batched.
+"""
+import pytest
+from telethon.errors import FloodWaitError
+
+import clock
+from fake_telegram import FakeChat, FakeTelegram, SyntheticHistory
+from main import Bot
+from pipeline import ClonePipeline
+from safety import AntiDetectionSafety
+from settings import Settings
+
+ORIGIN_ID = 1001
+DESTINY_ID = 1002
+
+
+class PartialBot(FakeTelegram, Bot):
+    """Forwards a batch but loses `lost` on the way, then fails as if the request timed out"""
+
+    latency = 0.0
+    lost = frozenset()
+    error = None
+
+    async def forward_messages(self, entity, messages, from_peer=None, **kwargs):
+        if isinstance(self.error, FloodWaitError):
+            raise self.error
+        self._deliver([self._source(message) for message in messages if message not in self.lost], entity)
+        raise RuntimeError('timed out')
+
+
+def _run(lost=(), error=None, size=10):
+    history = SyntheticHistory(ORIGIN_ID, size, album_rate=0, service_rate=0, noforwards_rate=0, media_rate=0.5)
+    batch = [history.message(message_id) for message_id in range(1, size + 1)]
+
+    async def forward():
+        bot = PartialBot()
+        bot.setup_fake(history, DESTINY_ID)
+        bot.lost, bot.error = frozenset(lost), error
+        pipe = ClonePipeline(FakeChat(ORIGIN_ID), FakeChat(DESTINY_ID))
+        pipe.last_destiny_msg_id = 0
+        try:
+            try:
+                delivered = await bot._forward_batch(pipe, batch)
+            except FloodWaitError:
+                delivered = None
+            limits = bot.safety.limits
+            return delivered, {name: limits.count(name) for name in limits.windows}, bot.safety.current_batch_count
+        finally:
+            bot.message_map.close()
+            bot.progress_tracker.close()
+            bot.safety.close()
+
+    delivered, counts, batch_count = clock.VirtualClock().run(forward())
+    media = {message.id for message in batch if message.media is not None}
+    return batch, delivered, counts, batch_count, media
+
+
+@pytest.mark.parametrize('lost', [(), (1,), (4,), (2, 7), (10,), tuple(range(1, 11))])
+def test_partial_batch_counts_only_what_arrived(workdir, lost):
+    batch, delivered, counts, batch_count, media = _run(lost)
+    expected = {message.id for message in batch} - set(lost)
+    assert delivered == expected
+    assert counts == {'hourly': len(expected), 'daily': len(expected), 'daily_media': len(expected & media)}
+    assert batch_count == len(expected)
+
+
+def test_flood_wait_counts_nothing(workdir):
+    _, delivered, counts, batch_count, _ = _run(error=FloodWaitError(None, capture=30))
+    assert delivered is None
+    assert counts == {'hourly': 0, 'daily': 0, 'daily_media': 0}
+    assert batch_count == 0
+
+
+def test_spent_media_budget_only_limits_media(workdir):
+    safety = AntiDetectionSafety(Settings(daily_media_limit=5, hourly_limit=100, daily_limit=100, max_batch_size=50))
+    try:
+        safety.record_sent(count=5, media_count=5)
+        assert safety.capacity(is_media=True) == 0
+        assert safety.capacity() == 45
+    finally:
+        safety.close()
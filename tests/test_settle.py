@@ -0,0 +1,92 @@
+"""
+Settling sends left in doubt: our copies are found in a destination where other members
+post too, and a message without text is only matched by a copy of its media.
+"""
+import clock
+from fake_telegram import FakeChat, FakeMessage, FakePhoto, FakeTelegram, SyntheticHistory
+from main import Bot
+from message_map import fingerprint, matches
+from pipeline import ClonePipeline
+
+ORIGIN_ID = 1001
+DESTINY_ID = 1002
+
+
+class SettleBot(FakeTelegram, Bot):
+    latency = 0.0
+
+
+def _settle(prepare):
+    """Record an intent for the messages `prepare(bot)` returns after doing its sends, then settle it"""
+    async def settle():
+        bot = SettleBot()
+        bot.setup_fake(SyntheticHistory(ORIGIN_ID, 100, album_rate=0, service_rate=0), DESTINY_ID)
+        pipe = ClonePipeline(FakeChat(ORIGIN_ID), FakeChat(DESTINY_ID))
+        try:
+            after_id = bot.sent_count
+            messages = prepare(bot)
+            bot.message_map.intend(pipe.key, messages, after_id)
+            found, missing = await bot._settle_in_doubt(pipe)
+            return [sent.id for sent in found], missing
+        finally:
+            bot.message_map.close()
+            bot.progress_tracker.close()
+            bot.safety.close()
+
+    return clock.VirtualClock().run(settle())
+
+
+def test_copies_are_found_among_posts_of_other_members(workdir):
+    def prepare(bot):
+        messages = [bot.origin.message(message_id) for message_id in range(1, 6)]
+        for message in messages:
+            for _ in range(150):  # Pages of other members' posts between our copies
+                bot.post_foreign('someone else')
+            bot._deliver([message])
+        return messages
+
+    found, missing = _settle(prepare)
+    assert len(found) == 5
+    assert missing == []
+
+
+def test_message_without_text_is_not_matched_by_another_message(workdir):
+    photo = FakeMessage(1, FakeChat(ORIGIN_ID), media=FakePhoto(77))
+
+    def prepare(bot):
+        # Only unrelated messages arrived: ours without text, a foreign photo without text
+        bot._deliver([FakeMessage(2, FakeChat(ORIGIN_ID), text='another message')])
+        bot._deliver([FakeMessage(3, FakeChat(ORIGIN_ID), media=FakePhoto(78))])
+        bot.post_foreign(media=FakePhoto(77))
+        return [photo]
+
+    assert _settle(prepare) == ([], [1])
+
+
+def test_message_without_text_is_matched_by_its_copy(workdir):
+    photo = FakeMessage(1, FakeChat(ORIGIN_ID), media=FakePhoto(77))
+
+    def prepare(bot):
+        bot._deliver([photo])
+        return [photo]
+
+    found, missing = _settle(prepare)
+    assert len(found) == 1
+    assert missing == []
+
+
+def test_fingerprint_of_a_message_without_text_keeps_its_media():
+    chat = FakeChat(ORIGIN_ID)
+    photo = FakeMessage(1, chat, media=FakePhoto(77))
+    assert fingerprint(photo) == '0:00000000:77'
+    assert matches(fingerprint(photo), FakeMessage(2, chat, media=FakePhoto(77), text='caption added'))
+    assert not matches(fingerprint(photo), FakeMessage(2, chat, text='any text'))
+    assert not matches(fingerprint(photo), FakeMessage(2, chat, media=FakePhoto(78)))
+
+
+def test_fingerprint_of_older_intents_still_matches():
+    chat = FakeChat(ORIGIN_ID)
+    text = FakeMessage(1, chat, text='hello')
+    legacy = fingerprint(text).rsplit(':', 1)[0]
+    assert matches(legacy, text)
+    assert not matches(legacy, FakeMessage(2, chat, text='other'))
@@ -0,0 +1,34 @@
+"""
+State files default to ./data: stores create the directory, and files an older version
+left in the working directory are moved there once.
+"""
+from pathlib import Path
+
+from main import move_legacy_state
+from message_map import MessageMap
+from progress_tracker import create_progress_backend
+
+
+def test_stores_create_the_data_directory(workdir):
+    create_progress_backend('sqlite').close()
+    MessageMap().close()
+    assert Path('data/progress.db').exists()
+    assert Path('data/message_map.db').exists()
+
+
+def test_legacy_state_is_moved_to_the_data_directory(workdir):
+    for name in ('progress.db', 'progress.db-wal', 'progress.json', 'dedup.bin', 'dedup.bin.journal'):
+        Path(name).write_text(name)
+    move_legacy_state()
+    for name in ('progress.db', 'progress.db-wal', 'progress.json', 'dedup.bin', 'dedup.bin.journal'):
+        assert not Path(name).exists()
+        assert Path('data', name).read_text() == name
+
+
+def test_legacy_state_does_not_replace_the_current_one(workdir):
+    Path('data').mkdir()
+    Path('data/message_map.db').write_text('current')
+    Path('message_map.db').write_text('legacy')
+    move_legacy_state()
+    assert Path('data/message_map.db').read_text() == 'current'
+    assert Path('message_map.db').exists()
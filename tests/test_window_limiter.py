@@ -0,0 +1,85 @@
+"""
+SlidingWindowLimiter against a brute-force reference that keeps every event and
+counts the ones inside each window by scanning them all.
+"""
+import random
+
+import pytest
+
+from window_limiter import SlidingWindowLimiter
+
+WINDOWS = {'short': (5, 10.0), 'long': (12, 60.0)}
+
+
+class NaiveLimiter:
+    def __init__(self, windows):
+        self.windows = windows
+        self.events = {name: [] for name in windows}
+
+    def count(self, name, now):
+        _, period = self.windows[name]
+        return sum(1 for t in self.events[name] if t > now - period)
+
+    def fits(self, names, now, n):
+        return all(self.count(name, now) + n <= self.windows[name][0] for name in names)
+
+    def next_allowed(self, names, now, n):
+        """Earliest time from `now` at which n more events fit, trying every expiry time"""
+        if any(n > self.windows[name][0] for name in names):
+            return float('inf')
+        candidates = [now] + sorted(
+            t + self.windows[name][1] for name in names for t in self.events[name] if t + self.windows[name][1] > now
+        )
+        return next(t for t in candidates if self.fits(names, t, n))
+
+    def record(self, names, now, n):
+        for name in names:
+            self.events[name].extend([now] * n)
+
+
+def _limiter():
+    limiter = SlidingWindowLimiter(clock=lambda: 0.0)
+    for name, (limit, period) in WINDOWS.items():
+        limiter.add_window(name, limit, period)
+    return limiter
+
+
+@pytest.mark.parametrize('seed', range(300))
+def test_matches_brute_force(seed):
+    rng = random.Random(seed)
+    limiter, reference = _limiter(), NaiveLimiter(WINDOWS)
+    now = 0.0
+    for _ in range(200):
+        # Ties are frequent (several events at one instant), as are jumps past a window.
+        # Times are multiples of 1/8 s so that t + period - period == t exactly
+        now += rng.choice([0, 0, rng.randint(0, 24), rng.randint(0, 160), 8 * rng.randint(0, 15)]) / 8
+        names = rng.choice([('short',), ('long',), ('short', 'long')])
+        n = rng.choice([0, 1, 1, 1, 2, 3, 6])
+
+        allowed_at, binding = limiter.next_allowed(names, now, n)
+        assert allowed_at == reference.next_allowed(names, now, n)
+        wait, _ = limiter.wait_time(names, now, n)
+        assert wait == allowed_at - now
+        if allowed_at > now:
+            assert binding in names
+            assert not reference.fits((binding,), now, n)
+        for name in WINDOWS:
+            assert limiter.count(name, now) == reference.count(name, now)
+            assert limiter.remaining(name, now) == WINDOWS[name][0] - reference.count(name, now)
+
+        # Events are only recorded once they fit, as AntiDetectionSafety does
+        if allowed_at <= now:
+            limiter.record(names, now, n)
+            reference.record(names, now, n)
+
+
+def test_oversized_request_never_fits():
+    assert _limiter().next_allowed(('short',), 0.0, WINDOWS['short'][0] + 1) == (float('inf'), 'short')
+
+
+def test_event_leaves_the_window_exactly_one_period_later():
+    limiter = _limiter()
+    limiter.record(('short',), 0.0, 5)
+    assert limiter.next_allowed(('short',), 3.0) == (10.0, 'short')
+    assert limiter.count('short', 9.999) == 5
+    assert limiter.count('short', 10.0) == 0